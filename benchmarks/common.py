@@ -0,0 +1,64 @@
+"""
+Shared helpers for the benchmarks: timers and synthetic terrain
+"""
+from timeit import default_timer
+
+import numpy as np
+
+from macro_viewshed_analysis.raster.grid import Grid
+
+
+def timed(func, *args, **kwargs):
+    """
+    :rtype: (object, float)
+    """
+    start = default_timer()
+    result = func(*args, **kwargs)
+    return result, default_timer() - start
+
+
+def synthetic_dem(rows, cols, islands=20, seed=0, max_height=1500.0, sea_floor=-2000.0):
+    """
+    An archipelago: gaussian hills of random size and height rising out of a sloping sea floor
+
+    :type rows: int
+    :type cols: int
+    :type islands: int
+    :type seed: int
+    :type max_height: float
+    :type sea_floor: float
+    :rtype: numpy.ndarray
+    """
+    random = np.random.RandomState(seed)
+    r, c = np.mgrid[0:rows, 0:cols].astype(np.float64)
+    dem = np.full((rows, cols), sea_floor) + (r / rows) * sea_floor * -0.25
+    for _ in range(islands):
+        centre_r, centre_c = random.uniform(0, rows), random.uniform(0, cols)
+        spread = random.uniform(0.01, 0.06) * min(rows, cols)
+        height = random.uniform(0.2, 1.0) * (max_height - sea_floor)
+        dem += height * np.exp(-((r - centre_r) ** 2 + (c - centre_c) ** 2) / (2 * spread ** 2))
+    dem += random.normal(0, 5.0, dem.shape)
+    return dem.astype(np.float32)
+
+
+def synthetic_grid(rows, cols, islands=20, seed=0, cell_size=1000.0):
+    """
+    :rtype: macro_viewshed_analysis.raster.grid.Grid
+    """
+    return Grid(synthetic_dem(rows, cols, islands, seed), 0.0, rows * cell_size, cell_size)
+
+
+def synthetic_observers(grid, count, sea_level=0.0, seed=0):
+    """
+    Observers on random land cells, numbered like the OBSERVER field
+
+    :type grid: macro_viewshed_analysis.raster.grid.Grid
+    :type count: int
+    :rtype: list[(float, float, float, int)]
+    """
+    random = np.random.RandomState(seed)
+    rows, cols = np.nonzero(np.asarray(grid.data) > sea_level)
+    picks = random.choice(len(rows), size=min(count, len(rows)), replace=False)
+    xs, ys = grid.cell_centre(rows[picks], cols[picks])
+    return [(float(x), float(y), float(grid.data[r, c]), observer)
+            for observer, (x, y, r, c) in enumerate(zip(xs, ys, rows[picks], cols[picks]))]
@@ -0,0 +1,95 @@
+"""
+Writing and reading the island network as a gpickle, an edgelist and the columnar format, on a synthetic
+graph with per-origin traversal counts like the ABM's traversal_path graphs.
+
+    python -m benchmarks.graph_format --edges 1000000
+"""
+import os
+import pickle
+import shutil
+import tempfile
+
+import click
+import networkx as nx
+import numpy as np
+
+from benchmarks.common import timed
+from macro_viewshed_analysis.graph.columnar import GraphColumns, load_graph, write_graph
+
+ORIGINS = ('north', 'south', 'taiwan', 'palawan')
+
+
+def synthetic_traversal_graph(edges, islands, origins_per_edge=2, seed=0):
+    """
+    :type edges: int
+    :type islands: int
+    :param origins_per_edge: How many origin runs each edge has traversal counts for
+    :type origins_per_edge: int
+    :rtype: networkx.DiGraph
+    """
+    random = np.random.RandomState(seed)
+    a = random.randint(0, islands, edges).tolist()
+    b = random.randint(0, islands, edges).tolist()
+    xy = random.uniform(0, 1e6, (edges, 4)).tolist()
+    area = random.uniform(1e3, 1e7, edges).tolist()
+    counts = random.randint(0, 1000, (edges, origins_per_edge, 3)).tolist()
+    keys = ['{}_{}'.format(origin, run) for origin in ORIGINS for run in range(3)]
+    picks = random.randint(0, len(keys), (edges, origins_per_edge)).tolist()
+    d = nx.DiGraph()
+    for i in range(edges):
+        data = {'area': area[i], 'a': tuple(xy[i][:2]), 'b': tuple(xy[i][2:])}
+        for k, (traversals, path, tree) in zip(picks[i], counts[i]):
+            data[keys[k]] = {'traversals': traversals, 'path': path, 'tree': tree}
+        d.add_edge(a[i], b[i], **data)
+    return d
+
+
+def write_gpickle(graph, path):
+    with open(path, 'wb') as f:
+        pickle.dump(graph, f, pickle.HIGHEST_PROTOCOL)
+
+
+def read_gpickle(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def size_of(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def read_one_column(path):
+    columns = GraphColumns(path)
+    return float(np.sum(columns.edges.column('area')))
+
+
+@click.command()
+@click.option('--edges', default=1000000, type=int)
+@click.option('--islands', default=20000, type=int)
+def benchmark(edges, islands):
+    graph = synthetic_traversal_graph(edges, islands)
+    click.echo('{} edges over {} islands'.format(graph.number_of_edges(), graph.number_of_nodes()))
+
+    folder = tempfile.mkdtemp()
+    try:
+        formats = [
+            ('gpickle', 'graph.gpickle', write_gpickle, read_gpickle),
+            ('edgelist (area only)', 'graph.edgelist', lambda g, p: nx.write_edgelist(g, p, data=['area']),
+             lambda p: nx.read_edgelist(p, create_using=nx.DiGraph(), nodetype=int, data=(('area', float),))),
+            ('columnar', 'graph.graph', write_graph, load_graph),
+            ('columnar, one column', 'graph.graph', None, read_one_column),
+        ]
+        for name, filename, write, read in formats:
+            path = os.path.join(folder, filename)
+            written = timed(write, graph, path)[1] if write is not None else 0.0
+            _, elapsed = timed(read, path)
+            click.echo('{:<22} write {:>7.2f}s  read {:>7.2f}s  {:>8.1f} MB'.format(
+                name, written, elapsed, size_of(path) / 1e6))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,82 @@
+"""
+Building the network from a preloaded index versus one centroid query per edge end.
+
+The per-edge queries are emulated with a linear scan of the rows, which is what a WHERE clause on an
+unindexed shapefile costs. Scanning for every edge of a 10^6 row table takes hours, so it is timed on a sample
+of edges and extrapolated.
+
+    python -m benchmarks.network --rows 1000000
+"""
+import os
+import shutil
+import tempfile
+
+import click
+import numpy as np
+
+from benchmarks.common import timed
+from macro_viewshed_analysis.graph.builder import build_network_from_rows
+from macro_viewshed_analysis.graph.rows import csv_rows, npz_rows, write_csv_rows, write_npz_rows
+
+
+def synthetic_viewshed_rows(rows, islands, pairs, seed=0):
+    """
+    :type rows: int
+    :type islands: int
+    :param pairs: How many distinct (island_a, island_b) pairs the rows are spread over
+    :type pairs: int
+    :rtype: list[(int, int, (float, float), float)]
+    """
+    random = np.random.RandomState(seed)
+    a = random.randint(0, islands, pairs)
+    b = random.randint(0, islands, pairs)
+    a, b = np.concatenate([a, b]), np.concatenate([b, a])
+    pick = random.randint(0, len(a), rows)
+    x, y = random.uniform(0, 1e6, rows), random.uniform(0, 1e6, rows)
+    area = random.uniform(1e3, 1e7, rows)
+    return list(zip(a[pick].tolist(), b[pick].tolist(), zip(x.tolist(), y.tolist()), area.tolist()))
+
+
+def scan_for_centroid(rows, island_a_id, island_b_id):
+    for a, b, centroid, _ in rows:
+        if a == island_a_id and b == island_b_id:
+            return centroid
+
+
+def query_edge_ends(rows, edges):
+    return [(scan_for_centroid(rows, b, a), scan_for_centroid(rows, a, b)) for (a, b) in edges]
+
+
+@click.command()
+@click.option('--rows', default=1000000, type=int)
+@click.option('--islands', default=2000, type=int)
+@click.option('--pairs', default=50000, type=int)
+@click.option('--sample', default=20, type=int, help='Edges to time the per-edge queries on')
+def benchmark(rows, islands, pairs, sample):
+    table = synthetic_viewshed_rows(rows, islands, pairs)
+    click.echo('{} rows over {} islands'.format(len(table), islands))
+
+    graph, indexed = timed(build_network_from_rows, table)
+    click.echo('preloaded index: {:.2f}s for {} edges'.format(indexed, graph.number_of_edges()))
+
+    edges = list(graph.edges())[:sample]
+    _, scanned = timed(query_edge_ends, table, edges)
+    per_edge = scanned / len(edges)
+    estimate = per_edge * graph.number_of_edges()
+    click.echo('per-edge queries: {:.4f}s per edge, ~{:.0f}s estimated for every edge ({:.0f}x slower)'.format(
+        per_edge, estimate, estimate / indexed))
+
+    folder = tempfile.mkdtemp()
+    try:
+        for name, write, read in [('csv', write_csv_rows, csv_rows), ('npz', write_npz_rows, npz_rows)]:
+            path = os.path.join(folder, 'viewsheds.{}'.format(name))
+            write(table, path)
+            _, elapsed = timed(build_network_from_rows, read(path))
+            click.echo('{} export: {:.2f}s including the read ({:.1f} MB)'.format(
+                name, elapsed, os.path.getsize(path) / 1e6))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    benchmark()
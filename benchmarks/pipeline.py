@@ -0,0 +1,200 @@
+"""
+Every stage of the analysis on a synthetic archipelago, through the local backend so no arcpy is needed: island
+labelling, splitting the coastal band into zones, viewpoint selection, line of sight, run extraction, the observer
+index, polygon rings, the visibility matrix and the network.
+
+Stages are timed with macro_viewshed_analysis.profiling and each run is appended to a JSON lines history file
+along with its parameters and commit. The last run with the same parameters is printed alongside, so a change
+that slows a stage down shows up as a change in its numbers.
+
+    python -m benchmarks.pipeline --rows 400 --cols 400 --islands 40 --sea-level 0 --sea-level -100
+"""
+import json
+import shutil
+import subprocess
+import tempfile
+from datetime import datetime
+from os import devnull
+from os.path import dirname, exists, join
+
+import click
+import numpy as np
+
+from benchmarks.common import synthetic_grid
+from macro_viewshed_analysis import profiling
+from macro_viewshed_analysis.backends.local import LocalBackend
+from macro_viewshed_analysis.backends.pipeline import find_viewpoints, index_viewsheds, run_viewsheds, \
+    visibility_matrix
+from macro_viewshed_analysis.config import OBSERVER_GROUP_SIZE, SaveLocations as S
+from macro_viewshed_analysis.graph.builder import build_network_from_rows
+from macro_viewshed_analysis.raster.bitmask import band_rows_for, grid_bands, grid_header
+from macro_viewshed_analysis.raster.grid import load_grid
+from macro_viewshed_analysis.raster.islands import MAX_LABEL_CELLS, label_sea_levels
+from macro_viewshed_analysis.raster.polygonize import index_polygon_records
+from macro_viewshed_analysis.raster.zones import grid_labels, split_zones
+
+HISTORY = join(dirname(__file__), 'history.jsonl')
+
+
+def run_stages(dem, sea_levels, workspace, distance_to_shore, grid_size):
+    """
+    :type dem: macro_viewshed_analysis.raster.grid.Grid
+    :type sea_levels: list[float]
+    :type workspace: str
+    :param distance_to_shore: Width of the coastal band in meters
+    :type distance_to_shore: float
+    :param grid_size: Width and height of the grid cells in meters
+    :type grid_size: float
+    :return: What each stage took, summed over the sea levels
+    :rtype: macro_viewshed_analysis.profiling.Profiler
+    """
+    profiling.disable()
+    profiler = profiling.enable()
+    backend = LocalBackend()
+    try:
+        with profiling.timer('islands') as timer:
+            bands = grid_bands(np.asarray(dem.data, dtype=np.float64), band_rows_for(dem.shape[1], MAX_LABEL_CELLS))
+            island_paths = label_sea_levels(bands, grid_header(dem), sea_levels, workspace)
+            timer.rows = dem.shape[0] * dem.shape[1] * len(sea_levels)
+
+        for sea_level in sea_levels:
+            level_workspace = join(workspace, 'sl_{}'.format(sea_level))
+            islands = load_grid(island_paths[sea_level])
+            labels = grid_labels(islands)
+
+            with profiling.timer('zones') as timer:
+                zones, _, zone_grid = split_zones(labels, islands, distance_to_shore, grid_size, grid_size)
+                timer.rows = zones.size
+            with profiling.timer('viewpoints') as timer:
+                viewpoints = find_viewpoints(backend, dem, zones, labels, level_workspace, zone_grid)
+                timer.rows = backend.count(viewpoints)
+            with profiling.timer('viewsheds') as timer:
+                runs_paths = run_viewsheds(backend, viewpoints, dem, sea_level, level_workspace, True)
+                timer.rows = backend.count(viewpoints)
+            with profiling.timer('observer index') as timer:
+                index = index_viewsheds(backend, viewpoints, level_workspace, runs_paths, True)
+                timer.rows = backend.count(viewpoints)
+            with profiling.timer('polygons') as timer:
+                for rings, _, _, _, _ in index_polygon_records(index):
+                    timer.rows += len(rings)
+            with profiling.timer('visibility matrix') as timer:
+                matrix = visibility_matrix(
+                    index, islands, join(level_workspace, S.FOLDER_VIEWSHEDS, S.VISIBILITY_MATRIX))
+                timer.rows = len(matrix)
+            index.close()
+            with profiling.timer('network') as timer:
+                timer.rows = build_network_from_rows(matrix.rows()).number_of_edges()
+    finally:
+        profiling.disable()
+    return profiler
+
+
+def current_commit():
+    """
+    :return: The short hash of the checked out commit, None outside a git checkout
+    :rtype: str
+    """
+    try:
+        with open(devnull, 'w') as null:
+            return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=dirname(__file__),
+                                           stderr=null).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def history_record(profiler, params, note=None):
+    """
+    :type profiler: macro_viewshed_analysis.profiling.Profiler
+    :type params: dict
+    :type note: str
+    :rtype: dict
+    """
+    return {
+        'date': datetime.now().isoformat(),
+        'commit': current_commit(),
+        'note': note,
+        'params': params,
+        'wall_seconds': profiler.wall_seconds(),
+        'stages': dict((r['name'], dict((k, v) for k, v in r.items() if k != 'name')) for r in profiler.records()),
+    }
+
+
+def read_history(path):
+    """
+    :type path: str
+    :rtype: list[dict]
+    """
+    if not exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def append_history(path, record):
+    with open(path, 'a') as f:
+        f.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+def last_matching(history, params):
+    """
+    :return: The most recent record run with the same params, None if there isn't one
+    :rtype: dict
+    """
+    for record in reversed(history):
+        if record['params'] == params:
+            return record
+    return None
+
+
+def compare(record, previous):
+    """
+    :return: One line per stage, with the previous run's seconds and the ratio if there was one
+    :rtype: list[str]
+    """
+    lines = []
+    for name, stat in record['stages'].items():
+        line = '{:<20} {:>8.3f}s {:>8} calls {:>10} rows'.format(name, stat['seconds'], stat['calls'], stat['rows'])
+        before = (previous or {}).get('stages', {}).get(name)
+        if before and before['seconds']:
+            line += '  was {:.3f}s ({:.2f}x)'.format(before['seconds'], stat['seconds'] / before['seconds'])
+        lines.append(line)
+    return lines
+
+
+@click.command()
+@click.option('--rows', default=400, type=int)
+@click.option('--cols', default=400, type=int)
+@click.option('--cell-size', default=1000.0, type=float, help='Meters')
+@click.option('--islands', default=40, type=int)
+@click.option('--seed', default=0, type=int)
+@click.option('--sea-level', 'sea_levels', multiple=True, default=(0.0, -100.0), type=float)
+@click.option('--distance-to-shore', default=5000.0, type=float, help='Meters')
+@click.option('--grid-size', default=20000.0, type=float, help='Meters')
+@click.option('--history', default=HISTORY, type=click.Path(dir_okay=False), help='JSON lines file to append to')
+@click.option('--note', default=None, type=str, help='Saved with the run, e.g. what changed')
+@click.option('--keep', default=None, type=click.Path(file_okay=False), help='Keep the outputs in this folder')
+def benchmark(rows, cols, cell_size, islands, seed, sea_levels, distance_to_shore, grid_size, history, note, keep):
+    params = dict(rows=rows, cols=cols, cell_size=cell_size, islands=islands, seed=seed,
+                  sea_levels=sorted(sea_levels, reverse=True), distance_to_shore=distance_to_shore,
+                  grid_size=grid_size, observer_group_size=OBSERVER_GROUP_SIZE)
+    dem = synthetic_grid(rows, cols, islands, seed, cell_size)
+    click.echo('grid: {} x {}, {} islands, sea levels {}'.format(rows, cols, islands, params['sea_levels']))
+
+    workspace = keep or tempfile.mkdtemp()
+    try:
+        profiler = run_stages(dem, params['sea_levels'], workspace, distance_to_shore, grid_size)
+    finally:
+        if keep is None:
+            shutil.rmtree(workspace)
+
+    record = history_record(profiler, params, note)
+    previous = last_matching(read_history(history), params)
+    for line in compare(record, previous):
+        click.echo(line)
+    click.echo('{:.2f}s wall time{}'.format(record['wall_seconds'], '' if previous is None else
+                                            ', was {:.2f}s at {}'.format(previous['wall_seconds'], previous['commit'])))
+    append_history(history, record)
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,46 @@
+"""
+Writing the network's edges to a shapefile with the pure writer, in batches from coordinate arrays.
+
+    python -m benchmarks.polylines --edges 1000000
+"""
+import os
+import shutil
+import tempfile
+
+import click
+import numpy as np
+
+from benchmarks.common import timed
+from macro_viewshed_analysis.storage.shapefile import ShapefilePolylineWriter, line_wkb
+
+FIELDS = [('island_A', 'LONG'), ('island_B', 'LONG'), ('A_sees_B', 'DOUBLE')]
+
+
+def write_shapefile(path, ends, attributes, batch):
+    with ShapefilePolylineWriter(path, FIELDS) as writer:
+        for start in range(0, len(ends), batch):
+            writer.write(ends[start:start + batch], [a[start:start + batch] for a in attributes])
+
+
+@click.command()
+@click.option('--edges', default=1000000, type=int)
+@click.option('--batch', default=100000, type=int, help='Edges per write, as procedures.polylines.BATCH_EDGES')
+def benchmark(edges, batch):
+    random = np.random.RandomState(0)
+    ends = random.uniform(0, 1e6, (edges, 4))
+    attributes = [random.randint(0, 20000, edges), random.randint(0, 20000, edges), random.uniform(1e3, 1e7, edges)]
+
+    folder = tempfile.mkdtemp()
+    try:
+        path = os.path.join(folder, 'network.shp')
+        _, elapsed = timed(write_shapefile, path, ends, attributes, batch)
+        size = sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder))
+        click.echo('shapefile: {} edges in {:.2f}s ({:.1f} MB)'.format(edges, elapsed, size / 1e6))
+        _, elapsed = timed(line_wkb, ends)
+        click.echo('wkb for the arcpy writer: {:.2f}s'.format(elapsed))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    benchmark()
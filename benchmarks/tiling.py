@@ -0,0 +1,69 @@
+"""
+Surface read and time per observer group, with groups in FID order over the whole surface against groups along a
+space filling curve clipped to the outer radius.
+
+    python -m benchmarks.tiling --rows 600 --cols 600 --observers 256 --radius 40000
+"""
+import click
+import numpy as np
+
+from benchmarks.common import timed, synthetic_grid, synthetic_observers
+from macro_viewshed_analysis.config import OBSERVER_GROUP_SIZE
+from macro_viewshed_analysis.raster.bitmask import grid_header
+from macro_viewshed_analysis.raster.los import viewshed_bitmask, sea_level_surface
+from macro_viewshed_analysis.raster.tiling import CURVES, observer_window, spatial_order, window_cells
+
+
+def run_groups(surface_grid, observers, order, radius, clip):
+    """
+    :return: (bytes read, seconds) per group
+    :rtype: list[(int, float)]
+    """
+    header = grid_header(surface_grid)
+    cell_bytes = np.dtype(np.float64).itemsize  # viewshed_bitmask reads the surface as float64
+    stats = []
+    for start in range(0, len(order), OBSERVER_GROUP_SIZE):
+        group = [observers[i][:3] + (observer,) for observer, i in enumerate(order[start:start + OBSERVER_GROUP_SIZE])]
+        surface = surface_grid
+        if clip:
+            x, y = [o[0] for o in group], [o[1] for o in group]
+            window = observer_window(header, x, y, radius)
+            surface = surface_grid.window(*window)
+            read = window_cells(window) * cell_bytes
+        else:
+            read = surface_grid.shape[0] * surface_grid.shape[1] * cell_bytes
+        _, seconds = timed(viewshed_bitmask, surface, group, max_radius=radius)
+        stats.append((read, seconds))
+    return stats
+
+
+def summarise(name, stats):
+    read, seconds = np.array([s[0] for s in stats], dtype=float), np.array([s[1] for s in stats])
+    click.echo('{:<22} {:>4} groups  {:>8.2f} MB/group  {:>7.3f} s/group  {:>7.2f}s total'.format(
+        name, len(stats), read.mean() / 1e6, seconds.mean(), seconds.sum()))
+
+
+@click.command()
+@click.option('--rows', default=600, type=int)
+@click.option('--cols', default=600, type=int)
+@click.option('--cell-size', default=1000.0, type=float)
+@click.option('--islands', default=60, type=int)
+@click.option('--observers', 'observer_count', default=256, type=int)
+@click.option('--radius', default=40000.0, type=float, help='Outer radius in meters')
+@click.option('--curve', default='hilbert', type=click.Choice(sorted(CURVES)))
+def benchmark(rows, cols, cell_size, islands, observer_count, radius, curve):
+    dem = synthetic_grid(rows, cols, islands, cell_size=cell_size)
+    surface_grid = dem.like(sea_level_surface(dem.data, 0.0))
+    observers = synthetic_observers(surface_grid, observer_count)
+    x, y = np.array([o[0] for o in observers]), np.array([o[1] for o in observers])
+
+    click.echo('grid: {} x {}, observers: {}, radius: {:.0f} m'.format(rows, cols, len(observers), radius))
+    fid_order = np.arange(len(observers))
+    summarise('fid order, whole grid', run_groups(surface_grid, observers, fid_order, radius, False))
+    summarise('fid order, clipped', run_groups(surface_grid, observers, fid_order, radius, True))
+    curve_order = spatial_order(x, y, curve)
+    summarise('{}, clipped'.format(curve), run_groups(surface_grid, observers, curve_order, radius, True))
+
+
+if __name__ == '__main__':
+    benchmark()
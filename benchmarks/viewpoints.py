@@ -0,0 +1,90 @@
+"""
+Highest point per split island: the per-vertex Python loop in get_highest_points_from_multipoint_features
+against the grouped argmax in raster.zonal.
+
+    python -m benchmarks.viewpoints --points 5000000 --splits 20000
+"""
+from collections import namedtuple
+
+import click
+import numpy as np
+
+from benchmarks.common import timed
+from macro_viewshed_analysis.raster.zonal import highest_points
+
+Point = namedtuple('Point', ['X', 'Y', 'Z'])
+
+
+def synthetic_multipoints(points, splits, points_per_row, seed=0):
+    """
+    Vertex arrays as an Intersect of multipoints with split islands would produce: each multipoint row belongs
+    to one split and holds `points_per_row` vertices.
+
+    :rtype: dict[str, numpy.ndarray]
+    """
+    random = np.random.RandomState(seed)
+    row = np.arange(points) // points_per_row
+    split = random.randint(0, splits, row[-1] + 1)[row]
+    return {
+        'x': random.uniform(0, 1e5, points),
+        'y': random.uniform(0, 1e5, points),
+        'z': np.rint(random.uniform(0, 3000, points)),
+        'island': row,
+        'split': split,
+        'grid': split // 10,
+    }
+
+
+def multipoint_rows(arrays, points_per_row):
+    """
+    What the search cursor hands the loop: one list of vertex objects per multipoint row
+
+    :rtype: collections.Iterable[(list[Point], int, int, int)]
+    """
+    x, y, z = arrays['x'].tolist(), arrays['y'].tolist(), arrays['z'].tolist()
+    for start in range(0, len(z), points_per_row):
+        end = start + points_per_row
+        vertices = [Point(*p) for p in zip(x[start:end], y[start:end], z[start:end])]
+        yield vertices, int(arrays['island'][start]), int(arrays['split'][start]), int(arrays['grid'][start])
+
+
+def python_loop(rows):
+    highest = {}
+    for i, (view_points, island, split, grid) in enumerate(rows):
+        candidate_point = highest.get(split, (None,))[0]
+        for point in view_points:
+            if candidate_point is None:
+                candidate_point = point
+            else:
+                if point.Z > candidate_point.Z:
+                    candidate_point = point
+        highest[split] = (candidate_point, candidate_point.Z, island, split, grid)
+    return highest
+
+
+def numpy_grouped(arrays, chunk_size):
+    a = arrays
+    return highest_points(a['x'], a['y'], a['z'], a['island'], a['split'], a['grid'], chunk_size)
+
+
+@click.command()
+@click.option('--points', default=2000000, type=int)
+@click.option('--splits', default=20000, type=int)
+@click.option('--points-per-row', default=500, type=int)
+@click.option('--chunk-size', default=250000, type=int)
+def benchmark(points, splits, points_per_row, chunk_size):
+    arrays = synthetic_multipoints(points, splits, points_per_row)
+    click.echo('{} points in {} multipoints over {} splits'.format(points, points // points_per_row, splits))
+
+    looped, loop_time = timed(python_loop, multipoint_rows(arrays, points_per_row))
+    click.echo('python loop (including building the vertex objects): {:.2f}s'.format(loop_time))
+    for size in (None, chunk_size):
+        grouped, elapsed = timed(numpy_grouped, arrays, size)
+        same = dict((split, z) for (_, z, _, split, _) in grouped.rows()) == \
+            dict((split, v[1]) for split, v in looped.items())
+        click.echo('grouped argmax (chunk size {}): {:.2f}s, {:.0f}x faster, same heights: {}'.format(
+            size or 'all', elapsed, loop_time / elapsed, same))
+
+
+if __name__ == '__main__':
+    benchmark()
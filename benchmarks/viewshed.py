@@ -0,0 +1,124 @@
+"""
+Throughput and agreement of the NumPy viewshed engine against a reference bitmask.
+
+With no reference given, the reference is an exhaustive R3 line of sight computed here on a synthetic
+archipelago, so keep the grid small. To compare against Viewshed2_3d, export its raster and the sea level
+surface with utils.raster_to_grid + save_grid, and the observers as x,y,z,observer CSV rows.
+
+    python -m benchmarks.viewshed --rows 120 --cols 120 --observers 32
+"""
+import csv
+
+import click
+import numpy as np
+
+from benchmarks.common import timed, synthetic_grid, synthetic_observers
+from macro_viewshed_analysis.config import ViewshedParameters as V
+from macro_viewshed_analysis.raster.grid import load_grid
+from macro_viewshed_analysis.raster.los import viewshed_bitmask, sea_level_surface, EARTH_DIAMETER
+
+
+def reference_visibility(surface_grid, observers, observer_offset, max_radius, refractivity):
+    """
+    R3: every cell gets its own sightline, checked against every cell it passes through
+
+    :rtype: numpy.ndarray
+    """
+    surface = np.asarray(surface_grid.data, dtype=np.float64)
+    rows, cols = surface.shape
+    bits = np.zeros(surface.shape, dtype=np.uint32)
+    target_rows, target_cols = [a.ravel() for a in np.mgrid[0:rows, 0:cols]]
+    for x, y, z, observer in observers:
+        row, col = [int(a) for a in surface_grid.cell_index(x, y)]
+        cell_dx, cell_dy = surface_grid.cell_size_meters(row)
+        eye = z + observer_offset
+        d_rows, d_cols = target_rows - row, target_cols - col
+        steps = np.maximum(np.maximum(np.abs(d_rows), np.abs(d_cols)), 1)
+        t = np.arange(1, int(steps.max()) + 1)
+        fraction = np.minimum(t[np.newaxis, :] / steps[:, np.newaxis].astype(float), 1.0)
+        sample_rows = row + np.rint(d_rows[:, np.newaxis] * fraction).astype(np.int64)
+        sample_cols = col + np.rint(d_cols[:, np.newaxis] * fraction).astype(np.int64)
+        distance = np.hypot((sample_rows - row) * cell_dy, (sample_cols - col) * cell_dx)
+        at_observer = distance == 0
+        distance[at_observer] = 1.0
+        angle = (surface[sample_rows, sample_cols] - distance ** 2 * (1.0 - refractivity) / EARTH_DIAMETER
+                 - eye) / distance
+        angle[at_observer] = -np.inf
+        before_target = t[np.newaxis, :] < steps[:, np.newaxis]
+        blocking = np.where(before_target, angle, -np.inf).max(axis=1)
+        target_angle = angle[np.arange(len(steps)), steps - 1]
+        in_range = np.hypot(d_rows * cell_dy, d_cols * cell_dx) <= max_radius
+        visible = (target_angle >= blocking) & in_range
+        visible[(d_rows == 0) & (d_cols == 0)] = True
+        bits |= visible.reshape(surface.shape).astype(np.uint32) << np.uint32(observer)
+    return bits.view(np.int32)
+
+
+def agreement(result, reference, observers):
+    """
+    :rtype: dict
+    """
+    result = result.view(np.uint32)
+    reference = reference.view(np.uint32)
+    stats = {'agreement': [], 'false_visible': [], 'false_hidden': []}
+    for (_, _, _, observer) in observers:
+        mask = np.uint32(1) << np.uint32(observer)
+        ours, theirs = (result & mask) > 0, (reference & mask) > 0
+        stats['agreement'].append(np.mean(ours == theirs))
+        stats['false_visible'].append(np.mean(ours & ~theirs))
+        stats['false_hidden'].append(np.mean(~ours & theirs))
+    return dict((k, float(np.mean(v))) for k, v in stats.items())
+
+
+def read_observers(path):
+    with open(path) as f:
+        return [(float(x), float(y), float(z), int(observer)) for (x, y, z, observer) in csv.reader(f)]
+
+
+@click.command()
+@click.option('--rows', default=120, type=int)
+@click.option('--cols', default=120, type=int)
+@click.option('--cell-size', default=1000.0, type=float)
+@click.option('--islands', default=12, type=int)
+@click.option('--observers', 'observer_count', default=32, type=click.IntRange(1, 32))
+@click.option('--sea-level', default=0.0, type=float)
+@click.option('--repeat', default=3, type=int)
+@click.option('--surface', default=None, type=click.Path(), help='Saved sea level surface grid')
+@click.option('--reference', default=None, type=click.Path(), help='Saved reference bitmask grid')
+@click.option('--observer-csv', default=None, type=click.Path(exists=True))
+def benchmark(rows, cols, cell_size, islands, observer_count, sea_level, repeat, surface, reference, observer_csv):
+    offset = float(V.OBSERVER_OFFSET_METERS)
+    radius = float(V.OUTER_RADIUS_METERS)
+    refractivity = float(V.REFRACTIVITY_COEFFICIENT)
+
+    if surface is not None:
+        surface_grid = load_grid(surface)
+        observers = read_observers(observer_csv)
+    else:
+        dem = synthetic_grid(rows, cols, islands, cell_size=cell_size)
+        surface_grid = dem.like(sea_level_surface(dem.data, sea_level))
+        observers = synthetic_observers(surface_grid, observer_count, sea_level)
+
+    if reference is not None:
+        expected, reference_time = load_grid(reference).data, None
+    else:
+        expected, reference_time = timed(reference_visibility, surface_grid, observers, offset, radius, refractivity)
+
+    times = []
+    for _ in range(repeat):
+        result, elapsed = timed(viewshed_bitmask, surface_grid, observers)
+        times.append(elapsed)
+    best = min(times)
+
+    cells = surface_grid.shape[0] * surface_grid.shape[1]
+    click.echo('grid: {} x {}, observers: {}'.format(surface_grid.shape[0], surface_grid.shape[1], len(observers)))
+    click.echo('numpy engine: {:.3f}s best of {} ({:.1f} observers/s, {:.3g} observer-cells/s)'.format(
+        best, repeat, len(observers) / best, len(observers) * cells / best))
+    if reference_time is not None:
+        click.echo('R3 reference: {:.3f}s'.format(reference_time))
+    for k, v in sorted(agreement(result, expected, observers).items()):
+        click.echo('{}: {:.4%}'.format(k, v))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -4,6 +4,8 @@ from os.path import join, expanduser
 import arcpy
 import networkx as nx
 
+from macro_viewshed_analysis.graph.columnar import write_graph
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -123,7 +125,7 @@ if __name__ == '__main__':
                 #     d.node[island_a_id]['pos'] = {'x': island_a_x, 'y': island_a_y}
 
     print("Writing graph to file")
-    nx.write_gpickle(d, 'islands.gpickle')
+    write_graph(d, 'islands.graph')
     # nx.write_weighted_edgelist(d, 'islands.gml')
 
     # for (island_a_id, island_b_id, data) in d.edges_iter(data=True):
@@ -0,0 +1,143 @@
+"""
+Storage and geoprocessing backends.
+
+The pipeline reads and writes feature classes through cursors, creates them with their fields, and moves rasters in
+and out of numpy. A backend provides those operations over one kind of storage: 'arcpy' over anything ArcGIS can
+open, and 'local' over numpy files in a folder, which needs no licence and runs anywhere numpy does. Backends are
+imported when first asked for, so the local one never imports arcpy.
+
+Only backends.pipeline runs through a backend. It splits the islands into zones in the raster domain with
+raster.zones, the same way for every backend, so it needs no Buffer or Intersect. workflows.run_full_analysis still
+calls arcpy directly for those overlays and everything else, so it isn't headless yet.
+"""
+from importlib import import_module
+
+from macro_viewshed_analysis.config import AnalysisSettings as A
+
+BACKENDS = {
+    'arcpy': ('macro_viewshed_analysis.backends.arcpy_backend', 'ArcpyBackend'),
+    'local': ('macro_viewshed_analysis.backends.local', 'LocalBackend'),
+}
+
+
+class Backend(object):
+    """
+    The operations the pipeline needs from its storage. Tables are named by path; field names and geometry tokens
+    (SHAPE@XY, OID@ and so on) are those of arcpy.da cursors.
+    """
+
+    def search_cursor(self, table, fields, where_clause=None):
+        """
+        :type table: str
+        :type fields: list[str]
+        :param where_clause: Comparisons of fields with numbers, joined by AND
+        :type where_clause: str
+        :return: A context manager giving an iterable of row tuples
+        """
+        raise NotImplementedError
+
+    def insert_cursor(self, table, fields):
+        """
+        :type table: str
+        :type fields: list[str]
+        :return: A context manager giving an object with insertRow(row)
+        """
+        raise NotImplementedError
+
+    def create_feature_class(self, workspace, name, geometry_type, spatial_reference=None, fields=()):
+        """
+        :type workspace: str
+        :type name: str
+        :param geometry_type: 'POINT', 'POLYLINE' or 'POLYGON'
+        :type geometry_type: str
+        :param fields: (name, type) per field, type being an AddField_management field type
+        :type fields: collections.Iterable[(str, str)]
+        :return: Path of the new feature class
+        :rtype: str
+        """
+        raise NotImplementedError
+
+    def add_field(self, table, name, field_type):
+        """
+        :type table: str
+        :type name: str
+        :param field_type: 'LONG', 'SHORT', 'DOUBLE', 'FLOAT' or 'TEXT'
+        :type field_type: str
+        """
+        raise NotImplementedError
+
+    def field_names(self, table):
+        """
+        :type table: str
+        :rtype: list[str]
+        """
+        raise NotImplementedError
+
+    def add_field_delimiters(self, table, field):
+        """
+        :type table: str
+        :type field: str
+        :return: The field name quoted for a where clause on table
+        :rtype: str
+        """
+        raise NotImplementedError
+
+    def count(self, table):
+        """
+        :type table: str
+        :rtype: int
+        """
+        raise NotImplementedError
+
+    def exists(self, path):
+        """
+        :type path: str
+        :rtype: bool
+        """
+        raise NotImplementedError
+
+    def delete(self, path):
+        """
+        :type path: str
+        """
+        raise NotImplementedError
+
+    def read_raster(self, path):
+        """
+        :type path: str
+        :rtype: macro_viewshed_analysis.raster.grid.Grid
+        """
+        raise NotImplementedError
+
+    def write_raster(self, grid, path):
+        """
+        :type grid: macro_viewshed_analysis.raster.grid.Grid
+        :type path: str
+        :return: path
+        :rtype: str
+        """
+        raise NotImplementedError
+
+    def raster_header(self, path):
+        """
+        :type path: str
+        :return: Georeferencing and shape, see raster.bitmask.grid_header
+        :rtype: dict
+        """
+        raise NotImplementedError
+
+    def add_message(self, message):
+        """
+        :type message: str
+        """
+        raise NotImplementedError
+
+
+def get_backend(name=None):
+    """
+    :param name: One of BACKENDS, defaults to the BACKEND setting
+    :type name: str
+    :rtype: Backend
+    """
+    module, cls = BACKENDS[A.BACKEND if name is None else name]
+    return getattr(import_module(module), cls)()
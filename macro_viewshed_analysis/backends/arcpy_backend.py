@@ -0,0 +1,56 @@
+"""
+The backend over ArcGIS, for feature classes, shapefiles and rasters arcpy can open
+"""
+import arcpy
+
+from macro_viewshed_analysis.backends import Backend
+from macro_viewshed_analysis.utils import get_search_cursor, get_insert_cursor, get_field_names, raster_to_grid, \
+    grid_to_raster, raster_header
+
+
+class ArcpyBackend(Backend):
+    def search_cursor(self, table, fields, where_clause=None):
+        return get_search_cursor(table, fields, where_clause=where_clause)
+
+    def insert_cursor(self, table, fields):
+        return get_insert_cursor(table, fields)
+
+    def create_feature_class(self, workspace, name, geometry_type, spatial_reference=None, fields=()):
+        fc = arcpy.CreateFeatureclass_management(
+            workspace, name, geometry_type, spatial_reference=spatial_reference
+        ).getOutput(0)
+        for field, field_type in fields:
+            self.add_field(fc, field, field_type)
+        return fc
+
+    def add_field(self, table, name, field_type):
+        arcpy.AddField_management(table, name, field_type=field_type)
+
+    def field_names(self, table):
+        return get_field_names(table)
+
+    def add_field_delimiters(self, table, field):
+        return arcpy.AddFieldDelimiters(table, field)
+
+    def count(self, table):
+        return int(arcpy.GetCount_management(table).getOutput(0))
+
+    def exists(self, path):
+        return arcpy.Exists(path)
+
+    def delete(self, path):
+        arcpy.Delete_management(path)
+
+    def read_raster(self, path):
+        return raster_to_grid(path)
+
+    def write_raster(self, grid, path):
+        grid_to_raster(grid, path)
+        return path
+
+    def raster_header(self, path):
+        return raster_header(path)
+
+    def add_message(self, message):
+        arcpy.AddMessage(message)
+
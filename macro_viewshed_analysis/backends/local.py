@@ -0,0 +1,242 @@
+"""
+The backend over plain files, with no arcpy.
+
+A table is a numpy structured array saved as <path>.npy, one column per field, with a <path>.json schema beside it
+giving the geometry type, the spatial reference as WKT and the field types. Point geometry is kept as x, y and z
+columns. Rows are numbered from 0 in the order they were inserted, which is what OID@ gives. Rasters are grids saved
+with raster.grid.save_grid.
+
+There are no vector overlays here. The zones Buffer and Intersect build for viewpoints are made in the raster
+domain instead (raster.zones), from the island mask and the DEM's own cell grid.
+"""
+import json
+import logging
+import operator
+import os
+import re
+from contextlib import contextmanager
+from os.path import exists, getsize, join, splitext
+
+import numpy as np
+
+from macro_viewshed_analysis import profiling
+from macro_viewshed_analysis.backends import Backend
+from macro_viewshed_analysis.config import TableNames as T
+from macro_viewshed_analysis.raster.bitmask import grid_header
+from macro_viewshed_analysis.raster.grid import grid_paths, load_grid, save_grid
+
+logger = logging.getLogger(__name__)
+
+FIELD_DTYPES = {
+    'SHORT': np.int16,
+    'LONG': np.int32,
+    'INTEGER': np.int32,
+    'FLOAT': np.float32,
+    'DOUBLE': np.float64,
+    'TEXT': 'U254',
+}
+
+# Point geometry columns, prefixed so they can't clash with a field
+X, Y, Z = '@x', '@y', '@z'
+
+OPERATORS = {
+    '=': operator.eq,
+    '<>': operator.ne,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+_COMPARISON = re.compile(r'^\s*"?(\w+)"?\s*(<>|!=|<=|>=|=|<|>)\s*(-?[\d.]+(?:[eE]-?\d+)?)\s*$')
+
+
+def table_paths(path):
+    """
+    :type path: str
+    :return: The array and schema files of a table
+    :rtype: (str, str)
+    """
+    return grid_paths(splitext(path)[0])
+
+
+def where_mask(table, where_clause):
+    """
+    Evaluate a where clause of field/number comparisons joined by AND, the only kind the pipeline writes
+
+    :type table: numpy.ndarray
+    :type where_clause: str
+    :rtype: numpy.ndarray
+    """
+    mask = np.ones(len(table), dtype=bool)
+    if not where_clause:
+        return mask
+    for term in re.split(r'\s+AND\s+', where_clause.strip(), flags=re.IGNORECASE):
+        match = _COMPARISON.match(term)
+        if match is None:
+            raise ValueError('Unsupported where clause: {}'.format(where_clause))
+        field, op, value = match.groups()
+        mask &= OPERATORS[op](table[field], float(value))
+    return mask
+
+
+class LocalTable(object):
+    def __init__(self, schema, rows):
+        """
+        :param schema: geometry_type, spatial_reference and fields ([name, type] per field)
+        :type schema: dict
+        :type rows: numpy.ndarray
+        """
+        self.schema = schema
+        self.rows = rows
+
+    @property
+    def dtype(self):
+        columns = [(X, np.float64), (Y, np.float64), (Z, np.float64)] if self.schema['geometry_type'] else []
+        return np.dtype(columns + [(name, FIELD_DTYPES[field_type]) for name, field_type in self.schema['fields']])
+
+    @staticmethod
+    def column(field, rows, ids):
+        """
+        :param field: A field name or cursor token
+        :type field: str
+        :type rows: numpy.ndarray
+        :param ids: Row numbers of rows
+        :type ids: numpy.ndarray
+        :rtype: list
+        """
+        if field == T.ID:
+            return ids.tolist()
+        if field in (T.XY, T.SHAPE):
+            return list(zip(rows[X].tolist(), rows[Y].tolist()))
+        if field == T.XYZ:
+            return list(zip(rows[X].tolist(), rows[Y].tolist(), rows[Z].tolist()))
+        return rows[{T.X: X, T.Y: Y, T.SHAPE_Z: Z}.get(field, field)].tolist()
+
+    def record(self, fields, row):
+        """
+        :type fields: list[str]
+        :param row: Values in the order of fields, a point being (x, y) or (x, y, z)
+        :rtype: tuple
+        """
+        values = dict((name, 0) for name in self.dtype.names)
+        for field, value in zip(fields, row):
+            if field in (T.XY, T.XYZ, T.SHAPE):
+                point = tuple(value) + (0.0,) * (3 - len(value))
+                values[X], values[Y], values[Z] = point[:3]
+            elif field == T.SHAPE_Z:
+                values[Z] = value
+            elif field != T.ID:
+                values[field] = value
+        return tuple(values[name] for name in self.dtype.names)
+
+
+class _InsertCursor(object):
+    def __init__(self, backend, path, table, fields):
+        self.backend = backend
+        self.path = path
+        self.table = table
+        self.fields = fields
+        self.records = []
+
+    def insertRow(self, row):
+        self.records.append(self.table.record(self.fields, row))
+
+    def flush(self):
+        with profiling.timer('insert cursor flush') as t:
+            added = np.array(self.records, dtype=self.table.dtype)
+            self.table.rows = np.concatenate([self.table.rows, added]) if len(self.table.rows) else added
+            self.backend.save_table(self.path, self.table)
+            t.rows, t.bytes_written = len(added), getsize(table_paths(self.path)[0])
+        self.records = []
+
+
+class LocalBackend(Backend):
+    def load_table(self, path):
+        """
+        :type path: str
+        :rtype: LocalTable
+        """
+        array_path, schema_path = table_paths(path)
+        with open(schema_path) as f:
+            schema = json.load(f)
+        return LocalTable(schema, np.load(array_path))
+
+    def save_table(self, path, table):
+        """
+        :type path: str
+        :type table: LocalTable
+        """
+        array_path, schema_path = table_paths(path)
+        np.save(array_path, np.asarray(table.rows, dtype=table.dtype))
+        with open(schema_path, 'w') as f:
+            json.dump(table.schema, f)
+
+    @contextmanager
+    def search_cursor(self, table, fields, where_clause=None):
+        rows = self.load_table(table).rows
+        ids = np.flatnonzero(where_mask(rows, where_clause))
+        yield zip(*[LocalTable.column(field, rows[ids], ids) for field in fields])
+
+    @contextmanager
+    def insert_cursor(self, table, fields):
+        cursor = _InsertCursor(self, table, self.load_table(table), fields)
+        try:
+            yield cursor
+        finally:
+            cursor.flush()
+
+    def create_feature_class(self, workspace, name, geometry_type, spatial_reference=None, fields=()):
+        path = join(workspace, splitext(name)[0])
+        if not exists(workspace):
+            os.makedirs(workspace)
+        if hasattr(spatial_reference, 'exportToString'):
+            # An arcpy.SpatialReference
+            spatial_reference = spatial_reference.exportToString().split(';')[0]
+        table = LocalTable({
+            'geometry_type': geometry_type,
+            'spatial_reference': spatial_reference,
+            'fields': [[field, field_type] for field, field_type in fields],
+        }, None)
+        table.rows = np.zeros(0, dtype=table.dtype)
+        self.save_table(path, table)
+        return path
+
+    def add_field(self, table, name, field_type):
+        t = self.load_table(table)
+        old = t.rows
+        t.schema['fields'].append([name, field_type])
+        t.rows = np.zeros(len(old), dtype=t.dtype)
+        for column in old.dtype.names:
+            t.rows[column] = old[column]
+        self.save_table(table, t)
+
+    def field_names(self, table):
+        return [name for name, _ in self.load_table(table).schema['fields']]
+
+    def add_field_delimiters(self, table, field):
+        return '"{}"'.format(field)
+
+    def count(self, table):
+        return int(np.load(table_paths(table)[0], mmap_mode='r').shape[0])
+
+    def exists(self, path):
+        return any(exists(p) for p in table_paths(path))
+
+    def delete(self, path):
+        for p in table_paths(path):
+            if exists(p):
+                os.remove(p)
+
+    def read_raster(self, path):
+        return load_grid(splitext(path)[0], mmap=True)
+
+    def write_raster(self, grid, path):
+        save_grid(grid, splitext(path)[0])
+        return path
+
+    def raster_header(self, path):
+        return grid_header(self.read_raster(path))
+
+    def add_message(self, message):
+        logger.info(message)
@@ -0,0 +1,226 @@
+"""
+The analysis run end to end through a backend, so with the 'local' backend it runs headless: viewpoints from a zone
+raster, viewsheds from the NumPy sightline sweep, the observer index and the island visibility matrix.
+
+The outputs are laid out like run_full_analysis's: one viewshed_{:04d}_runs.npz per observer group and surface.json
+in the viewsheds folder, and the observer index and visibility matrix beside them, so anything that reads a
+workspace reads one made here.
+"""
+from itertools import groupby
+from os import makedirs
+from os.path import exists, getsize, join
+
+import numpy as np
+
+from macro_viewshed_analysis import profiling
+from macro_viewshed_analysis.backends import get_backend
+from macro_viewshed_analysis.config import AnalysisSettings as A, OBSERVER_GROUP_SIZE, SaveLocations as S, \
+    TableNames as T, ViewshedParameters as V
+from macro_viewshed_analysis.graph.matrix import VisibilityMatrixBuilder, save_visibility_matrix, seen_islands
+from macro_viewshed_analysis.raster.bitmask import band_rows_for, extract_observer_runs, grid_bands, grid_header, \
+    rebase_runs, runs_path, save_observer_runs, save_surface_header, load_observer_runs
+from macro_viewshed_analysis.raster.bitset import INT32_OBSERVERS
+from macro_viewshed_analysis.raster.horizon import cached_max_pyramid
+from macro_viewshed_analysis.raster.los import sea_level_surface, viewshed_bitmask, viewshed_bitset
+from macro_viewshed_analysis.raster.tiling import observer_window, spatial_order
+from macro_viewshed_analysis.raster.zonal import grid_windows, zonal_highest_cells
+from macro_viewshed_analysis.raster.zones import NO_ZONE, grid_labels, linear_unit_meters, split_zones
+from macro_viewshed_analysis.storage.observer_index import ObserverIndex
+
+VIEWPOINTS = 'viewpoints'
+VIEWPOINT_FIELDS = [(T.Z, 'DOUBLE'), (T.ISLAND_ID, 'LONG'), (T.SPLIT_ISLAND_ID, 'LONG'), (T.ISLAND_GRID_ID, 'LONG')]
+
+
+def find_viewpoints(backend, dem, zones, islands, workspace, zone_grid=None, curve=None):
+    """
+    The highest cell of each zone, numbered along a space filling curve and saved as a point table
+
+    :type backend: macro_viewshed_analysis.backends.Backend
+    :type dem: macro_viewshed_analysis.raster.grid.Grid
+    :param zones: Zone id per cell of the DEM, the split islands, NO_ZONE outside them
+    :type zones: numpy.ndarray
+    :param islands: Island id per cell of the DEM
+    :type islands: numpy.ndarray
+    :type workspace: str
+    :param zone_grid: Grid cell per zone id, None if not known
+    :type zone_grid: numpy.ndarray
+    :param curve: One of raster.tiling.CURVES or 'fid', defaults to the VIEWPOINT_ORDER setting
+    :type curve: str
+    :return: The viewpoint table
+    :rtype: str
+    """
+    maxima = zonal_highest_cells(grid_windows(dem.data, zones, int(A.ZONE_WINDOW_ROWS)), NO_ZONE)
+    rows, cols = maxima['row'].astype(np.int64), maxima['col'].astype(np.int64)
+    zone = maxima['zone'].astype(np.int64)
+    x, y = dem.cell_centre(rows, cols)
+    order = spatial_order(x, y, A.VIEWPOINT_ORDER if curve is None else curve)
+    columns = [x, y, maxima['z'], islands[rows, cols], zone,
+               np.full(len(zone), NO_ZONE) if zone_grid is None else zone_grid[zone]]
+
+    table = backend.create_feature_class(workspace, VIEWPOINTS, 'POINT', fields=VIEWPOINT_FIELDS)
+    with backend.insert_cursor(table, [T.XY] + [name for name, _ in VIEWPOINT_FIELDS]) as ic:
+        for px, py, z, island, split, grid in zip(*[c[order].tolist() for c in columns]):
+            ic.insertRow(((px, py), z, island, split, grid))
+    backend.add_message('{} viewpoints'.format(len(order)))
+    return table
+
+
+def group_runs(surface, observers, header, horizon=None):
+    """
+    :type surface: macro_viewshed_analysis.raster.grid.Grid
+    :param observers: (x, y, z, observer) per observer
+    :type observers: list[(float, float, float, int)]
+    :param header: Georeferencing of the whole surface
+    :type header: dict
+    :param horizon: Max elevation pyramid over the whole surface, None to walk every sightline to its end
+    :type horizon: macro_viewshed_analysis.raster.horizon.MaxPyramid
+    :return: Runs per observer, in the rows and columns of the whole surface
+    :rtype: dict[int, numpy.ndarray]
+    """
+    if V.CLIP_TO_RADIUS.lower() == 'true':
+        x, y = [o[0] for o in observers], [o[1] for o in observers]
+        window = observer_window(header, x, y, float(V.OUTER_RADIUS_METERS))
+        surface = surface.window(*window)
+        if horizon is not None:
+            horizon = horizon.window(*window)
+    with profiling.timer('line of sight') as timer:
+        if max(o[3] for o in observers) < INT32_OBSERVERS:
+            bits = viewshed_bitmask(surface, observers, horizon=horizon)
+        else:
+            bits = viewshed_bitset(surface, observers, horizon=horizon)
+        timer.rows = len(observers)
+    with profiling.timer('extract runs') as timer:
+        planes = bits.shape[0] if bits.ndim == 3 else 1
+        runs = extract_observer_runs(grid_bands(bits, band_rows_for(surface.shape[1] * planes)))
+        timer.rows = len(runs)
+    return rebase_runs(runs, grid_header(surface), header)
+
+
+def run_viewsheds(backend, viewpoints, dem, sea_level, workspace, overwrite_existing=False):
+    """
+    :type backend: macro_viewshed_analysis.backends.Backend
+    :type viewpoints: str
+    :type dem: macro_viewshed_analysis.raster.grid.Grid
+    :type sea_level: float
+    :type workspace: str
+    :type overwrite_existing: bool
+    :return: Where each group's runs were saved, by viewshed number
+    :rtype: dict[int, str]
+    """
+    surface = dem.like(sea_level_surface(np.asarray(dem.data), sea_level))
+    header = grid_header(surface)
+    viewshed_folder = join(workspace, S.FOLDER_VIEWSHEDS)
+    if not exists(viewshed_folder):
+        makedirs(viewshed_folder)
+    save_surface_header(viewshed_folder, header)
+    horizon = None
+    if V.HORIZON_CACHE.lower() == 'true':
+        horizon = cached_max_pyramid(viewshed_folder, sea_level, surface, rebuild=overwrite_existing)
+
+    total = backend.count(viewpoints)
+    saved = {}
+    with backend.search_cursor(viewpoints, [T.ID, T.XY, T.Z]) as sc:
+        for c, rows in groupby(sc, key=lambda row: row[0] // OBSERVER_GROUP_SIZE + 1):
+            saved[c] = runs_path(join(viewshed_folder, 'viewshed_{:04d}'.format(c)))
+            if exists(saved[c]) and not overwrite_existing:
+                continue
+            observers = [(x, y, z, i % OBSERVER_GROUP_SIZE) for i, (x, y), z in rows]
+            with profiling.timer('viewshed group') as timer:
+                save_observer_runs(saved[c], group_runs(surface, observers, header, horizon), header)
+                timer.rows, timer.bytes_written = len(observers), getsize(saved[c])
+            backend.add_message('viewshed {} of {}'.format(c, -(-total // OBSERVER_GROUP_SIZE)))
+    return saved
+
+
+def index_viewsheds(backend, viewpoints, workspace, runs_paths, overwrite_existing=False):
+    """
+    Add every viewshed not yet in the workspace's observer index to it
+
+    :type backend: macro_viewshed_analysis.backends.Backend
+    :type viewpoints: str
+    :type workspace: str
+    :param runs_paths: From run_viewsheds
+    :type runs_paths: dict[int, str]
+    :param overwrite_existing: Re-index viewsheds that are already in the index
+    :type overwrite_existing: bool
+    :rtype: ObserverIndex
+    """
+    index = ObserverIndex(join(workspace, S.FOLDER_VIEWSHEDS))
+    done = set() if overwrite_existing else index.viewsheds()
+    fields = [T.ID, T.ISLAND_ID, T.SPLIT_ISLAND_ID, T.ISLAND_GRID_ID]
+    with backend.search_cursor(viewpoints, fields) as sc:
+        for c, rows in groupby(sc, key=lambda row: row[0] // OBSERVER_GROUP_SIZE + 1):
+            if c in done:
+                continue
+            runs, header = load_observer_runs(runs_paths[c])
+            index.add_viewshed(c, [(i, i % OBSERVER_GROUP_SIZE, island, split, grid)
+                                   for i, island, split, grid in rows], runs, header)
+    return index
+
+
+def visibility_matrix(index, islands, save_to):
+    """
+    :type index: ObserverIndex
+    :param islands: Island id per cell, on the surface's cell grid
+    :type islands: macro_viewshed_analysis.raster.grid.Grid
+    :type save_to: str
+    :rtype: macro_viewshed_analysis.graph.matrix.VisibilityMatrix
+    """
+    labels, labels_header = grid_labels(islands), grid_header(islands)
+    builder = VisibilityMatrixBuilder(islands.cell_width * islands.cell_height)
+    for location in index.locations():
+        builder.add(location.island, *seen_islands(index.runs(location), index.header, labels, labels_header))
+    matrix = builder.matrix()
+    save_visibility_matrix(matrix, save_to)
+    return matrix
+
+
+def run_pipeline(sea_level, dem, islands, out_workspace, distance_to_shore=None, grid_width=None, grid_height=None,
+                 zones=None, backend=None, overwrite_existing=False):
+    """
+    :type sea_level: float
+    :param dem: Raster of elevations
+    :type dem: str
+    :param islands: Raster of island ids on the DEM's cells, with nodata in the sea
+    :type islands: str
+    :type out_workspace: str
+    :param distance_to_shore: Width of the coastal band viewpoints are taken from, as a linear unit
+    :type distance_to_shore: str | float
+    :param grid_width: Size of the grid the band is split by, as a linear unit
+    :type grid_width: str | float
+    :type grid_height: str | float
+    :param zones: Raster of split island ids on the DEM's cells, in place of splitting the islands here
+    :type zones: str
+    :param backend: One of backends.BACKENDS, defaults to the BACKEND setting
+    :type backend: str
+    :type overwrite_existing: bool
+    :return: Where the visibility matrix was saved
+    :rtype: str
+    """
+    backend = get_backend(backend)
+    dem_grid, island_grid = backend.read_raster(dem), backend.read_raster(islands)
+    island_labels = grid_labels(island_grid)
+
+    viewpoints = join(out_workspace, VIEWPOINTS)
+    if overwrite_existing or not backend.exists(viewpoints):
+        with profiling.timer('zones'):
+            if zones is not None:
+                zone_labels, zone_grid = grid_labels(backend.read_raster(zones)), None
+            else:
+                zone_labels, _, zone_grid = split_zones(
+                    island_labels, island_grid, linear_unit_meters(distance_to_shore),
+                    linear_unit_meters(grid_width), linear_unit_meters(grid_height)
+                )
+        with profiling.timer('viewpoints'):
+            viewpoints = find_viewpoints(backend, dem_grid, zone_labels, island_labels, out_workspace, zone_grid)
+
+    with profiling.timer('viewsheds'):
+        runs_paths = run_viewsheds(backend, viewpoints, dem_grid, sea_level, out_workspace, overwrite_existing)
+    with profiling.timer('observer index'):
+        index = index_viewsheds(backend, viewpoints, out_workspace, runs_paths, overwrite_existing)
+    save_to = join(out_workspace, S.FOLDER_VIEWSHEDS, S.VISIBILITY_MATRIX)
+    with profiling.timer('visibility matrix'):
+        matrix = visibility_matrix(index, island_grid, save_to)
+    index.close()
+    backend.add_message('{} island pairs over {} islands'.format(len(matrix), len(matrix.islands)))
+    return save_to
@@ -0,0 +1,37 @@
+import logging
+
+import click
+
+from macro_viewshed_analysis import profiling
+from macro_viewshed_analysis.backends import BACKENDS
+from macro_viewshed_analysis.backends.pipeline import run_pipeline
+from macro_viewshed_analysis.config import AnalysisSettings as A
+
+
+@click.command()
+@click.option('--overwrite/--no-overwrite', default=False)
+@click.option('--backend', default=A.BACKEND, type=click.Choice(sorted(BACKENDS)))
+@click.option('--distance-to-shore', default='2 Kilometers', type=click.STRING)
+@click.option('--grid-width', default='20 Kilometers', type=click.STRING)
+@click.option('--grid-height', default='20 Kilometers', type=click.STRING)
+@click.option('--zones', default=None, type=click.STRING, help='Split island raster, in place of splitting here')
+@click.option('--profile', is_flag=True, default=False, help='Save profile.json and profile.csv to the workspace')
+@click.argument('sea-level', type=float)
+@click.argument('workspace',
+                type=click.Path(exists=True, file_okay=False, dir_okay=True, resolve_path=True, writable=True))
+@click.argument('dem', type=click.STRING)
+@click.argument('islands', type=click.STRING)
+def headless_analysis(sea_level, workspace, dem, islands, distance_to_shore, grid_width, grid_height, zones, overwrite,
+                      backend, profile):
+    logging.basicConfig(level=logging.INFO)
+    if profile:
+        profiling.enable()
+    run_pipeline(sea_level, dem, islands, workspace, distance_to_shore, grid_width, grid_height, zones, backend,
+                 overwrite)
+    if profile:
+        logging.info(profiling.summary())
+        profiling.save(workspace)
+
+
+if __name__ == '__main__':
+    headless_analysis()
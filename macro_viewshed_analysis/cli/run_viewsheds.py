@@ -4,7 +4,9 @@ import arcpy
 import click
 from arcpy import env
 
-from macro_viewshed_analysis.procedures.viewshed import run_all_viewsheds
+from macro_viewshed_analysis.config import ViewshedParameters as V
+from macro_viewshed_analysis.procedures.scheduler import run_all_viewsheds_parallel
+from macro_viewshed_analysis.procedures.viewshed import run_all_viewsheds, VIEWSHED_ENGINES
 
 arcpy.CheckOutExtension("Spatial")
 
@@ -16,13 +18,21 @@ env.overwriteOutput = True
 @click.command()
 @click.option('--overwrite/--no-overwrite', default=False)
 @click.option('--spatial-reference', '-s', default=None, type=str)
+@click.option('--engine', default=V.VIEWSHED_ENGINE, type=click.Choice(sorted(VIEWSHED_ENGINES)))
+@click.option('--workers', '-w', default=1, type=int, help='Worker processes, 0 for one per CPU')
+@click.option('--failed-only', is_flag=True, default=False, help='Re-run only the groups that failed last time')
 @click.argument('sea-level', type=int)
 @click.argument('workspace',
                 type=click.Path(exists=True, file_okay=True, dir_okay=True, resolve_path=True, writable=True))
 @click.argument('viewpoints', type=click.STRING)
 @click.argument('dem', type=click.STRING)
-def run_viewsheds(sea_level, workspace, viewpoints, dem, spatial_reference, overwrite):
-    run_all_viewsheds(sea_level, workspace, viewpoints, dem, spatial_reference, overwrite)
+def run_viewsheds(sea_level, workspace, viewpoints, dem, spatial_reference, overwrite, engine, workers, failed_only):
+    if workers == 1:
+        run_all_viewsheds(sea_level, workspace, viewpoints, dem, spatial_reference, overwrite, viewshed_engine=engine,
+                          failed_only=failed_only)
+    else:
+        run_all_viewsheds_parallel(sea_level, workspace, viewpoints, dem, spatial_reference, overwrite,
+                                   viewshed_engine=engine, workers=workers or None, failed_only=failed_only)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,24 @@
+import arcpy
+import click
+from arcpy import env
+
+from macro_viewshed_analysis.procedures.network import build_visibility_matrix
+
+
+@click.command()
+@click.option('--save-to', default=None, type=click.Path(), help='Defaults to the viewsheds folder')
+@click.option('--overwrite/--no-overwrite', default=False, help='Index every viewshed again')
+@click.argument('workspace',
+                type=click.Path(exists=True, file_okay=False, dir_okay=True, resolve_path=True, writable=True))
+@click.argument('viewpoints', type=click.STRING)
+@click.argument('islands', type=click.STRING)
+@click.argument('dem', type=click.STRING)
+def visibility_matrix(workspace, viewpoints, islands, dem, save_to, overwrite):
+    arcpy.CheckOutExtension("Spatial")
+    env.workspace = workspace
+    env.overwriteOutput = True
+    build_visibility_matrix(viewpoints, workspace, islands, dem, save_to, overwrite_existing=overwrite)
+
+
+if __name__ == '__main__':
+    visibility_matrix()
@@ -1,6 +1,9 @@
 from abc import ABCMeta
 from os import getenv
 
+# Observers per viewshed run. Viewshed2_3d takes at most 32, the numpy engine any number (see raster.bitset).
+OBSERVER_GROUP_SIZE = int(getenv('OBSERVER_GROUP_SIZE', '32'))
+
 
 class EnvOverrideDefaults(type):
     __metaclass__ = ABCMeta
@@ -19,6 +22,11 @@ class TableNames(object):
     FID = 'FID'
     ID = 'OID@'
     SHAPE = 'SHAPE@'
+    XY = 'SHAPE@XY'
+    XYZ = 'SHAPE@XYZ'
+    X = 'SHAPE@X'
+    Y = 'SHAPE@Y'
+    SHAPE_Z = 'SHAPE@Z'
     CENTROID = "SHAPE@TRUECENTROID"
 
     ISLAND_ID = 'FID_island'
@@ -36,6 +44,8 @@ class TableNames(object):
     A = 'island_A'
     B = 'island_B'
     A2B = 'A_sees_B'
+    TRAVERSALS = 'travs'
+    PATHS = 'paths'
 
 
 class SaveLocations(object):
@@ -57,5 +67,54 @@ class SaveLocations(object):
         )
 
     FOLDER_VIEWSHEDS = 'viewsheds'
+    VISIBILITY_MATRIX = 'visibility_matrix.npz'
     FOLDER_TMP_OBSERVERS = 'observer_groups'
     FOLDER_OBSERVER_POINTS = 'observer_points'
+    SWEEP_ZONES = 'sweep_zones.npz'
+
+
+class ViewshedParameters(object):
+    __metaclass__ = EnvOverrideDefaults
+
+    REFRACTIVITY_COEFFICIENT = '0.13'
+    OBSERVER_OFFSET_METERS = '2'
+    OUTER_RADIUS_METERS = '300000'
+
+    VIEWSHED_ENGINE = 'arcpy'
+
+    # Give each observer group only the surface within OUTER_RADIUS_METERS of its observers
+    CLIP_TO_RADIUS = 'true'
+
+    # Stop the numpy engine's sightlines once nothing further along them can be seen, using a max elevation pyramid
+    # saved in the viewsheds folder for each sea level (see raster.horizon). Viewsheds are the same either way.
+    HORIZON_CACHE = 'true'
+
+
+class AnalysisSettings(object):
+    __metaclass__ = EnvOverrideDefaults
+
+    # 'points' intersects a multipoint copy of the DEM with the split islands, 'raster' takes a zonal max, 'zones'
+    # skips the buffer and grid polygons and splits the islands in the raster domain before taking a zonal max
+    VIEWPOINT_MODE = 'points'
+    ZONE_WINDOW_ROWS = '1024'
+    # Curve the viewpoints are numbered along so observer groups are compact: 'hilbert', 'morton' or 'fid'
+    VIEWPOINT_ORDER = 'hilbert'
+
+    # 'incremental' carries viewpoints forward from the previous sea level for split islands that haven't changed.
+    # Zones mode only, and needs save_intermediate.
+    SEA_LEVEL_SWEEP = 'full'
+
+    # 'threshold' thresholds the DEM at each sea level, 'merge_tree' labels every level in one pass
+    ISLAND_LABELLING = 'threshold'
+
+    # Attempts per observer group before it goes in the failure queue, and the wait before the first retry, which
+    # doubles for each one after
+    JOB_ATTEMPTS = '3'
+    JOB_BACKOFF_SECONDS = '10'
+
+    # Storage and geoprocessing backend, 'arcpy' or 'local' (see macro_viewshed_analysis.backends)
+    BACKEND = 'arcpy'
+
+    # 'true' times each stage, observer group, extraction and cursor flush, and saves profile.json and profile.csv
+    # to the output workspace (see macro_viewshed_analysis.profiling)
+    PROFILE = 'false'
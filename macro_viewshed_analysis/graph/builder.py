@@ -0,0 +1,74 @@
+"""
+Builds the island network from a single pass over the viewshed rows
+"""
+import networkx as nx
+
+
+def load_viewshed_index(rows):
+    """
+    Index the rows by (island_a, island_b). Each entry holds the total visible area and the centroid of the
+    first row seen for that pair, which is the row get_viewshed_centroid would have returned.
+
+    :type rows: collections.Iterable[(int, int, (float, float), float)]
+    :rtype: dict[(int, int), list]
+    """
+    index = {}
+    for island_a_id, island_b_id, centroid, area in rows:
+        key = (island_a_id, island_b_id)
+        entry = index.get(key)
+        if entry is None:
+            index[key] = [float(area), tuple(centroid)]
+        else:
+            entry[0] += float(area)
+    return index
+
+
+def load_centroids(rows):
+    """
+    The centroid of the first row for each (island_a, island_b), the one get_viewshed_centroid would have returned
+
+    :type rows: collections.Iterable[(int, int, (float, float), float)]
+    :rtype: dict[(int, int), (float, float)]
+    """
+    centroids = {}
+    for island_a_id, island_b_id, centroid, _ in rows:
+        key = (island_a_id, island_b_id)
+        if key not in centroids:
+            centroids[key] = tuple(centroid)
+    return centroids
+
+
+def build_network_from_index(index, centroids=None):
+    """
+    An edge A -> B needs centroids both ways: the A end sits at the centroid of B's view of A and the B end
+    at the centroid of A's view of B.
+
+    :type index: dict[(int, int), list]
+    :param centroids: Where to look the ends up, defaults to the centroids in index
+    :type centroids: dict[(int, int), (float, float)]
+    :rtype: networkx.DiGraph
+    """
+    if centroids is None:
+        centroids = dict((key, centroid) for key, (_, centroid) in index.items())
+    d = nx.DiGraph()
+    for (island_a_id, island_b_id), (area, _) in index.items():
+        if island_a_id == island_b_id:
+            continue
+        a_centroid = centroids.get((island_b_id, island_a_id))
+        b_centroid = centroids.get((island_a_id, island_b_id))
+        if a_centroid is None or b_centroid is None:
+            continue
+        d.add_edge(island_a_id, island_b_id, area=area, a=a_centroid, b=b_centroid)
+    return d
+
+
+def build_network_from_rows(rows, centroid_rows=None):
+    """
+    :param rows: The areas are summed from these
+    :type rows: collections.Iterable[(int, int, (float, float), float)]
+    :param centroid_rows: The edge ends are read from these, defaults to rows
+    :type centroid_rows: collections.Iterable[(int, int, (float, float), float)]
+    :rtype: networkx.DiGraph
+    """
+    centroids = None if centroid_rows is None else load_centroids(centroid_rows)
+    return build_network_from_index(load_viewshed_index(rows), centroids)
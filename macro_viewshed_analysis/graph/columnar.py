@@ -0,0 +1,334 @@
+"""
+A columnar on-disk format for the island network.
+
+A graph is saved as a folder holding one .npy per column and a graph.json describing them. The edge table has the
+source and target islands in `edges-a` and `edges-b`, then one column per edge attribute: nested dicts such as the
+per-origin traversal counts are flattened to one column per leaf (`edges.north.traversals`), and (x, y) pairs such
+as the `a` and `b` centroids are split into `.x` and `.y` columns. Node attributes are stored the same way against
+`nodes-node`. Attributes missing from some edges or nodes, like the counts of an origin that only reached some edges, are stored
+sparsely: just the values they have, with the rows they belong to in a `.rows` column alongside.
+
+Every column can be memory mapped, so a script that only needs a few columns of a multi-million edge graph never
+reads the rest, and nothing is unpickled.
+"""
+import json
+import pickle
+from os import makedirs, stat
+from os.path import exists, isdir, join, splitext
+
+import networkx as nx
+import numpy as np
+
+EXTENSION = '.graph'
+META = 'graph.json'
+VERSION = 1
+EDGE_A = 'a'
+EDGE_B = 'b'
+NODE = 'node'
+ROWS = 'rows'
+EDGE_TABLE = 'edges'
+NODE_TABLE = 'nodes'
+
+
+def _column_name(table, path):
+    return '{}.{}'.format(table, '.'.join(path))
+
+
+def _key_name(table, name):
+    # Dashed so no attribute column can be named the same
+    return '{}-{}'.format(table, name)
+
+
+def _collect(path, rows, values, columns, points):
+    leaf_rows, leaf_values, children = [], [], {}
+    for i, value in zip(rows, values):
+        if isinstance(value, dict):
+            for key, child in value.items():
+                child_rows, child_values = children.setdefault(str(key), ([], []))
+                child_rows.append(i)
+                child_values.append(child)
+        elif isinstance(value, (tuple, list)) and len(value) == 2:
+            points.add(path)
+            for key, child in zip(('x', 'y'), value):
+                child_rows, child_values = children.setdefault(key, ([], []))
+                child_rows.append(i)
+                child_values.append(child)
+        else:
+            leaf_rows.append(i)
+            leaf_values.append(value)
+    if leaf_rows:
+        columns[path] = (leaf_rows, leaf_values)
+    for key, (child_rows, child_values) in children.items():
+        _collect(path + (key,), child_rows, child_values, columns, points)
+
+
+def _table_columns(items):
+    """
+    :param items: Attribute dicts, one per row
+    :return: The rows that have each attribute path and their values, and the paths that hold (x, y) pairs
+    :rtype: (dict[tuple, (list[int], list)], set[tuple])
+    """
+    columns, points = {}, set()
+    items = list(items)
+    _collect((), range(len(items)), items, columns, points)
+    columns.pop((), None)
+    return columns, points
+
+
+def _as_array(values):
+    values = np.asarray(values)
+    if values.dtype.kind == 'O':
+        raise ValueError('Only numbers, strings and (x, y) pairs can be stored as columns')
+    return values
+
+
+def _save_table(folder, table, count, keys, items):
+    columns, points = _table_columns(items)
+    entries = []
+    for path in sorted(columns):
+        name = _column_name(table, path)
+        rows, values = columns[path]
+        np.save(join(folder, name + '.npy'), _as_array(values))
+        entry = {'name': name, 'path': list(path)}
+        if len(rows) < count:
+            np.save(join(folder, name + '.' + ROWS + '.npy'), np.array(rows, dtype=np.int64))
+            entry[ROWS] = name + '.' + ROWS
+        entries.append(entry)
+    for key_name, key_values in keys:
+        np.save(join(folder, _key_name(table, key_name) + '.npy'), np.asarray(key_values))
+    return {'columns': entries, 'points': sorted(list(p) for p in points), 'count': count}
+
+
+def _source_fingerprint(path):
+    info = stat(path)
+    return {'size': info.st_size, 'mtime': int(info.st_mtime)}
+
+
+def write_graph(graph, folder, source=None):
+    """
+    :type graph: networkx.Graph
+    :param folder: Created if it doesn't exist, existing columns are overwritten
+    :type folder: str
+    :param source: The gpickle the graph was read from, so a copy made before it changed can be told apart
+    :type source: str
+    :return: folder
+    :rtype: str
+    """
+    if not exists(folder):
+        makedirs(folder)
+    edges = list(graph.edges(data=True))
+    nodes = list(graph.nodes(data=True))
+    meta = {
+        'version': VERSION,
+        'directed': graph.is_directed(),
+        EDGE_TABLE: _save_table(folder, EDGE_TABLE, len(edges),
+                                [(EDGE_A, [e[0] for e in edges]), (EDGE_B, [e[1] for e in edges])],
+                                (e[2] for e in edges)),
+        NODE_TABLE: _save_table(folder, NODE_TABLE, len(nodes), [(NODE, [n[0] for n in nodes])],
+                                (n[1] for n in nodes)),
+    }
+    if source is not None:
+        meta['source'] = _source_fingerprint(source)
+    with open(join(folder, META), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return folder
+
+
+class ColumnTable(object):
+    """
+    One table of a saved graph, with its columns loaded on first use
+    """
+
+    def __init__(self, folder, table, meta, mmap_mode):
+        self.folder = folder
+        self.table = table
+        self.mmap_mode = mmap_mode
+        self.paths = dict((tuple(c['path']), c) for c in meta['columns'])
+        self.points = set(tuple(p) for p in meta['points'])
+        self.count = meta['count']
+        self._loaded = {}
+
+    def _load(self, name):
+        if name not in self._loaded:
+            self._loaded[name] = np.load(join(self.folder, name + '.npy'), mmap_mode=self.mmap_mode)
+        return self._loaded[name]
+
+    def key(self, name):
+        """
+        :param name: EDGE_A, EDGE_B or NODE
+        :rtype: numpy.ndarray
+        """
+        return self._load(_key_name(self.table, name))
+
+    def __len__(self):
+        return self.count
+
+    def sparse(self, *path):
+        """
+        :param path: Attribute names down to the leaf, e.g. sparse('north', 'traversals') or sparse('a', 'x')
+        :return: The rows that have the attribute and their values
+        :rtype: (numpy.ndarray, numpy.ndarray)
+        """
+        entry = self.paths[path]
+        values = self._load(entry['name'])
+        if ROWS not in entry:
+            return np.arange(self.count), values
+        return self._load(entry[ROWS]), values
+
+    def column(self, *path, **kwargs):
+        """
+        :param path: Attribute names down to the leaf
+        :param fill: Value for rows without the attribute, defaults to NaN for floats and 0 otherwise
+        :rtype: numpy.ndarray
+        """
+        entry = self.paths[path]
+        values = self._load(entry['name'])
+        if ROWS not in entry:
+            return values
+        fill = kwargs.get('fill', np.nan if values.dtype.kind == 'f' else 0)
+        column = np.full(self.count, fill, dtype=values.dtype) if values.dtype.kind not in 'SU' else \
+            np.zeros(self.count, dtype=values.dtype)
+        column[self._load(entry[ROWS])] = values
+        return column
+
+    def present(self, *path):
+        """
+        :return: Which rows have the attribute
+        :rtype: numpy.ndarray
+        """
+        present = np.zeros(self.count, dtype=bool)
+        present[self.sparse(*path)[0]] = True
+        return present
+
+    def children(self, *prefix):
+        """
+        :return: Names one level below prefix, e.g. the origins holding traversal counts
+        :rtype: list[str]
+        """
+        return sorted(set(path[len(prefix)] for path in self.paths
+                          if len(path) > len(prefix) and path[:len(prefix)] == prefix))
+
+    def __contains__(self, path):
+        return tuple(path) in self.paths
+
+    def rows(self):
+        """
+        :return: The attribute dict of every row, as it was saved
+        :rtype: list[dict]
+        """
+        rows = [{} for _ in range(self.count)]
+        for path in sorted(self.paths):
+            indices, values = self.sparse(*path)
+            parent, leaf = path[:-1], path[-1]
+            for i, value in zip(indices.tolist(), values.tolist()):
+                data = rows[i]
+                for key in parent:
+                    data = data.setdefault(key, {})
+                data[leaf] = value
+        for point in self.points:
+            for i in self.sparse(*(point + ('x',)))[0].tolist():
+                parent = rows[i]
+                for key in point[:-1]:
+                    parent = parent[key]
+                xy = parent[point[-1]]
+                parent[point[-1]] = (xy['x'], xy['y'])
+        return rows
+
+
+class GraphColumns(object):
+    """
+    A graph saved by write_graph, as columns
+    """
+
+    def __init__(self, folder, mmap_mode='r'):
+        """
+        :type folder: str
+        :param mmap_mode: As for numpy.load, None reads every column into memory as it is used
+        :type mmap_mode: str
+        """
+        with open(join(folder, META)) as f:
+            meta = json.load(f)
+        if meta['version'] != VERSION:
+            raise ValueError('{} is graph format version {}, expected {}'.format(folder, meta['version'], VERSION))
+        self.directed = meta['directed']
+        self.edges = ColumnTable(folder, EDGE_TABLE, meta[EDGE_TABLE], mmap_mode)
+        self.nodes = ColumnTable(folder, NODE_TABLE, meta[NODE_TABLE], mmap_mode)
+
+    @property
+    def a(self):
+        return self.edges.key(EDGE_A)
+
+    @property
+    def b(self):
+        return self.edges.key(EDGE_B)
+
+    def __len__(self):
+        return len(self.a)
+
+    def to_networkx(self):
+        """
+        :rtype: networkx.Graph
+        """
+        graph = nx.DiGraph() if self.directed else nx.Graph()
+        graph.add_nodes_from(zip(self.nodes.key(NODE).tolist(), self.nodes.rows()))
+        graph.add_edges_from(zip(self.a.tolist(), self.b.tolist(), self.edges.rows()))
+        return graph
+
+
+def load_graph(folder):
+    """
+    :type folder: str
+    :rtype: networkx.Graph
+    """
+    return GraphColumns(folder).to_networkx()
+
+
+def _converted_from(columnar, path):
+    """
+    :param columnar: A folder saved by write_graph
+    :type columnar: str
+    :param path: A gpickle
+    :type path: str
+    :return: Whether columnar was converted from path since path last changed
+    :rtype: bool
+    """
+    if not exists(join(columnar, META)):
+        return False
+    with open(join(columnar, META)) as f:
+        meta = json.load(f)
+    return meta.get('source') == _source_fingerprint(path)
+
+
+def read_graph(path):
+    """
+    A graph saved by write_graph, or a gpickle from before there was a columnar format. A columnar copy saved next
+    to the gpickle, e.g. traversal_path.graph for traversal_path.gpickle, is read in its place unless the gpickle
+    has changed since the copy was made.
+
+    :type path: str
+    :rtype: networkx.Graph
+    """
+    if isdir(path):
+        return load_graph(path)
+    columnar = splitext(path)[0] + EXTENSION
+    if isdir(columnar) and (not exists(path) or _converted_from(columnar, path)):
+        return load_graph(columnar)
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def open_graph_columns(path):
+    """
+    The columns of the graph at path. A gpickle is converted to a columnar copy next to it the first time, and
+    again whenever it changes.
+
+    :param path: A folder saved by write_graph, or a gpickle
+    :type path: str
+    :rtype: GraphColumns
+    """
+    if isdir(path):
+        return GraphColumns(path)
+    columnar = splitext(path)[0] + EXTENSION
+    if not _converted_from(columnar, path):
+        write_graph(read_graph(path), columnar, source=path)
+    return GraphColumns(columnar)
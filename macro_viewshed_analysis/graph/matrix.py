@@ -0,0 +1,220 @@
+"""
+The island x island visibility matrix, straight from observer runs and an island label raster.
+
+Entry (A, B) is the area of island B seen from observers on island A, summed over the observers like the
+Shape_Area of the landmass_polys rows, with the area weighted centroid of what they see. It is stored as CSR over
+the sorted island ids in a compressed .npz, and reads back as the same (island_a, island_b, centroid, area) rows
+as graph.rows, so the network can be built from it without any polygon intersection.
+"""
+import numpy as np
+
+ISLANDS = 'islands'
+INDPTR = 'indptr'
+INDICES = 'indices'
+AREA = 'area'
+CENTROID_X = 'centroid_x'
+CENTROID_Y = 'centroid_y'
+
+# Pairs gathered before they are summed down
+COMPACT_EVERY = 1000000
+
+
+def run_cells(runs):
+    """
+    :param runs: (row, start, stop) per run
+    :type runs: numpy.ndarray
+    :return: Row and column of every cell covered by the runs
+    :rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    runs = np.asarray(runs, dtype=np.int64).reshape(-1, 3)
+    lengths = runs[:, 2] - runs[:, 1]
+    rows = np.repeat(runs[:, 0], lengths)
+    run_starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    cols = np.repeat(runs[:, 1], lengths) + np.arange(lengths.sum()) - run_starts
+    return rows, cols
+
+
+def grid_offsets(runs_header, labels_header):
+    """
+    :return: Rows and columns to add to run cells to index the label raster
+    :rtype: (int, int)
+    """
+    row_offset = int(round((labels_header['y_max'] - runs_header['y_max']) / labels_header['cell_height']))
+    col_offset = int(round((runs_header['x_min'] - labels_header['x_min']) / labels_header['cell_width']))
+    return row_offset, col_offset
+
+
+def seen_islands(runs, runs_header, labels, labels_header, no_island=-1):
+    """
+    What one observer sees of each island
+
+    :param runs: The observer's runs
+    :type runs: numpy.ndarray
+    :type runs_header: dict
+    :param labels: Island id per cell
+    :type labels: numpy.ndarray
+    :param labels_header: Georeferencing of labels, on the same cell grid as the runs
+    :type labels_header: dict
+    :type no_island: int
+    :return: Island ids, cells seen of each, and the sums of the seen cells' x and y
+    :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray)
+    """
+    rows, cols = run_cells(runs)
+    row_offset, col_offset = grid_offsets(runs_header, labels_header)
+    rows, cols = rows + row_offset, cols + col_offset
+    inside = (rows >= 0) & (rows < labels.shape[0]) & (cols >= 0) & (cols < labels.shape[1])
+    rows, cols = rows[inside], cols[inside]
+    island = np.asarray(labels[rows, cols])
+    on_island = island != no_island
+    island, rows, cols = island[on_island], rows[on_island], cols[on_island]
+    x = labels_header['x_min'] + (cols + 0.5) * labels_header['cell_width']
+    y = labels_header['y_max'] - (rows + 0.5) * labels_header['cell_height']
+    ids, position = np.unique(island, return_inverse=True)
+    return (ids, np.bincount(position, minlength=len(ids)),
+            np.bincount(position, weights=x, minlength=len(ids)), np.bincount(position, weights=y, minlength=len(ids)))
+
+
+def _sum_pairs(a, b, cells, x, y):
+    keys = np.column_stack([a, b])
+    unique, position = np.unique(keys.view([('a', keys.dtype), ('b', keys.dtype)]).ravel(), return_inverse=True)
+    return (unique['a'], unique['b'], np.bincount(position, weights=cells), np.bincount(position, weights=x),
+            np.bincount(position, weights=y))
+
+
+class VisibilityMatrixBuilder(object):
+    """
+    Sums what each observer sees into island pairs
+    """
+
+    def __init__(self, cell_area):
+        """
+        :param cell_area: Area of one cell, in the units Shape_Area would be in
+        :type cell_area: float
+        """
+        self.cell_area = float(cell_area)
+        self.pending = []
+        self.pending_pairs = 0
+        self.summed = None
+
+    def add(self, observer_island, islands, cells, sum_x, sum_y):
+        """
+        :param observer_island: The island the observer is on
+        :type observer_island: int
+        :param islands: What seen_islands returned for the observer
+        """
+        if len(islands) == 0:
+            return
+        self.pending.append((np.full(len(islands), observer_island, dtype=np.int64),
+                             np.asarray(islands, dtype=np.int64), cells, sum_x, sum_y))
+        self.pending_pairs += len(islands)
+        if self.pending_pairs >= COMPACT_EVERY:
+            self._compact()
+
+    def _compact(self):
+        parts = self.pending if self.summed is None else [self.summed] + self.pending
+        if not parts:
+            return
+        self.summed = _sum_pairs(*[np.concatenate(column) for column in zip(*parts)])
+        self.pending, self.pending_pairs = [], 0
+
+    def matrix(self):
+        """
+        :rtype: VisibilityMatrix
+        """
+        self._compact()
+        if self.summed is None:
+            empty = np.empty(0)
+            return VisibilityMatrix.from_pairs(empty, empty, empty, empty, empty)
+        a, b, cells, sum_x, sum_y = self.summed
+        return VisibilityMatrix.from_pairs(a, b, cells * self.cell_area, sum_x / cells, sum_y / cells)
+
+
+class VisibilityMatrix(object):
+    """
+    CSR island x island matrix of visible area, with the centroid of each entry alongside
+    """
+    ARRAYS = (ISLANDS, INDPTR, INDICES, AREA, CENTROID_X, CENTROID_Y)
+
+    def __init__(self, islands, indptr, indices, area, centroid_x, centroid_y):
+        """
+        :param islands: Sorted island ids. Rows and columns are positions in this array.
+        :type islands: numpy.ndarray
+        """
+        self.islands = islands
+        self.indptr = indptr
+        self.indices = indices
+        self.area = area
+        self.centroid_x = centroid_x
+        self.centroid_y = centroid_y
+
+    @classmethod
+    def from_pairs(cls, a, b, area, centroid_x, centroid_y):
+        """
+        :param a: Observer island per entry
+        :param b: Seen island per entry
+        :rtype: VisibilityMatrix
+        """
+        a, b = np.asarray(a, dtype=np.int64), np.asarray(b, dtype=np.int64)
+        islands = np.unique(np.concatenate([a, b]))
+        rows, cols = np.searchsorted(islands, a), np.searchsorted(islands, b)
+        order = np.lexsort((cols, rows))
+        indptr = np.zeros(len(islands) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(islands)), out=indptr[1:])
+        return cls(islands, indptr, cols[order], np.asarray(area, dtype=np.float64)[order],
+                   np.asarray(centroid_x, dtype=np.float64)[order], np.asarray(centroid_y, dtype=np.float64)[order])
+
+    def __len__(self):
+        return len(self.indices)
+
+    def get(self, island_a, island_b):
+        """
+        :return: Area of island_b seen from island_a, 0 if none is
+        :rtype: float
+        """
+        row = np.searchsorted(self.islands, island_a)
+        col = np.searchsorted(self.islands, island_b)
+        if row >= len(self.islands) or self.islands[row] != island_a or col >= len(self.islands) or \
+                self.islands[col] != island_b:
+            return 0.0
+        start, stop = self.indptr[row], self.indptr[row + 1]
+        hit = start + np.searchsorted(self.indices[start:stop], col)
+        if hit < stop and self.indices[hit] == col:
+            return float(self.area[hit])
+        return 0.0
+
+    def rows(self):
+        """
+        :return: (island_a, island_b, centroid, area) per entry, like graph.rows
+        :rtype: collections.Iterable[(int, int, (float, float), float)]
+        """
+        a = np.repeat(self.islands, np.diff(self.indptr)).tolist()
+        b = self.islands[self.indices].tolist()
+        for row in zip(a, b, zip(self.centroid_x.tolist(), self.centroid_y.tolist()), self.area.tolist()):
+            yield row
+
+
+def save_visibility_matrix(matrix, path):
+    """
+    :type matrix: VisibilityMatrix
+    :type path: str
+    """
+    np.savez_compressed(path, **dict(zip(VisibilityMatrix.ARRAYS, (
+        matrix.islands, matrix.indptr, matrix.indices, matrix.area, matrix.centroid_x, matrix.centroid_y
+    ))))
+
+
+def is_visibility_matrix(npz):
+    """
+    :param npz: An open .npz
+    :rtype: bool
+    """
+    return INDPTR in npz.files
+
+
+def load_visibility_matrix(path):
+    """
+    :type path: str
+    :rtype: VisibilityMatrix
+    """
+    with np.load(path) as f:
+        return VisibilityMatrix(*[f[name] for name in VisibilityMatrix.ARRAYS])
@@ -0,0 +1,90 @@
+"""
+Sources of (island_a, island_b, centroid, area) rows for building the network.
+
+Each row is one piece of island A's viewshed that lands on island B, as in the FID_island, FID_islands,
+SHAPE@TRUECENTROID and Shape_Area fields of the landmass_polys intersection. These sources read exports of
+that table so the network can be built without arcpy; procedures.network reads the feature class itself.
+"""
+import csv
+
+import numpy as np
+
+from macro_viewshed_analysis.config import TableNames as T
+from macro_viewshed_analysis.graph.matrix import VisibilityMatrix, is_visibility_matrix
+
+CENTROID_X = 'centroid_x'
+CENTROID_Y = 'centroid_y'
+
+
+def csv_rows(path):
+    """
+    Rows from a CSV with FID_island, FID_islands, centroid_x, centroid_y and Shape_Area columns
+
+    :type path: str
+    :rtype: collections.Iterable[(int, int, (float, float), float)]
+    """
+    with open(path) as f:
+        for row in csv.DictReader(f):
+            yield (
+                int(row[T.ISLAND_ID]),
+                int(row[T.INTERSECTED_ISLAND_ID]),
+                (float(row[CENTROID_X]), float(row[CENTROID_Y])),
+                float(row[T.SHAPE_AREA]),
+            )
+
+
+def write_csv_rows(rows, path):
+    """
+    :type rows: collections.Iterable[(int, int, (float, float), float)]
+    :type path: str
+    """
+    with open(path, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow([T.ISLAND_ID, T.INTERSECTED_ISLAND_ID, CENTROID_X, CENTROID_Y, T.SHAPE_AREA])
+        for island_a_id, island_b_id, (x, y), area in rows:
+            writer.writerow([island_a_id, island_b_id, repr(x), repr(y), repr(area)])
+
+
+def npz_rows(path):
+    """
+    Rows from an .npz holding one array per column, named like the CSV columns, or from a visibility matrix
+    saved by graph.matrix.save_visibility_matrix
+
+    :type path: str
+    :rtype: collections.Iterable[(int, int, (float, float), float)]
+    """
+    with np.load(path) as columns:
+        if is_visibility_matrix(columns):
+            matrix = VisibilityMatrix(*[columns[name] for name in VisibilityMatrix.ARRAYS])
+            for row in matrix.rows():
+                yield row
+            return
+        a = columns[T.ISLAND_ID].tolist()
+        b = columns[T.INTERSECTED_ISLAND_ID].tolist()
+        x = columns[CENTROID_X].tolist()
+        y = columns[CENTROID_Y].tolist()
+        area = columns[T.SHAPE_AREA].tolist()
+    for row in zip(a, b, zip(x, y), area):
+        yield row
+
+
+def write_npz_rows(rows, path):
+    """
+    :type rows: collections.Iterable[(int, int, (float, float), float)]
+    :type path: str
+    """
+    a, b, centroids, area = zip(*rows)
+    x, y = zip(*centroids)
+    np.savez_compressed(path, **{
+        T.ISLAND_ID: np.array(a, dtype=np.int64),
+        T.INTERSECTED_ISLAND_ID: np.array(b, dtype=np.int64),
+        CENTROID_X: np.array(x, dtype=np.float64),
+        CENTROID_Y: np.array(y, dtype=np.float64),
+        T.SHAPE_AREA: np.array(area, dtype=np.float64),
+    })
+
+
+ROW_SOURCES = {
+    '.csv': csv_rows,
+    '.npz': npz_rows,
+}
@@ -0,0 +1,59 @@
+"""
+Rolling the ABM's per-run traversal counts up to their origins.
+
+The ABM saves one nested attribute per run on every edge it reached, keyed by the run's name, e.g.
+`north_1 = {'traversals': .., 'path': .., 'tree': ..}`. An origin's counts are the sums over every run named with
+it as a prefix. Here the runs are read as columns of a saved graph (see graph.columnar) and each is added into the
+(edge, origin, field) array of every origin it belongs to, so every origin is summed in one pass over the runs
+rather than one pass over the edges per origin.
+"""
+import numpy as np
+
+TRAVERSAL_FIELDS = ('traversals', 'path', 'tree')
+
+
+def run_keys(edges, fields=TRAVERSAL_FIELDS):
+    """
+    :param edges: The edge table of a saved graph
+    :type edges: macro_viewshed_analysis.graph.columnar.ColumnTable
+    :return: The edge attributes that hold traversal counts
+    :rtype: list[str]
+    """
+    return [key for key in edges.children() if all((key, field) in edges for field in fields)]
+
+
+def origin_membership(keys, origins):
+    """
+    :type keys: list[str]
+    :type origins: list[str]
+    :return: (keys, origins) array, True where the key is a run of the origin
+    :rtype: numpy.ndarray
+    """
+    return np.array([[key.startswith(origin) for origin in origins] for key in keys], dtype=bool).reshape(
+        len(keys), len(origins))
+
+
+def origin_rollups(edges, origins, fields=TRAVERSAL_FIELDS):
+    """
+    :type edges: macro_viewshed_analysis.graph.columnar.ColumnTable
+    :param origins: Prefixes of the run keys to sum
+    :type origins: list[str]
+    :type fields: tuple[str]
+    :return: (edges, origins, fields) sums, and (edges, origins) True where any of the origin's runs reached the edge
+    :rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    keys = run_keys(edges, fields)
+    membership = origin_membership(keys, origins)
+    counts = np.zeros((len(edges), len(origins), len(fields)), dtype=np.int64)
+    reached = np.zeros((len(edges), len(origins)), dtype=bool)
+    for key, belongs in zip(keys, membership):
+        columns = np.flatnonzero(belongs)
+        if not len(columns):
+            continue
+        values = np.column_stack([edges.sparse(key, field)[1] for field in fields])
+        rows = edges.sparse(key, fields[0])[0]
+        # Rows are unique within a key, so each origin column gets one add per edge
+        for column in columns.tolist():
+            counts[rows, column] += values
+            reached[rows, column] = True
+    return counts, reached
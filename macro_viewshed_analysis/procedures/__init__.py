@@ -1,28 +1,75 @@
 from arcgisscripting import Raster
+from os.path import exists
 
 import arcpy
+import numpy as np
 from arcpy import Exists, Buffer_analysis, Intersect_analysis, GridIndexFeatures_cartography, \
-    RasterToPolygon_conversion, RasterToMultipoint_3d, CreateFeatureclass_management, AddField_management
+    RasterToPolygon_conversion, RasterToMultipoint_3d, CreateFeatureclass_management, AddField_management, \
+    PolygonToRaster_conversion, env
 from arcpy.sa import Con
 
+from macro_viewshed_analysis.config import TableNames as T, AnalysisSettings as A
+from macro_viewshed_analysis.raster.bitmask import band_rows_for
+from macro_viewshed_analysis.raster.grid import load_grid
+from macro_viewshed_analysis.raster.islands import MAX_LABEL_CELLS, label_sea_levels
+from macro_viewshed_analysis.raster.sweep import carry_maxima, load_sweep_zones, save_sweep_zones, \
+    unchanged_zones, without_zones
+from macro_viewshed_analysis.raster.tiling import spatial_order
+from macro_viewshed_analysis.raster.zonal import HighestPoints, zonal_highest_cells
+from macro_viewshed_analysis.raster.zones import NO_ZONE, grid_labels, linear_unit_meters, split_zones
 from macro_viewshed_analysis.utils import get_output_loc, print_fields, in_mem, tmp_name, get_insert_cursor, \
-    get_search_cursor, get_field_names
+    get_search_cursor, get_field_names, raster_bands, raster_header, grid_to_raster, raster_to_grid
 
 
-def create_sea_level_island_polygons(base_raster, sea_level, output_to=None, overwrite_existing=False):
+def create_sea_level_island_labels(base_raster, sea_levels, folder, max_band_cells=MAX_LABEL_CELLS):
+    """
+    Label the islands at every sea level in one pass over the DEM, see raster.islands
+
+    :type base_raster: str
+    :type sea_levels: collections.Iterable[int]
+    :param folder: Where to save the label grids
+    :type folder: str
+    :param max_band_cells: Cells labelled at a time, which bounds memory use
+    :type max_band_cells: int
+    :return: Sea level -> label grid path
+    :rtype: dict[int, str]
+    """
+    r = Raster(base_raster)
+
+    def bands():
+        for start, band in raster_bands(r, band_rows_for(r.width, max_band_cells)):
+            band = band.astype(float)
+            if r.noDataValue is not None:
+                band[band == r.noDataValue] = np.nan
+            yield start, band
+
+    arcpy.AddMessage("Labelling islands at {} sea levels".format(len(set(sea_levels))))
+    return label_sea_levels(bands(), raster_header(r), sea_levels, folder)
+
+
+def create_sea_level_island_polygons(base_raster, sea_level, output_to=None, overwrite_existing=False, labels=None):
     """
 
     :param base_raster:
     :param sea_level:
     :param output_to:
+    :param labels: Label grid for this sea level from create_sea_level_island_labels. The polygons' gridcode is
+                   then the island's label, which stays the same from one sea level to the next.
+    :type labels: str
     :return: ['OBJECTID', 'Shape', 'Id', 'gridcode']
     """
     output_to = get_output_loc(output_to, 'islands')
     if Exists(output_to) and not overwrite_existing:
         return output_to, True
 
-    r = Raster(base_raster)
-    islands = Con(r > sea_level, 1, None)  # type: Raster
+    if labels is None:
+        r = Raster(base_raster)
+        islands = Con(r > sea_level, 1, None)  # type: Raster
+    else:
+        grid = load_grid(labels)
+        if grid.data.max() > np.iinfo(np.int32).max:
+            raise ValueError("Island labels in {} don't fit in an integer raster".format(labels))
+        islands = grid_to_raster(grid.like(grid.data.astype(np.int32), grid.nodata))
     islands_poly = RasterToPolygon_conversion(
         in_raster=islands,
         out_polygon_features=output_to,
@@ -212,3 +259,232 @@ def get_highest_points_from_multipoint_features(island_points, spatial_reference
         for row in highest.itervalues():
             insert_cursor.insertRow(row)
     return fp
+
+
+def get_highest_points_from_multipoint_arrays(island_points, spatial_reference, chunk_rows=10000):
+    """
+    Same output as get_highest_points_from_multipoint_features, but the vertices are read out as arrays a few
+    thousand multipoints at a time and the highest point per split island is found with a grouped argmax.
+
+    :type island_points: arcpy.FeatureSet
+    :type spatial_reference: arcpy.SpatialReference
+    :param chunk_rows: Multipoint rows read per chunk, which bounds memory use
+    :type chunk_rows: int
+    :rtype: arcpy.FeatureSet
+    """
+    fid_split = [x for x in get_field_names(island_points) if x.startswith('FID_split')][0]
+    oid_field = arcpy.Describe(island_points).OIDFieldName
+    fields = [T.X, T.Y, T.SHAPE_Z, T.ID, fid_split, T.ISLAND_GRID_ID]
+
+    with get_search_cursor(island_points, [T.ID]) as sc:
+        oids = sorted(oid for (oid,) in sc)
+
+    highest = HighestPoints()
+    for start in range(0, len(oids), chunk_rows):
+        chunk = oids[start:start + chunk_rows]
+        where = '{0} >= {1} AND {0} <= {2}'.format(
+            arcpy.AddFieldDelimiters(island_points, oid_field), min(chunk), max(chunk)
+        )
+        a = arcpy.da.FeatureClassToNumPyArray(island_points, fields, where_clause=where, explode_to_points=True)
+        highest.add(a[T.X], a[T.Y], a[T.SHAPE_Z], a[T.ID], a[fid_split], a[T.ISLAND_GRID_ID])
+
+    fp = create_high_point_table(spatial_reference)
+    with get_insert_cursor(fp, [T.XYZ, T.Z, T.ISLAND_ID, T.SPLIT_ISLAND_ID, T.ISLAND_GRID_ID]) as insert_cursor:
+        for row in highest.rows(spatial_order(highest['x'], highest['y'], A.VIEWPOINT_ORDER)):
+            insert_cursor.insertRow(row)
+    return fp
+
+
+def rasterize_split_islands(split_islands, dem, output_to=None):
+    """
+    Burn the split island OIDs (FID_split) into a raster aligned with the DEM
+
+    :type split_islands: str
+    :type dem: str
+    :type output_to: str
+    :rtype: str
+    """
+    return rasterize_oids(split_islands, dem, get_output_loc(output_to, 'split_zones'))
+
+
+def rasterize_islands(islands_poly, dem, output_to=None):
+    """
+    Burn the island OIDs (FID_islands) into a raster aligned with the DEM
+
+    :type islands_poly: str
+    :type dem: str
+    :type output_to: str
+    :rtype: str
+    """
+    return rasterize_oids(islands_poly, dem, get_output_loc(output_to, 'island_zones'))
+
+
+def rasterize_oids(features, dem, output_to):
+    """
+    :type features: str
+    :type dem: str
+    :type output_to: str
+    :rtype: str
+    """
+    previous = env.snapRaster, env.extent
+    env.snapRaster, env.extent = dem, dem
+    try:
+        PolygonToRaster_conversion(
+            in_features=features,
+            value_field=arcpy.Describe(features).OIDFieldName,
+            out_rasterdataset=output_to,
+            cell_assignment='CELL_CENTER',
+            cellsize=dem,
+        )
+    finally:
+        env.snapRaster, env.extent = previous
+    return output_to
+
+
+def dem_bands(dem, window_rows, band_starts=None):
+    """
+    Bands of rows from the DEM as float64, with nodata as nan
+
+    :type dem: str
+    :type window_rows: int
+    :param band_starts: First rows of the bands to read, defaults to all of them
+    :type band_starts: collections.Iterable[int]
+    :rtype: collections.Iterable[(int, numpy.ndarray)]
+    """
+    no_data = Raster(dem).noDataValue
+    for start, dem_block in raster_bands(dem, window_rows, band_starts=band_starts):
+        dem_block = dem_block.astype('float64')
+        if no_data is not None:
+            dem_block[dem_block == no_data] = float('nan')
+        yield start, dem_block
+
+
+def raster_windows(dem, zones, window_rows, nodata_zone=-1):
+    """
+    Aligned bands of rows from the DEM and zone rasters
+
+    :type dem: str
+    :param zones: A zone raster, or an array of zones on the DEM's cells
+    :type zones: str | numpy.ndarray
+    :type window_rows: int
+    :rtype: collections.Iterable[(int, int, numpy.ndarray, numpy.ndarray)]
+    """
+    if isinstance(zones, np.ndarray):
+        # Bands with no zone in them aren't read from the DEM
+        starts = [start for start in range(0, zones.shape[0], window_rows)
+                  if (zones[start:start + window_rows] != nodata_zone).any()]
+        for start, dem_block in dem_bands(dem, window_rows, starts):
+            yield start, 0, dem_block, zones[start:start + window_rows]
+        return
+    zone_bands = raster_bands(zones, window_rows, nodata_to_value=nodata_zone)
+    for start, dem_block in dem_bands(dem, window_rows):
+        _, zone_block = next(zone_bands)
+        yield start, 0, dem_block, zone_block
+
+
+def get_highest_points_from_raster_zones(dem, split_islands, spatial_reference, island_field='ORIG_FID',
+                                         window_rows=None):
+    """
+    The gridded_viewpoints table straight from the DEM: split islands are rasterized and the highest cell in each
+    is found a band of rows at a time, so the multipoint copy of the DEM is never made.
+
+    :type dem: str
+    :type split_islands: str
+    :type spatial_reference: arcpy.SpatialReference
+    :param island_field: Field of split_islands holding the island each piece came from
+    :type island_field: str
+    :type window_rows: int
+    :rtype: arcpy.FeatureSet
+    """
+    if window_rows is None:
+        window_rows = int(A.ZONE_WINDOW_ROWS)
+    zones = rasterize_split_islands(split_islands, dem, in_mem(tmp_name()))
+    maxima = zonal_highest_cells(raster_windows(dem, zones, window_rows))
+    arcpy.Delete_management(zones)
+
+    with get_search_cursor(split_islands, [T.ID, island_field, T.ISLAND_GRID_ID]) as sc:
+        split_attributes = dict((split, (island, grid)) for (split, island, grid) in sc)
+    return save_highest_cells(maxima, dem, split_attributes, spatial_reference)
+
+
+def get_highest_points_from_split_zones(dem, islands_poly, distance_to_shore, grid_width, grid_height,
+                                        spatial_reference, region_of_interest=None, window_rows=None,
+                                        sweep_zones=None, previous_sweep_zones=None):
+    """
+    The gridded_viewpoints table without the inner buffer, grid or split island polygons: the islands are
+    rasterized and cut into zones in the raster domain (see raster.zones), then the highest cell in each is found
+    as get_highest_points_from_raster_zones does.
+
+    :type dem: str
+    :type islands_poly: str
+    :param distance_to_shore: Width of the coastal band as a linear unit, e.g. '2 Kilometers'
+    :type distance_to_shore: str
+    :param grid_width: As a linear unit
+    :type grid_width: str
+    :type grid_height: str
+    :type spatial_reference: arcpy.SpatialReference
+    :type region_of_interest: str
+    :type window_rows: int
+    :param sweep_zones: Where to save the zones and their highest cells for the next sea level
+    :type sweep_zones: str
+    :param previous_sweep_zones: sweep_zones of the previous sea level. Split islands covering the same cells as
+        one there keep its viewpoint rather than being searched again.
+    :type previous_sweep_zones: str
+    :rtype: arcpy.FeatureSet
+    """
+    if window_rows is None:
+        window_rows = int(A.ZONE_WINDOW_ROWS)
+    islands = raster_to_grid(rasterize_islands(islands_poly, dem, in_mem(tmp_name())))
+    region = None
+    if region_of_interest is not None:
+        region = grid_labels(raster_to_grid(rasterize_oids(region_of_interest, dem, in_mem(tmp_name())))) != NO_ZONE
+    island_labels = grid_labels(islands)
+    zones, zone_island, zone_grid = split_zones(
+        island_labels, islands, linear_unit_meters(distance_to_shore),
+        linear_unit_meters(grid_width), linear_unit_meters(grid_height), region
+    )
+    arcpy.AddMessage("{} zones over {} islands".format(len(zone_island), len(np.unique(zone_island))))
+    land = island_labels != NO_ZONE
+    previous = None
+    if previous_sweep_zones is not None and exists(previous_sweep_zones):
+        previous = load_sweep_zones(previous_sweep_zones)
+        if previous['zones'].shape != zones.shape:
+            previous = None
+    if previous is None:
+        if previous_sweep_zones is not None:
+            arcpy.AddMessage("No zones saved for the previous sea level, searching every zone")
+        maxima = zonal_highest_cells(raster_windows(dem, zones, window_rows), NO_ZONE)
+    else:
+        carried = unchanged_zones(previous['zones'], zones)
+        maxima = zonal_highest_cells(raster_windows(dem, without_zones(zones, carried), window_rows), NO_ZONE)
+        reused = carry_maxima(maxima, previous, carried)
+        arcpy.AddMessage("{} cells changed between land and sea, {} of {} viewpoints carried forward "
+                         "({:.1%} reused)".format(int((previous['land'] != land).sum()), reused, len(maxima),
+                                                  reused / float(max(len(maxima), 1))))
+    if sweep_zones is not None:
+        save_sweep_zones(sweep_zones, land, zones, maxima)
+    split_attributes = dict(enumerate(zip(zone_island.tolist(), zone_grid.tolist())))
+    return save_highest_cells(maxima, dem, split_attributes, spatial_reference)
+
+
+def save_highest_cells(maxima, dem, split_attributes, spatial_reference):
+    """
+    :param maxima: From raster.zonal.zonal_highest_cells
+    :type maxima: macro_viewshed_analysis.raster.zonal.ZoneMaxima
+    :type dem: str
+    :param split_attributes: (island, grid) per zone
+    :type split_attributes: dict[int, (int, int)]
+    :type spatial_reference: arcpy.SpatialReference
+    :rtype: arcpy.FeatureSet
+    """
+    r = Raster(dem)
+    xs = r.extent.XMin + (maxima['col'] + 0.5) * r.meanCellWidth
+    ys = r.extent.YMax - (maxima['row'] + 0.5) * r.meanCellHeight
+    order = spatial_order(xs, ys, A.VIEWPOINT_ORDER)
+    fp = create_high_point_table(spatial_reference)
+    columns = [a[order].tolist() for a in (xs, ys, maxima['z'], maxima['zone'])]
+    with get_insert_cursor(fp, [T.XYZ, T.Z, T.ISLAND_ID, T.SPLIT_ISLAND_ID, T.ISLAND_GRID_ID]) as insert_cursor:
+        for x, y, z, split in zip(*columns):
+            island, grid = split_attributes[split]
+            insert_cursor.insertRow(((x, y, z), z, island, split, grid))
+    return fp
@@ -1,12 +1,24 @@
 import logging
 from contextlib import contextmanager
+from os.path import join, splitext
 
 import arcpy
 import click
-import networkx as nx
+import numpy as np
 
-from macro_viewshed_analysis.config import TableNames as T
-from macro_viewshed_analysis.utils import get_search_cursor, get_insert_cursor
+from macro_viewshed_analysis.config import SaveLocations as S, TableNames as T
+from macro_viewshed_analysis.graph.builder import build_network_from_rows
+from macro_viewshed_analysis.graph.columnar import open_graph_columns, write_graph
+from macro_viewshed_analysis.graph.matrix import VisibilityMatrixBuilder, save_visibility_matrix, seen_islands
+from macro_viewshed_analysis.graph.rows import ROW_SOURCES
+from macro_viewshed_analysis.graph.traversals import origin_rollups
+from macro_viewshed_analysis.procedures import rasterize_islands
+from macro_viewshed_analysis.procedures.polylines import NETWORK_FIELDS, POLYLINE_WRITERS, TRAVERSAL_FIELDS, \
+    batches, get_polyline_writer
+from macro_viewshed_analysis.procedures.viewshed import update_observer_index
+from macro_viewshed_analysis.raster.bitmask import grid_header
+from macro_viewshed_analysis.raster.zones import grid_labels
+from macro_viewshed_analysis.utils import get_search_cursor, raster_to_grid, reproject
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -60,102 +72,188 @@ def get_viewshed_centroid(viewsheds_feature, island_a_id, island_b_id):
         return sc.next()
 
 
-def build_network(viewsheds_feature, islands_feature):
+def get_viewshed_rows(viewsheds_feature):
     """
+    Every row of the viewsheds feature in one cursor
 
     :type viewsheds_feature: str
+    :rtype: collections.Iterable[(int, int, (float, float), float)]
+    """
+    fields = [T.ISLAND_ID, T.INTERSECTED_ISLAND_ID, T.CENTROID, T.SHAPE_AREA]
+    with get_search_cursor(viewsheds_feature, fields) as sc:
+        for i, row in enumerate(sc):
+            if i % 100000 == 0:
+                logger.debug("Row: %d A: %d B: %d", i, row[0], row[1])
+            yield row
+
+
+def get_row_source(viewsheds):
+    """
+    CSV and .npz exports are read directly (see graph.rows), anything else is treated as a feature class
+
+    :type viewsheds: str
+    :rtype: collections.Iterable[(int, int, (float, float), float)]
+    """
+    source = ROW_SOURCES.get(splitext(viewsheds)[1].lower(), get_viewshed_rows)
+    return source(viewsheds)
+
+
+def build_visibility_matrix(viewpoints, workspace, islands_poly, dem, save_to=None, log_every=1000,
+                            overwrite_existing=False):
+    """
+    The island x island matrix landmass_polys would sum to, from the observer index and a raster of the islands
+    rather than polygonizing and intersecting every viewshed
+
+    :type viewpoints: str
+    :type workspace: str
+    :type islands_poly: str
+    :param dem: The DEM the viewsheds were run on
+    :type dem: str
+    :param save_to: Defaults to the workspace's viewsheds folder
+    :type save_to: str
+    :type log_every: int
+    :param overwrite_existing: Index every viewshed again
+    :type overwrite_existing: bool
+    :return: Where the matrix was saved
+    :rtype: str
+    """
+    if save_to is None:
+        save_to = join(workspace, S.FOLDER_VIEWSHEDS, S.VISIBILITY_MATRIX)
+    index = update_observer_index(viewpoints, workspace, overwrite_existing)
+    runs_header = index.header
+    if runs_header is None:
+        raise ValueError('No viewsheds have been indexed in {}'.format(workspace))
+
+    arcpy.AddMessage("Rasterizing islands")
+    labels = raster_to_grid(rasterize_islands(islands_poly, reproject(dem)))
+    labels_header = grid_header(labels)
+    label_data = grid_labels(labels)
+
+    builder = VisibilityMatrixBuilder(labels.cell_width * labels.cell_height)
+    for i, location in enumerate(index.locations()):
+        if i % log_every == 0:
+            arcpy.AddMessage("Observer {} on island {}".format(location.viewpoint_id, location.island))
+        builder.add(location.island, *seen_islands(index.runs(location), runs_header, label_data, labels_header))
+    index.close()
+
+    matrix = builder.matrix()
+    save_visibility_matrix(matrix, save_to)
+    arcpy.AddMessage("Saved {} island pairs over {} islands to {}".format(len(matrix), len(matrix.islands), save_to))
+    return save_to
+
+
+def build_network(viewsheds_feature, islands_feature=None, rows=None):
+    """
+    :param viewsheds_feature: The edge areas are summed from this
+    :type viewsheds_feature: str
+    :param islands_feature: The edge ends are read from this in one pass, defaults to the viewsheds themselves
     :type islands_feature: str
+    :param rows: Where to read the viewshed rows from, defaults to get_row_source(viewsheds_feature)
+    :type rows: collections.Iterable[(int, int, (float, float), float)]
     :rtype: networkx.DiGraph
     """
-    d = nx.DiGraph()
+    if rows is None:
+        rows = get_row_source(viewsheds_feature)
+    centroid_rows = None if islands_feature is None else get_row_source(islands_feature)
+    return build_network_from_rows(rows, centroid_rows)
 
-    with get_island_viewsheds(viewsheds_feature) as search_cursor:
-        for i, (island_a_id, island_b_id, area) in enumerate(search_cursor):
-            if i % 100000 == 0:
-                logger.debug("Row: %d A: %d B: %d", i, island_a_id, island_b_id)
-            if island_a_id != island_b_id:
-                if island_a_id in d and island_b_id in d[island_a_id]:
-                    d[island_a_id][island_b_id]['area'] += float(area)
-                else:
-                    try:
-                        ((island_a_x, island_a_y),) = get_viewshed_centroid(islands_feature, island_b_id, island_a_id)
-                    except StopIteration:
-                        continue
-                    try:
-                        ((island_b_x, island_b_y),) = get_viewshed_centroid(islands_feature, island_a_id, island_b_id)
-                    except StopIteration:
-                        continue
-                    d.add_edge(
-                        island_a_id, island_b_id, {
-                            'area': float(area),
-                            'a': (island_a_x, island_a_y),
-                            'b': (island_b_x, island_b_y)
-                        }
-                    )
-    return d
-
-
-def create_network_feature(workspace, output_name, islands_feature):
+
+def edge_arrays(graph):
+    """
+    :type graph: networkx.DiGraph
+    :return: (x0, y0, x1, y1) per edge from its a and b ends, and its island_A, island_B and A_sees_B values
+    :rtype: (numpy.ndarray, list[numpy.ndarray])
+    """
+    edges = list(graph.edges(data=True))
+    ends = np.array([data['a'] + data['b'] for _, _, data in edges], dtype=np.float64).reshape(-1, 4)
+    attributes = [
+        np.array([a for a, _, _ in edges], dtype=np.int64),
+        np.array([b for _, b, _ in edges], dtype=np.int64),
+        np.array([data['area'] for _, _, data in edges], dtype=np.float64),
+    ]
+    return ends, attributes
+
+
+def visualise_network(graph, workspace, output_name, islands_feature, writer='arcpy'):
     """
-    :type workspace: str
     :type output_name: str
     :type islands_feature: str
+    :type workspace: str
+    :type graph: networkx.DiGraph
+    :param writer: One of procedures.polylines.POLYLINE_WRITERS
+    :type writer: str
+    :return: The feature class written
     :rtype: str
     """
+    ends, attributes = edge_arrays(graph)
     spatial_reference = arcpy.Describe(islands_feature).spatialReference
-    network = arcpy.CreateFeatureclass_management(
-        workspace, output_name, "POLYLINE", spatial_reference=spatial_reference
-    )
-    arcpy.AddField_management(network, T.A, field_type='LONG')
-    arcpy.AddField_management(network, T.B, field_type='LONG')
-    arcpy.AddField_management(network, T.A2B, field_type='DOUBLE')
-    return network
+    with get_polyline_writer(writer, workspace, output_name, NETWORK_FIELDS, spatial_reference) as network:
+        for batch in batches(len(ends)):
+            network.write(ends[batch], [a[batch] for a in attributes])
+    return network.path
 
 
-def visualise_network(graph, workspace, output_name, islands_feature):
+def visualise_origin_traversals(graph_path, workspace, output_names, spatial_reference, writer='arcpy'):
     """
-    :type output_name: str
-    :type islands_feature: str
+    One polyline feature class per origin of the edges its runs reached, with the traversal and path counts summed
+    over the origin's runs. Every origin is summed at once and written in a single pass over the edges.
+
+    :param graph_path: An ABM traversal graph, as a gpickle or saved by graph.columnar.write_graph
+    :type graph_path: str
     :type workspace: str
-    :type graph: networkx.DiGraph
-    :rtype: arcpy.FeatureSet
+    :param output_names: Feature class name per origin
+    :type output_names: collections.OrderedDict[str, str]
+    :type spatial_reference: arcpy.SpatialReference
+    :param writer: One of procedures.polylines.POLYLINE_WRITERS
+    :type writer: str
+    :return: The feature classes written
+    :rtype: list[str]
     """
-    point = arcpy.Point()
-    array = arcpy.Array()
+    origins = list(output_names)
+    columns = open_graph_columns(graph_path)
+    counts, reached = origin_rollups(columns.edges, origins)
+    edges = np.flatnonzero(reached.any(axis=1))
 
-    network = create_network_feature(workspace, output_name, islands_feature)
+    a, b = columns.a[edges], columns.b[edges]
+    area = columns.edges.column('area')[edges]
+    ends = np.column_stack([columns.edges.column(end, axis)[edges] for end in ('a', 'b') for axis in ('x', 'y')])
+    counts, reached = counts[edges], reached[edges]
 
-    with get_insert_cursor(network, [T.SHAPE, T.A, T.B, T.A2B]) as cursor:
-        for (island_a_id, island_b_id, data) in graph.edges_iter(data=True):
-            for fid in ['a', 'b']:
-                point.X = data[fid][0]
-                point.Y = data[fid][1]
-                array.add(point)
-            polyline = arcpy.Polyline(array)
-            array.removeAll()
-            cursor.insertRow((polyline, island_a_id, island_b_id, data['area']))
-    return network
+    writers = []
+    try:
+        for origin in origins:
+            writers.append(get_polyline_writer(writer, workspace, output_names[origin], TRAVERSAL_FIELDS,
+                                               spatial_reference))
+        for batch in batches(len(edges)):
+            for o, network in enumerate(writers):
+                rows = np.flatnonzero(reached[batch, o]) + batch.start
+                network.write(ends[rows], [a[rows], b[rows], area[rows], counts[rows, o, 0], counts[rows, o, 1]])
+    finally:
+        for network in writers:
+            network.close()
+    return [network.path for network in writers]
 
 
 @click.command()
 @click.option('--overwrite/--no-overwrite', default=False)
-@click.option('--save-graph', default=None, type=click.Path())
+@click.option('--save-graph', default=None, type=click.Path(), help='Folder to save the graph to, see graph.columnar')
 @click.option('--make-shape', default=None, type=click.STRING)
+@click.option('--writer', default='arcpy', type=click.Choice(sorted(POLYLINE_WRITERS)))
 @click.argument('workspace',
                 type=click.Path(exists=True, file_okay=False, dir_okay=True, resolve_path=True, writable=True))
 @click.argument('viewsheds', type=click.STRING)
 @click.argument('islands', type=click.STRING)
-def build_and_output_network(workspace, viewsheds, islands, overwrite, save_graph, make_shape):
+def build_and_output_network(workspace, viewsheds, islands, overwrite, save_graph, make_shape, writer):
     arcpy.CheckOutExtension("Spatial")
     arcpy.env.workspace = workspace
     arcpy.env.overwriteOutput = overwrite
 
     g = build_network(viewsheds, islands)
     if save_graph is not None:
-        nx.write_weighted_edgelist(g, save_graph)
+        write_graph(g, save_graph)
         logger.info("SUCCESS: graph saved to %s", save_graph)
     if make_shape:
-        network = visualise_network(g, workspace, make_shape, islands)
+        network = visualise_network(g, workspace, make_shape, islands, writer)
         logger.info("SUCCESS: output written to %s", network)
 
 
@@ -0,0 +1,96 @@
+"""
+Writers for the network's edges as two point polylines, fed with coordinate arrays in batches.
+
+Both take (x0, y0, x1, y1) per line and one array per attribute field. The 'arcpy' writer inserts into any feature
+class ArcGIS can create, passing each line as WKB so no Point, Array or Polyline objects are made. The 'shapefile'
+writer (storage.shapefile) lays each batch out in memory and writes it straight to disk without arcpy, but can only
+write shapefiles.
+"""
+from os.path import join, splitext
+
+import arcpy
+
+from macro_viewshed_analysis.config import TableNames as T
+from macro_viewshed_analysis.storage.shapefile import ShapefilePolylineWriter, line_wkb
+
+SHAPE_WKB = 'SHAPE@WKB'
+
+# Edges written per batch
+BATCH_EDGES = 100000
+
+NETWORK_FIELDS = [(T.A, 'LONG'), (T.B, 'LONG'), (T.A2B, 'DOUBLE')]
+TRAVERSAL_FIELDS = NETWORK_FIELDS + [(T.TRAVERSALS, 'LONG'), (T.PATHS, 'LONG')]
+
+
+class ArcpyPolylineWriter(object):
+    def __init__(self, workspace, output_name, fields, spatial_reference):
+        """
+        :type workspace: str
+        :type output_name: str
+        :param fields: (name, type) per attribute, type being an AddField_management field type
+        :type fields: list[(str, str)]
+        :type spatial_reference: arcpy.SpatialReference
+        """
+        self.path = arcpy.CreateFeatureclass_management(
+            workspace, output_name, "POLYLINE", spatial_reference=spatial_reference
+        ).getOutput(0)
+        for name, field_type in fields:
+            arcpy.AddField_management(self.path, name, field_type=field_type)
+        self.cursor = arcpy.da.InsertCursor(self.path, [SHAPE_WKB] + [name for name, _ in fields])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, ends, attributes):
+        """
+        :param ends: (x0, y0, x1, y1) per line
+        :type ends: numpy.ndarray
+        :param attributes: One array per field
+        :type attributes: list[numpy.ndarray]
+        """
+        for row in zip(line_wkb(ends), *[a.tolist() for a in attributes]):
+            self.cursor.insertRow(row)
+
+    def close(self):
+        # Releases the cursor's lock
+        del self.cursor
+
+
+class ShapefileWriter(ShapefilePolylineWriter):
+    def __init__(self, workspace, output_name, fields, spatial_reference):
+        """
+        :type workspace: str
+        :type output_name: str
+        :type fields: list[(str, str)]
+        :type spatial_reference: arcpy.SpatialReference
+        """
+        self.path = join(workspace, splitext(output_name)[0] + '.shp')
+        # exportToString gives the WKT followed by the coordinate domains
+        prj = spatial_reference.exportToString().split(';')[0] if spatial_reference is not None else None
+        super(ShapefileWriter, self).__init__(self.path, fields, prj)
+
+
+POLYLINE_WRITERS = {
+    'arcpy': ArcpyPolylineWriter,
+    'shapefile': ShapefileWriter,
+}
+
+
+def get_polyline_writer(name, workspace, output_name, fields, spatial_reference):
+    """
+    :param name: One of POLYLINE_WRITERS
+    :type name: str
+    :rtype: ArcpyPolylineWriter | ShapefileWriter
+    """
+    return POLYLINE_WRITERS[name](workspace, output_name, fields, spatial_reference)
+
+
+def batches(count, size=BATCH_EDGES):
+    """
+    :rtype: collections.Iterable[slice]
+    """
+    for start in range(0, count, size):
+        yield slice(start, min(start + size, count))
@@ -0,0 +1,112 @@
+"""
+Runs observer groups on a pool of worker processes.
+
+The viewpoint table is split into groups up front by plan_viewshed_jobs, as run_all_viewsheds does, so each group
+still lands in viewshed_{:04d} and a run can be resumed by either.
+Worker processes need their own arcpy, so run this from a script or the CLI rather than inside ArcMap.
+"""
+import multiprocessing
+
+import arcpy
+from arcpy import Describe, Raster, env
+from arcpy.sa import Con
+
+from macro_viewshed_analysis.config import AnalysisSettings as A
+from macro_viewshed_analysis.procedures.viewshed import observer_tables, create_viewshed_folders, \
+    get_viewshed_engine, save_surface_header, job_progress_logger, uses_horizon, plan_viewshed_jobs, \
+    run_multi_viewshed
+from macro_viewshed_analysis.storage.jobs import JobStore, run_jobs
+from macro_viewshed_analysis.storage.stage_cache import fingerprint_path
+from macro_viewshed_analysis.utils import reproject, raster_header
+
+# Per process state, set up once by _init_worker
+_worker = {}
+
+
+def _init_worker(dem, sea_level, spatial_reference, folders, viewshed_engine, overwrite_existing, source):
+    arcpy.CheckOutExtension("Spatial")
+    arcpy.CheckOutExtension("3D")
+    env.overwriteOutput = True
+
+    sr = arcpy.SpatialReference()
+    sr.loadFromString(spatial_reference)
+    engine = get_viewshed_engine(viewshed_engine)
+    r = Raster(dem)
+    surface = engine.prepare_surface(Con(r > sea_level, r, sea_level))
+    if uses_horizon(engine):
+        # Built by run_all_viewsheds_parallel before the pool started, so this only maps it in
+        engine.prepare_horizon(surface, folders[0], sea_level, source)
+
+    _worker.update(
+        scratch=observer_tables(sr),
+        folders=folders,
+        engine=engine,
+        surface=surface,
+        overwrite_existing=overwrite_existing,
+    )
+
+
+def run_viewshed_job(job):
+    """
+    run_multi_viewshed with this worker's outputs, surface and engine
+
+    :type job: macro_viewshed_analysis.procedures.viewshed.ViewshedJob
+    :rtype: macro_viewshed_analysis.procedures.viewshed.ViewshedResult
+    """
+    return run_multi_viewshed(job, *_worker['folders'], sea_level_raster=_worker['surface'],
+                              scratch=_worker['scratch'], overwrite_existing=_worker['overwrite_existing'],
+                              viewshed_engine=_worker['engine'])
+
+
+def run_all_viewsheds_parallel(sea_level, ws, viewpoints, dem, spatial_reference=None, overwrite_existing=False,
+                               viewshed_engine=None, workers=None, failed_only=False):
+    """
+    :param workers: Number of worker processes, defaults to one per CPU
+    :type workers: int
+    :param failed_only: Run only the groups in the failure queue of an earlier run
+    :type failed_only: bool
+    :return: The last result of each observer group, a ViewshedResult or a storage.jobs.JobFailure, ordered by
+        viewshed number
+    :rtype: list
+    """
+    if spatial_reference is None:
+        spatial_reference = Describe(dem).spatialReference
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    engine = get_viewshed_engine(viewshed_engine)  # Fail here, not in every worker, if it can't run the group size
+
+    dem = reproject(dem)
+    folders = create_viewshed_folders(ws)
+    header = raster_header(dem)
+    save_surface_header(folders[0], header)
+    store = JobStore(folders[0])
+
+    arcpy.AddMessage("getting points")
+    jobs = plan_viewshed_jobs(viewpoints)
+    if failed_only:
+        failed = set(store.failed())
+        jobs = [job for job in jobs if job.number in failed]
+    arcpy.AddMessage("{} viewpoints in {} rasters on {} workers".format(
+        sum(len(job.rows) for job in jobs), len(jobs), workers))
+
+    source = fingerprint_path(dem)
+    if uses_horizon(engine):
+        # Built once here rather than by every worker
+        r = Raster(dem)
+        engine.prepare_horizon(engine.prepare_surface(Con(r > sea_level, r, sea_level)), folders[0], sea_level,
+                               source, overwrite_existing)
+
+    # Failed groups may have left some of their outputs behind, so a re-run writes over them
+    pool = multiprocessing.Pool(
+        workers, _init_worker,
+        (dem, sea_level, spatial_reference.exportToString(), folders, viewshed_engine,
+         overwrite_existing or failed_only, source)
+    )
+    try:
+        results = run_jobs(jobs, run_viewshed_job, store, pool, workers, int(A.JOB_ATTEMPTS),
+                           float(A.JOB_BACKOFF_SECONDS), job_progress_logger(len(jobs), header))
+    finally:
+        pool.close()
+        pool.join()
+    arcpy.AddMessage(store.report())
+    return [results[number] for number in sorted(results)]
@@ -1,93 +1,135 @@
-from os.path import join
+from os.path import split, splitext
 
 import arcpy
 
+from macro_viewshed_analysis import profiling
 from macro_viewshed_analysis.config import TableNames as T, SaveLocations as S
-from macro_viewshed_analysis.utils import OBSERVER_GROUP_SIZE, get_search_cursor as gsc, get_insert_cursor as gic, \
-    tmp_name
-
-
-def save_table(fp, save_to):
-    arcpy.AddMessage('Saving')
-    try:
-        if arcpy.Exists(save_to):
-            arcpy.Append_management(fp, save_to)
-            arcpy.AddMessage('New data appended to {}'.format(save_to))
-        else:
-            arcpy.CopyFeatures_management(fp, save_to)
-            arcpy.AddMessage('New data saved to {}'.format(save_to))
-    except Exception as e:
-        arcpy.AddMessage('Failed to save data: {}'.format(e.message))
+from macro_viewshed_analysis.storage.checkpoint import BYTES, CheckpointStore, CheckpointWriter
+from macro_viewshed_analysis.utils import OBSERVER_GROUP_SIZE, get_search_cursor as gsc, get_insert_cursor as gic
+
+CHECKPOINT_COLUMNS = [
+    (T.SHAPE, BYTES),
+    (T.ISLAND_ID, 'int64'),
+    (T.SPLIT_ISLAND_ID, 'int64'),
+    (T.ISLAND_GRID_ID, 'int64'),
+    (T.VIEWPOINT_ID, 'int64'),
+]
+
+
+def open_checkpoint(save_to):
+    """
+    The checkpoint store that sits next to save_to, e.g. va_polygons_checkpoint for va_polygons.shp
+
+    :type save_to: str
+    :rtype: CheckpointStore
+    """
+    return CheckpointStore('{}_checkpoint'.format(splitext(save_to)[0]), CHECKPOINT_COLUMNS, T.VIEWPOINT_ID)
+
+
+def create_table(save_to, spatial_reference):
+    save_dir, name = split(save_to)
+    fp = arcpy.CreateFeatureclass_management(save_dir, name, 'POLYGON', spatial_reference=spatial_reference)
+    arcpy.AddField_management(fp, T.ISLAND_ID, field_type='LONG')
+    arcpy.AddField_management(fp, T.SPLIT_ISLAND_ID, field_type='LONG')
+    arcpy.AddField_management(fp, T.ISLAND_GRID_ID, field_type='LONG')
+    arcpy.AddField_management(fp, T.VIEWPOINT_ID, field_type='LONG')
+    return fp
 
 
-def get_or_create_table(save_to, spatial_reference):
-    if arcpy.Exists(save_to):
-        fp = arcpy.CopyFeatures_management(save_to, join(T.IN_MEMORY, tmp_name()))
-    else:
-        fp = arcpy.CreateFeatureclass_management(
-            T.IN_MEMORY, tmp_name(), 'POLYGON', spatial_reference=spatial_reference
-        )
-
-        arcpy.AddField_management(fp, T.ISLAND_ID, field_type='LONG')
-        arcpy.AddField_management(fp, T.SPLIT_ISLAND_ID, field_type='LONG')
-        arcpy.AddField_management(fp, T.ISLAND_GRID_ID, field_type='LONG')
-        arcpy.AddField_management(fp, T.VIEWPOINT_ID, field_type='LONG')
-    return fp
+def last_completed_viewpoint(fp):
+    """
+    :return: The highest viewpoint id saved in fp, or None if it's empty
+    :rtype: int
+    """
+    if int(arcpy.GetCount_management(fp).getOutput(0)) > 0:
+        return max(p for (p,) in arcpy.da.SearchCursor(fp, [T.VIEWPOINT_ID]))
+    return None
 
 
 def generate_last_completed_query(fp, viewpoints):
-    if int(arcpy.GetCount_management(fp).getOutput(0)) > 0:
-        highest_point = max(p for (p,) in arcpy.da.SearchCursor(fp, [T.VIEWPOINT_ID]))
+    highest_point = last_completed_viewpoint(fp)
+    if highest_point is not None:
         qry = """{} > {}""".format(arcpy.AddFieldDelimiters(viewpoints, T.FID), highest_point)
     else:
         qry = None
     return qry
 
 
-def log_and_save(fp, save_to, i, log_every, save_every):
+def generate_resume_query(store, viewpoints, save_to):
+    """
+    Resume after the checkpoint's high-water mark. Tables saved before there were checkpoints are scanned instead.
+
+    :type store: CheckpointStore
+    :type viewpoints: str
+    :type save_to: str
+    :rtype: str
+    """
+    if store.high_water is not None:
+        return """{} > {}""".format(arcpy.AddFieldDelimiters(viewpoints, T.FID), store.high_water)
+    if arcpy.Exists(save_to):
+        return generate_last_completed_query(save_to, viewpoints)
+    return None
+
+
+def log_and_save(writer, i, log_every, save_every):
     if log_every and i % log_every == 0:
         arcpy.AddMessage("Viewpoint: {}".format(i))
-        if save_every and i % save_every == 0:
-            save_table(fp, save_to)
+    if save_every and i % save_every == 0 and len(writer):
+        writer.flush()
+        arcpy.AddMessage('Checkpoint saved at viewpoint {}'.format(writer.store.high_water))
 
 
-def clean_up(fp, save_to, failed):
+def materialize_checkpoint(store, save_to, spatial_reference):
+    """
+    Copy the checkpointed rows that aren't in save_to yet into it
+
+    :type store: CheckpointStore
+    :type save_to: str
+    :type spatial_reference: arcpy.SpatialReference
+    """
+    if not arcpy.Exists(save_to):
+        create_table(save_to, spatial_reference)
+    insert_table_cols = [T.SHAPE, T.ISLAND_ID, T.SPLIT_ISLAND_ID, T.ISLAND_GRID_ID, T.VIEWPOINT_ID]
+    with gic(save_to, insert_table_cols) as ic:
+        for row in store.unmaterialized_rows():
+            ic.insertRow((arcpy.FromWKB(bytearray(row[0])),) + tuple(row[1:]))
+    store.mark_materialized()
+
+
+def clean_up(writer, save_to, spatial_reference, failed):
     arcpy.AddMessage('Saving')
     try:
-        if arcpy.Exists(save_to):
-            arcpy.Append_management(fp, save_to)
-            arcpy.AddMessage('New data appended to {}'.format(save_to))
-        else:
-            arcpy.CopyFeatures_management(fp, save_to)
-            arcpy.AddMessage('New data saved to {}'.format(save_to))
+        writer.flush()
+        materialize_checkpoint(writer.store, save_to, spatial_reference)
+        arcpy.AddMessage('New data saved to {}'.format(save_to))
     except Exception as e:
         arcpy.AddMessage('Failed to save data: {}'.format(e.message))
     arcpy.AddMessage('Failed: {}'.format(failed))
     arcpy.AddMessage('Done!')
 
 
+@profiling.timed('poly to table')
 def poly_to_table(viewpoints, save_to, spatial_reference, log_every=100, save_every=5000,
                   observer_group_size=OBSERVER_GROUP_SIZE):
     failed = []
-    fp = get_or_create_table(save_to, spatial_reference)
-    qry = generate_last_completed_query(fp, viewpoints)
+    writer = CheckpointWriter(open_checkpoint(save_to))
+    qry = generate_resume_query(writer.store, viewpoints, save_to)
 
     arcpy.AddMessage('Starting')
-    insert_table_cols = [T.SHAPE, T.ISLAND_ID, T.SPLIT_ISLAND_ID, T.ISLAND_GRID_ID, T.VIEWPOINT_ID]
     search_table_cols = [T.ISLAND_ID, T.SPLIT_ISLAND_ID, T.ISLAND_GRID_ID, T.ID]
-    with gic(fp, insert_table_cols) as ic, gsc(viewpoints, search_table_cols, qry) as sc:
+    with gsc(viewpoints, search_table_cols, qry) as sc:
         try:
             for i, (island_id, split_island_id, grid_id, point_id) in enumerate(sc):
-                log_and_save(fp, save_to, i, log_every, save_every)
+                log_and_save(writer, i, log_every, save_every)
                 vs_num, index = divmod(point_id, observer_group_size)
                 vs_num += 1  # Viewsheds are 1 indexed
                 vs = S.individual_viewshed_polygon_save_location(vs_num, index)
                 try:
                     with gsc(vs, [T.SHAPE]) as vs_sc:
                         for (poly,) in vs_sc:
-                            ic.insertRow((poly, island_id, split_island_id, grid_id, point_id))
+                            writer.add((poly.WKB, island_id, split_island_id, grid_id, point_id))
                 except Exception as e:
                     arcpy.AddError('Failed! vs_num={}, point_id=point_id={}. {}'.format(vs_num, point_id, e.message))
                     failed.append((i, island_id, split_island_id, grid_id, point_id, e.__class__.__name__, e.message))
         finally:
-            clean_up(fp, save_to, failed)
+            clean_up(writer, save_to, spatial_reference, failed)
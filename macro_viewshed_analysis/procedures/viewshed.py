@@ -1,15 +1,44 @@
+from collections import namedtuple
 from genericpath import exists
-from math import ceil
+from functools import partial
+from itertools import groupby
+from timeit import default_timer
 from os import makedirs
-from os.path import join
+from os.path import getmtime, getsize, join, split
 
 import arcpy
+import numpy as np
 from arcpy import Describe, Raster, env
-from arcpy.da import InsertCursor, SearchCursor
+from arcpy.da import SearchCursor
 from arcpy.sa import BitwiseAnd, Con
 
-from macro_viewshed_analysis.config import SaveLocations as S, TableNames as T
-from macro_viewshed_analysis.utils import OBSERVER_GROUP_SIZE, get_search_cursor, reproject, tmp_name
+from macro_viewshed_analysis import profiling
+from macro_viewshed_analysis.config import AnalysisSettings as A, SaveLocations as S, TableNames as T, \
+    ViewshedParameters as V
+from macro_viewshed_analysis.procedures.shape2table import generate_resume_query, \
+    log_and_save, open_checkpoint, clean_up, last_completed_viewpoint
+from macro_viewshed_analysis.raster.bitmask import MAX_BAND_CELLS, band_rows_for, extract_observer_runs, runs_path, \
+    save_observer_runs, load_observer_runs, grid_header, rebase_runs, save_surface_header, \
+    load_surface_header
+from macro_viewshed_analysis.raster.bitset import INT32_OBSERVERS, int32_bit, observer_plane
+from macro_viewshed_analysis.raster.horizon import cached_max_pyramid
+from macro_viewshed_analysis.raster.los import viewshed_bitmask, viewshed_bitset
+from macro_viewshed_analysis.raster.polygonize import index_polygon_records
+from macro_viewshed_analysis.raster.tiling import observer_window, window_cells, window_extent
+from macro_viewshed_analysis.storage.checkpoint import CheckpointWriter
+from macro_viewshed_analysis.storage.jobs import FAILED, PENDING, JobStore, run_jobs
+from macro_viewshed_analysis.storage.observer_index import ObserverIndex
+from macro_viewshed_analysis.storage.stage_cache import fingerprint_path, newest_mtime
+from macro_viewshed_analysis.utils import OBSERVER_GROUP_SIZE, get_search_cursor, reproject, tmp_name, \
+    raster_to_grid, grid_to_raster, raster_bands, raster_header, get_insert_cursor, ScratchTablePool
+
+
+# Viewpoint fields read for each observer, and the observer table's fields, which add its number in the group
+VIEWPOINT_FIELDS = [T.XYZ, T.Z, T.ISLAND_ID, T.SPLIT_ISLAND_ID, T.ISLAND_GRID_ID, T.ID]
+OBSERVER_FIELDS = [T.XYZ, T.Z, T.ISLAND_ID, T.SPLIT_ISLAND_ID, T.ISLAND_GRID_ID, T.VIEWPOINT_ID, T.OBSERVER]
+
+ViewshedJob = namedtuple('ViewshedJob', ['number', 'rows'])
+ViewshedResult = namedtuple('ViewshedResult', ['number', 'observers', 'seconds', 'skipped', 'error', 'bytes_read'])
 
 
 def create_temp_point_table(spatial_reference):
@@ -26,156 +55,378 @@ def create_temp_point_table(spatial_reference):
     return fp
 
 
-def reset_tmp(spatial_reference, to_replace=None):
-    if to_replace is not None:
-        arcpy.Delete_management(to_replace)
-    tmp_tbl = create_temp_point_table(spatial_reference)
-    insert_cursor = InsertCursor(
-        tmp_tbl,
-        [
-            T.SHAPE,
-            T.Z,
-            T.ISLAND_ID,
-            T.SPLIT_ISLAND_ID,
-            T.ISLAND_GRID_ID,
-            T.VIEWPOINT_ID,
-            T.OBSERVER
-        ]
-    )
-    return tmp_tbl, insert_cursor
+def observer_tables(spatial_reference):
+    """
+    :rtype: ScratchTablePool
+    """
+    return ScratchTablePool(partial(create_temp_point_table, spatial_reference))
 
 
-def run_multi_viewshed(tmp_table, d, m,
-                       viewshed_folder, point_table_folder, tmp_table_folder, sea_level_raster, spatial_reference,
-                       total_rasters,
-                       overwrite_existing=False):
-    c = d + int(m > 0)
+class ArcpyViewshedEngine(object):
+    """
+    The licensed Viewshed2_3d tool
+    """
+    header = None
+    # Viewshed2_3d packs its OBSERVERS output into a 32 bit raster
+    max_observers = INT32_OBSERVERS
+
+    def prepare_surface(self, sea_level_raster):
+        self.header = raster_header(sea_level_raster)
+        return sea_level_raster
+
+    def run(self, surface, observers, save_raster_to, save_observer_relations_to, window=None):
+        """
+        :param window: (row start, row stop, col start, col stop) of the surface to run over, None for all of it
+        :type window: (int, int, int, int)
+        """
+        previous = env.extent
+        if window is not None:
+            env.extent = arcpy.Extent(*window_extent(self.header, window))
+        try:
+            self._run(surface, observers, save_raster_to, save_observer_relations_to)
+        finally:
+            env.extent = previous
+
+    def _run(self, surface, observers, save_raster_to, save_observer_relations_to):
+        arcpy.Viewshed2_3d(
+            in_raster=surface,
+            in_observer_features=observers,
+            out_raster=save_raster_to,
+            out_agl_raster=None,
+            analysis_type="OBSERVERS",
+            vertical_error="0 Meters",
+            out_observer_region_relationship_table=save_observer_relations_to,
+            refractivity_coefficient=V.REFRACTIVITY_COEFFICIENT,
+            surface_offset="0 Meters",
+            observer_elevation=T.Z,
+            observer_offset="{} Meters".format(V.OBSERVER_OFFSET_METERS),
+            inner_radius=None,
+            inner_radius_is_3d="GROUND",
+            outer_radius="{} Meters".format(V.OUTER_RADIUS_METERS),
+            outer_radius_is_3d="GROUND",
+            horizontal_start_angle="0",
+            horizontal_end_angle="360",
+            vertical_upper_angle="90",
+            vertical_lower_angle="-90",
+            analysis_method="PERIMETER_SIGHTLINES"
+        )
 
-    save_raster_to = join(viewshed_folder, 'viewshed_{:04d}'.format(c))
-    save_observers_to = join(point_table_folder, "tst_points_{:04d}.shp".format(c))
-    save_observer_relations_to = join(tmp_table_folder, 'observer_relations_{:04d}.shp'.format(c))
-    save_dirs = [save_raster_to, save_observers_to, save_observer_relations_to]
 
-    if (not overwrite_existing) and all(exists(path) for path in save_dirs):
-        return reset_tmp(spatial_reference, tmp_table)
-
-    arcpy.CopyFeatures_management(tmp_table, save_observers_to)
-
-    with get_search_cursor(tmp_table, [
-        T.SHAPE,
-        T.Z,
-        T.ISLAND_ID,
-        T.SPLIT_ISLAND_ID,
-        T.ISLAND_GRID_ID,
-        T.VIEWPOINT_ID,
-        T.OBSERVER
-    ]) as t:
-        arcpy.AddMessage(len(list(t)))
-
-    if c not in {9}:
-        try:
-            arcpy.AddMessage("doing viewshed {} of {}".format(c, total_rasters))
-            out_raster, _, _ = arcpy.Viewshed2_3d(
-                in_raster=sea_level_raster,
-                in_observer_features=tmp_table,
-                out_raster=save_raster_to,
-                out_agl_raster=None,
-                analysis_type="OBSERVERS",
-                vertical_error="0 Meters",
-                out_observer_region_relationship_table=save_observer_relations_to,
-                refractivity_coefficient="0.13",
-                surface_offset="0 Meters",
-                observer_elevation="Z",
-                observer_offset="2 Meters",
-                inner_radius=None,
-                inner_radius_is_3d="GROUND",
-                outer_radius="300 Kilometers",
-                outer_radius_is_3d="GROUND",
-                horizontal_start_angle="0",
-                horizontal_end_angle="360",
-                vertical_upper_angle="90",
-                vertical_lower_angle="-90",
-                analysis_method="PERIMETER_SIGHTLINES"
-            )
-        except Exception as e:
-            arcpy.AddMessage(e.message)
-
-    return reset_tmp(spatial_reference, tmp_table)
-
-
-def get_viewshed_groups(tmp_tbl, insert_cursor, row, i, total_rows,
-                        viewshed_folder, ws, tmp_table_folder, sea_level_raster, spatial_reference, total_rasters,
-                        overwrite_existing):
-    d, m = divmod(i, OBSERVER_GROUP_SIZE)
-    if (i > 0 and m == 0) or (i == (total_rows - 1)):
-        arcpy.AddMessage(
-            """
-            tmp_tbl: {tmp_tbl},
-            d: {d},
-            m: {m},
-            viewshed_folder: {viewshed_folder},
-            ws: {ws},
-            tmp_table_folder: {tmp_table_folder},
-            sea_level_raster: {sea_level_raster},
-            spatial_reference: {spatial_reference},
-            total_rasters: {total_rasters},
-            overwrite_existing: {overwrite_existing}
-            """.format(
-                tmp_tbl=tmp_tbl,
-                d=d,
-                m=m,
-                viewshed_folder=viewshed_folder,
-                ws=ws,
-                tmp_table_folder=tmp_table_folder,
-                sea_level_raster=sea_level_raster,
-                spatial_reference=spatial_reference,
-                total_rasters=total_rasters,
-                overwrite_existing=overwrite_existing,
-            )
+class NumpyViewshedEngine(object):
+    """
+    Sightline sweep from raster.los. The surface is read into memory once and shared by every group.
+    """
+
+    header = None
+    max_observers = None
+    horizon = None
+
+    def prepare_surface(self, sea_level_raster):
+        surface = raster_to_grid(sea_level_raster)
+        self.header = grid_header(surface)
+        return surface
+
+    def prepare_horizon(self, surface, folder, sea_level, source=None, rebuild=False):
+        """
+        Load the surface's max elevation pyramid from folder, building it if it isn't there
+
+        :type surface: macro_viewshed_analysis.raster.grid.Grid
+        :type folder: str
+        :type sea_level: float
+        :param source: Fingerprint of the DEM, see raster.horizon.cached_max_pyramid
+        :type source: str
+        :type rebuild: bool
+        """
+        self.horizon = cached_max_pyramid(folder, sea_level, surface, source, rebuild)
+
+    def run(self, surface, observers, save_raster_to, save_observer_relations_to, window=None):
+        """
+        :param window: (row start, row stop, col start, col stop) of the surface to run over, None for all of it
+        :type window: (int, int, int, int)
+        """
+        horizon = self.horizon
+        if window is not None:
+            surface = surface.window(*window)
+            if horizon is not None:
+                horizon = horizon.window(*window)
+        with get_search_cursor(observers, [T.XY, T.Z, T.OBSERVER]) as sc:
+            group = [(x, y, z, observer) for ((x, y), z, observer) in sc]
+        if max(observer for (_, _, _, observer) in group) < INT32_OBSERVERS:
+            self._save_bitmask(viewshed_bitmask(surface, group, horizon=horizon), surface, group, save_raster_to,
+                               save_observer_relations_to)
+        else:
+            self._save_bitset(viewshed_bitset(surface, group, horizon=horizon), surface, group, save_raster_to,
+                              save_observer_relations_to)
+
+    @staticmethod
+    def _save_bitmask(bits, surface, group, save_raster_to, save_observer_relations_to):
+        grid_to_raster(surface.like(bits), save_raster_to)
+
+        regions = np.unique(bits)
+        relations = np.array(
+            [(observer, region) for (_, _, _, observer) in group for region in regions
+             if (int(region) >> observer) & 1],
+            dtype=[(T.OBSERVER.upper(), np.int32), ('REGION', np.int32)]
         )
-        tmp_tbl, insert_cursor = run_multi_viewshed(
-            tmp_tbl, d, m,
-            viewshed_folder, ws, tmp_table_folder, sea_level_raster, spatial_reference, total_rasters,
-            overwrite_existing
+        arcpy.da.NumPyArrayToTable(relations, save_observer_relations_to)
+
+    @staticmethod
+    def _save_bitset(bits, surface, group, save_raster_to, save_observer_relations_to):
+        """
+        Groups of more than 32 observers are saved as a multiband raster, one band per 8 observers. There are no
+        regions to relate observers to, so the table gives each observer's band and bit instead.
+        """
+        grid_to_raster(surface.like(bits), save_raster_to)
+
+        relations = np.array(
+            [(observer, observer_plane(observer)[0] + 1, observer_plane(observer)[1])
+             for (_, _, _, observer) in group],
+            dtype=[(T.OBSERVER.upper(), np.int32), ('BAND', np.int32), ('BIT', np.int32)]
         )
-    insert_cursor.insertRow(row + (i % OBSERVER_GROUP_SIZE,))
-    return tmp_tbl, insert_cursor
+        arcpy.da.NumPyArrayToTable(relations, save_observer_relations_to)
 
 
-def run_all_viewsheds(sea_level, ws, viewpoints, dem, spatial_reference=None, overwrite_existing=False):
-    env.overwriteOutput = True
-    if spatial_reference is None:
-        spatial_reference = Describe(dem).spatialReference
+VIEWSHED_ENGINES = {
+    'arcpy': ArcpyViewshedEngine,
+    'numpy': NumpyViewshedEngine,
+}
 
-    dem = reproject(dem)
-    r = Raster(dem)
-    slr = Con(r > sea_level, r, sea_level)
 
+def uses_horizon(engine):
+    """
+    :return: Whether the engine should be given a max elevation pyramid, see NumpyViewshedEngine.prepare_horizon
+    :rtype: bool
+    """
+    return V.HORIZON_CACHE.lower() == 'true' and hasattr(engine, 'prepare_horizon')
+
+
+def get_viewshed_engine(name=None, observer_group_size=OBSERVER_GROUP_SIZE):
+    """
+    :param name: One of VIEWSHED_ENGINES, defaults to the VIEWSHED_ENGINE setting
+    :type name: str
+    :param observer_group_size: Raises ValueError if the engine can't run groups this big
+    :type observer_group_size: int
+    """
+    engine = VIEWSHED_ENGINES[V.VIEWSHED_ENGINE if name is None else name]()
+    if engine.max_observers is not None and observer_group_size > engine.max_observers:
+        raise ValueError('The {} viewshed engine runs at most {} observers at a time, not {}'.format(
+            name or V.VIEWSHED_ENGINE, engine.max_observers, observer_group_size))
+    return engine
+
+
+def observer_raster(raster, observer):
+    """
+    Con(BitwiseAnd()) out one observer from a 32 bit viewshed raster or a multiband bitset raster
+
+    :type raster: str | arcpy.Raster
+    :type observer: int
+    :rtype: arcpy.Raster
+    """
+    r = raster if isinstance(raster, Raster) else Raster(raster)
+    if r.bandCount > 1:
+        plane, bit = observer_plane(observer)
+        return Con(BitwiseAnd(Raster(join(r.catalogPath, 'Band_{}'.format(plane + 1))), 1 << bit), 1, None)
+    return Con(BitwiseAnd(r, int32_bit(observer)), 1, None)
+
+
+# Bytes per surface cell, for reporting how much of it each group reads
+SURFACE_CELL_BYTES = 4
+
+
+def group_window(header, xy):
+    """
+    :param header: Georeferencing and shape of the surface
+    :type header: dict
+    :param xy: Observer coordinates
+    :type xy: list[(float, float)]
+    :return: The window of the surface the group needs, or None to run over all of it
+    :rtype: (int, int, int, int)
+    """
+    if V.CLIP_TO_RADIUS.lower() != 'true' or header is None or not xy:
+        return None
+    x, y = zip(*xy)
+    return observer_window(header, x, y, float(V.OUTER_RADIUS_METERS))
+
+
+def surface_bytes(header, window):
+    """
+    :return: Bytes of surface read for the window, and for the whole surface
+    :rtype: (int, int)
+    """
+    rows, cols = header['shape']
+    total = rows * cols * SURFACE_CELL_BYTES
+    return (total if window is None else window_cells(window) * SURFACE_CELL_BYTES), total
+
+
+def create_viewshed_folders(ws):
+    """
+    :type ws: str
+    :return: The viewshed, observer point and observer group folders
+    :rtype: (str, str, str)
+    """
     viewshed_folder = join(ws, S.FOLDER_VIEWSHEDS)
     tmp_table_folder = join(ws, S.FOLDER_TMP_OBSERVERS)
     point_table_folder = join(ws, S.FOLDER_OBSERVER_POINTS)
     for directory in [viewshed_folder, tmp_table_folder, point_table_folder]:
         if not exists(directory):
             makedirs(directory)
+    return viewshed_folder, point_table_folder, tmp_table_folder
+
+
+def viewshed_paths(c, viewshed_folder, point_table_folder, tmp_table_folder):
+    """
+    :param c: The 1 indexed viewshed number
+    :type c: int
+    :return: Where the viewshed raster, its observers and the observer relations table are saved
+    :rtype: (str, str, str)
+    """
+    save_raster_to = join(viewshed_folder, 'viewshed_{:04d}'.format(c))
+    save_observers_to = join(point_table_folder, "tst_points_{:04d}.shp".format(c))
+    save_observer_relations_to = join(tmp_table_folder, 'observer_relations_{:04d}.shp'.format(c))
+    return save_raster_to, save_observers_to, save_observer_relations_to
+
+
+def plan_viewshed_jobs(viewpoints, observer_group_size=OBSERVER_GROUP_SIZE):
+    """
+    Read the viewpoints once and split them into observer groups
+
+    :type viewpoints: str
+    :type observer_group_size: int
+    :return: Each group's viewshed number and OBSERVER_FIELDS rows
+    :rtype: list[ViewshedJob]
+    """
+    jobs = []
+    with get_search_cursor(viewpoints, VIEWPOINT_FIELDS) as sc:
+        for i, row in enumerate(sc):
+            d, m = divmod(i, observer_group_size)
+            if m == 0:
+                jobs.append(ViewshedJob(d + 1, []))  # Viewsheds are 1 indexed
+            jobs[-1].rows.append(tuple(row) + (m,))
+    return jobs
+
+
+def log_job_result(result, state):
+    """
+    For run_jobs' on_result
+
+    :param result: Anything with a number and an error
+    :type state: str
+    """
+    if result.error is None:
+        return
+    if state == FAILED:
+        arcpy.AddError("viewshed {} failed, re-run it with the failed groups: {}".format(result.number, result.error))
+    else:
+        arcpy.AddWarning("viewshed {} failed, retrying: {}".format(result.number, result.error))
+
+
+def job_progress_logger(total_jobs, header):
+    """
+    An on_result for run_jobs that logs each group as it finishes and counts it in the profile
+
+    :param total_jobs: Groups being run
+    :type total_jobs: int
+    :param header: Georeferencing and shape of the surface
+    :type header: dict
+    """
+    start = default_timer()
+    finished = []
+
+    def log_result(result, state):
+        if state == PENDING:
+            log_job_result(result, state)
+            return
+        finished.append(result.number)
+        if result.error is not None:
+            status = 'failed: {}'.format(result.error)
+        elif result.skipped:
+            status = 'already exists'
+        else:
+            status = 'done in {:.1f}s, read {:.1f} of {:.1f} MB of surface'.format(
+                result.seconds, result.bytes_read / 1e6, surface_bytes(header, None)[1] / 1e6)
+            profiling.count('viewshed group', result.seconds, result.observers)
+        arcpy.AddMessage("viewshed {} ({} of {} finished, {:.0f}s elapsed) {}".format(
+            result.number, len(finished), total_jobs, default_timer() - start, status))
+
+    return log_result
+
+
+def run_multi_viewshed(job, viewshed_folder, point_table_folder, tmp_table_folder, sea_level_raster, scratch,
+                       overwrite_existing=False, viewshed_engine=None):
+    """
+    Run one observer group, everything from filling its observer table to saving its outputs, so run_jobs retries
+    or records a failure anywhere in it
+
+    :type job: ViewshedJob
+    :param scratch: Where the group's observer table comes from
+    :type scratch: ScratchTablePool
+    :rtype: ViewshedResult
+    """
+    start = default_timer()
+    save_dirs = viewshed_paths(job.number, viewshed_folder, point_table_folder, tmp_table_folder)
+    save_raster_to, save_observers_to, save_observer_relations_to = save_dirs
+    if (not overwrite_existing) and all(exists(path) for path in save_dirs):
+        return ViewshedResult(job.number, len(job.rows), 0.0, True, None, 0)
+
+    if viewshed_engine is None:
+        viewshed_engine = get_viewshed_engine()
+    window = group_window(viewshed_engine.header, [row[0][:2] for row in job.rows])
+    with scratch.table() as tmp_table:
+        with get_insert_cursor(tmp_table, OBSERVER_FIELDS) as ic:
+            for row in job.rows:
+                ic.insertRow(row)
+        arcpy.CopyFeatures_management(tmp_table, save_observers_to)
+        viewshed_engine.run(sea_level_raster, tmp_table, save_raster_to, save_observer_relations_to, window)
+    bytes_read, _ = surface_bytes(viewshed_engine.header, window)
+    return ViewshedResult(job.number, len(job.rows), default_timer() - start, False, None, bytes_read)
+
+
+def run_all_viewsheds(sea_level, ws, viewpoints, dem, spatial_reference=None, overwrite_existing=False,
+                      viewshed_engine=None, failed_only=False):
+    """
+    :param viewshed_engine: Name of one of VIEWSHED_ENGINES, defaults to the VIEWSHED_ENGINE setting
+    :type viewshed_engine: str
+    :param failed_only: Run only the groups in the failure queue of an earlier run
+    :type failed_only: bool
+    :return: The state of every group run
+    :rtype: JobStore
+    """
+    env.overwriteOutput = True
+    if spatial_reference is None:
+        spatial_reference = Describe(dem).spatialReference
+    engine = get_viewshed_engine(viewshed_engine)
+
+    dem = reproject(dem)
+    r = Raster(dem)
+    slr = engine.prepare_surface(Con(r > sea_level, r, sea_level))
+
+    viewshed_folder, point_table_folder, tmp_table_folder = create_viewshed_folders(ws)
+    save_surface_header(viewshed_folder, engine.header)
+    if uses_horizon(engine):
+        engine.prepare_horizon(slr, viewshed_folder, sea_level, fingerprint_path(dem), overwrite_existing)
+    store = JobStore(viewshed_folder)
 
     arcpy.AddMessage("getting points")
-    total_rows = int(arcpy.GetCount_management(viewpoints).getOutput(0))
-    arcpy.AddMessage("{} viewpoints".format(total_rows))
-    total_rasters = int(ceil(total_rows / float(OBSERVER_GROUP_SIZE)))
-    arcpy.AddMessage("{} rasters".format(total_rasters))
-
-    tmp_tbl, insert_cursor = reset_tmp(spatial_reference)
-    with get_search_cursor(viewpoints, [T.SHAPE, T.Z, T.ISLAND_ID, T.SPLIT_ISLAND_ID, T.ISLAND_GRID_ID, T.ID]) as vp_sc:
-        for i, row in enumerate(vp_sc):
-            try:
-                tmp_tbl, insert_cursor = get_viewshed_groups(
-                    tmp_tbl, insert_cursor, row, i, total_rows,
-                    viewshed_folder, point_table_folder, tmp_table_folder, slr, spatial_reference, total_rasters,
-                    overwrite_existing)
-            except Exception as e:
-                arcpy.AddMessage(e.message)
-                continue
-    env.overwriteOutput = overwrite_existing
+    jobs = plan_viewshed_jobs(viewpoints)
+    arcpy.AddMessage("{} viewpoints in {} rasters".format(sum(len(job.rows) for job in jobs), len(jobs)))
+    if failed_only:
+        failed = set(store.failed())
+        jobs = [job for job in jobs if job.number in failed]
+        arcpy.AddMessage("re-running {} failed groups".format(len(jobs)))
+
+    scratch = observer_tables(spatial_reference)
+    # Failed groups may have left some of their outputs behind, so a re-run writes over them
+    run = partial(run_multi_viewshed, viewshed_folder=viewshed_folder, point_table_folder=point_table_folder,
+                  tmp_table_folder=tmp_table_folder, sea_level_raster=slr, scratch=scratch,
+                  overwrite_existing=overwrite_existing or failed_only, viewshed_engine=engine)
+    try:
+        run_jobs(jobs, run, store, max_attempts=int(A.JOB_ATTEMPTS), backoff_seconds=float(A.JOB_BACKOFF_SECONDS),
+                 on_result=job_progress_logger(len(jobs), engine.header))
+    finally:
+        scratch.close()
+        env.overwriteOutput = overwrite_existing
+    arcpy.AddMessage(store.report())
+    return store
 
 
 def extract_viewshed(workspace, viewshed_folder, vs_num):
@@ -190,13 +441,39 @@ def extract_viewshed(workspace, viewshed_folder, vs_num):
     for i, row in enumerate(SearchCursor(viewpoints, ['FID', 'FID_split_'])):
         try:
             print("{:03d}: {}".format(vs_num, row))
-            val = 1 if row[0] < 31 else -1
-            extracted = Con(BitwiseAnd(r, (val << int(row[0]))), 1, None)
+            extracted = observer_raster(r, int(row[0]))
             extracted.save(join(vs_dir, 'v{:03d}i{:05d}o{:02d}'.format(vs_num, row[1], row[0])))
         except Exception as e:
             print("Problem on {}-{}: {}".format(vs_num, i, e.message))
 
 
+def extract_viewshed_runs(workspace, vs_num, max_band_cells=MAX_BAND_CELLS):
+    """
+    Unpack every observer in a viewshed raster in one banded read, saving them as runs of visible cells in
+    viewshed_{:04d}_runs.npz next to the raster. Replaces the 32 Con(BitwiseAnd()) rasters from extract_viewshed.
+
+    :type workspace: str
+    :type vs_num: int
+    :param max_band_cells: Cells read at a time, which bounds memory use
+    :type max_band_cells: int
+    :return: Where the runs were saved
+    :rtype: str
+    """
+    viewshed = join(workspace, S.FOLDER_VIEWSHEDS, 'viewshed_{:04d}'.format(vs_num))
+    with profiling.timer('extract') as timer:
+        r = Raster(viewshed)
+        band_rows = band_rows_for(r.width * r.bandCount, max_band_cells)
+        runs = extract_observer_runs(raster_bands(r, band_rows, nodata_to_value=0))
+        header, surface = raster_header(r), load_surface_header(workspace)
+        if surface is not None:
+            # Rasters clipped to a window are unpacked into the rows and columns of the whole surface
+            runs, header = rebase_runs(runs, header, surface), surface
+        save_observer_runs(runs_path(viewshed), runs, header)
+        timer.rows, timer.bytes_written = len(runs), getsize(runs_path(viewshed))
+    arcpy.AddMessage("viewshed {}: {} observers extracted".format(vs_num, len(runs)))
+    return runs_path(viewshed)
+
+
 def get_viewpoint_search_cursor(viewpoints, qry):
     """
     :rtype: (list[(int, (int, int, int, int))], SearchCursor)
@@ -204,40 +481,10 @@ def get_viewpoint_search_cursor(viewpoints, qry):
     return SearchCursor(viewpoints, ['FID_island', 'FID_split', 'FID_grid', 'OID@'], qry)
 
 
-def save_table(fp, save_to):
-    arcpy.AddMessage('Saving')
-    try:
-        if arcpy.Exists(save_to):
-            arcpy.Append_management(fp, save_to)
-            arcpy.AddMessage('New data appended to {}'.format(save_to))
-        else:
-            arcpy.CopyFeatures_management(fp, save_to)
-            arcpy.AddMessage('New data saved to {}'.format(save_to))
-    except Exception as e:
-        arcpy.AddMessage('Failed to save data: {}'.format(e.message))
-
-
-def get_poly_rasters(viewpoints, workspace, save_to, spatial_reference):
+def get_poly_rasters(viewpoints, workspace, save_to, spatial_reference, save_every=100):
     failed = []
-    if arcpy.Exists(save_to):
-        fp = arcpy.CopyFeatures_management(save_to, join('in_memory', 'va_polygons'))
-    else:
-        fp = arcpy.CreateFeatureclass_management(
-            'in_memory', 'va_polygons', 'POLYGON', spatial_reference=spatial_reference
-        )
-
-        arcpy.AddField_management(fp, 'FID_island', field_type='LONG')
-        arcpy.AddField_management(fp, 'FID_split', field_type='LONG')
-        arcpy.AddField_management(fp, 'FID_grid', field_type='LONG')
-        arcpy.AddField_management(fp, 'FID_point', field_type='LONG')
-    # arcpy.AddIndex_management(fp, 'FID_island', 'island_idx')
-    ic = arcpy.da.InsertCursor(fp, ['SHAPE@', 'FID_island', 'FID_split', 'FID_grid', 'FID_point'])
-
-    if int(arcpy.GetCount_management(fp).getOutput(0)) > 0:
-        highest_point = max(p for (p,) in arcpy.da.SearchCursor(fp, ['FID_point']))
-        qry = """{} > {}""".format(arcpy.AddFieldDelimiters(viewpoints, 'FID'), highest_point)
-    else:
-        qry = None
+    writer = CheckpointWriter(open_checkpoint(save_to))
+    qry = generate_resume_query(writer.store, viewpoints, save_to)
 
     arcpy.AddMessage('Starting')
     prev_vs = 0
@@ -245,8 +492,7 @@ def get_poly_rasters(viewpoints, workspace, save_to, spatial_reference):
     sc = get_viewpoint_search_cursor(viewpoints, qry)
     try:
         for i, (island_id, split_island_id, grid_id, point_id) in enumerate(sc):
-            if i % 100 == 0:
-                save_table(fp, save_to)
+            log_and_save(writer, i, None, save_every)
             try:
                 vs_num, index = divmod(point_id, OBSERVER_GROUP_SIZE)
                 vs_num += 1  # Viewsheds are 1 indexed
@@ -264,15 +510,14 @@ def get_poly_rasters(viewpoints, workspace, save_to, spatial_reference):
                         vs_num, index, island_id, split_island_id, grid_id, point_id
                     )
                 )
-                val = 1 if index < 31 else -1
-                extracted = Con(BitwiseAnd(r, (val << int(index))), 1, None)
+                extracted = observer_raster(r, int(index))
 
                 vs_poly = arcpy.RasterToPolygon_conversion(
                     in_raster=extracted,
                     out_polygon_features=join('in_memory', 'vs_poly_{}_{}'.format(island_id, i)),
                 )
                 for (poly,) in SearchCursor(vs_poly, ["SHAPE@"]):
-                    ic.insertRow((poly, island_id, split_island_id, grid_id, point_id))
+                    writer.add((poly.WKB, island_id, split_island_id, grid_id, point_id))
 
                 arcpy.Delete_management(extracted)
                 arcpy.Delete_management(vs_poly)
@@ -281,17 +526,123 @@ def get_poly_rasters(viewpoints, workspace, save_to, spatial_reference):
                 failed.append((i, island_id, split_island_id, grid_id, point_id, e.__class__.__name__, e.message))
     finally:
         # Clean up the cursors
-        del ic
         del sc
-        arcpy.AddMessage('Saving')
-        try:
-            if arcpy.Exists(save_to):
-                arcpy.Append_management(fp, save_to)
-                arcpy.AddMessage('New data appended to {}'.format(save_to))
-            else:
-                arcpy.CopyFeatures_management(fp, save_to)
-                arcpy.AddMessage('New data saved to {}'.format(save_to))
-        except Exception as e:
-            arcpy.AddMessage('Failed to save data: {}'.format(e.message))
-        arcpy.AddMessage('Failed: {}'.format(failed))
-        arcpy.AddMessage('Done!')
+        clean_up(writer, save_to, spatial_reference, failed)
+
+
+def create_viewshed_polygon_table(save_to, spatial_reference):
+    """
+    :type save_to: str
+    :type spatial_reference: arcpy.SpatialReference
+    :rtype: str
+    """
+    save_dir, name = split(save_to)
+    fp = arcpy.CreateFeatureclass_management(save_dir, name, 'POLYGON', spatial_reference=spatial_reference)
+    for field in [T.ISLAND_ID, T.SPLIT_ISLAND_ID, T.ISLAND_GRID_ID, T.VIEWPOINT_ID]:
+        arcpy.AddField_management(fp, field, field_type='LONG')
+    return save_to
+
+
+def runs_out_of_date(viewshed):
+    """
+    :return: Whether the viewshed has no runs file, or its raster has been written since the runs file was
+    :rtype: bool
+    """
+    runs = runs_path(viewshed)
+    if not exists(runs):
+        return True
+    return exists(viewshed) and newest_mtime(viewshed) > getmtime(runs)
+
+
+def get_viewshed_runs_path(workspace, overwrite_existing=False):
+    """
+    :param overwrite_existing: Unpack every raster again, not only those without an up to date runs file
+    :return: The runs file for a 1 indexed viewshed number, unpacking the raster when it is needed
+    :rtype: (int) -> str
+    """
+    extracted = set()
+
+    def runs_for_viewshed(vs_num):
+        viewshed = join(workspace, S.FOLDER_VIEWSHEDS, 'viewshed_{:04d}'.format(vs_num))
+        if vs_num not in extracted and (overwrite_existing or runs_out_of_date(viewshed)):
+            extract_viewshed_runs(workspace, vs_num)
+            extracted.add(vs_num)
+        return runs_path(viewshed)
+
+    return runs_for_viewshed
+
+
+def update_observer_index(viewpoints, workspace, overwrite_existing=False):
+    """
+    Add every viewshed not yet in the workspace's observer index to it, unpacking rasters as needed. Viewsheds
+    that were run again since they were indexed are indexed again.
+
+    :type viewpoints: str
+    :type workspace: str
+    :param overwrite_existing: Index every viewshed again
+    :type overwrite_existing: bool
+    :rtype: ObserverIndex
+    """
+    index = ObserverIndex(join(workspace, S.FOLDER_VIEWSHEDS))
+    done = set() if overwrite_existing else index.viewsheds()
+    runs_for_viewshed = get_viewshed_runs_path(workspace, overwrite_existing)
+    failed = []
+    search_table_cols = [T.ID, T.ISLAND_ID, T.SPLIT_ISLAND_ID, T.ISLAND_GRID_ID]
+    with get_search_cursor(viewpoints, search_table_cols) as sc:
+        by_viewshed = groupby(sc, key=lambda row: row[0] // OBSERVER_GROUP_SIZE + 1)  # Viewsheds are 1 indexed
+        for vs_num, rows in by_viewshed:
+            viewshed = join(workspace, S.FOLDER_VIEWSHEDS, 'viewshed_{:04d}'.format(vs_num))
+            if vs_num in done and not runs_out_of_date(viewshed):
+                continue
+            try:
+                runs, header = load_observer_runs(runs_for_viewshed(vs_num))
+            except Exception as e:
+                arcpy.AddError('Failed to index viewshed {}: {}'.format(vs_num, e))
+                failed.append(vs_num)
+                continue
+            observers = [(point_id, point_id % OBSERVER_GROUP_SIZE, island_id, split_island_id, grid_id)
+                         for point_id, island_id, split_island_id, grid_id in rows]
+            index.add_viewshed(vs_num, observers, runs, header)
+    if failed:
+        index.close()
+        raise ValueError('Viewsheds {} could not be indexed, run them again before using the index'.format(
+            ', '.join(str(vs_num) for vs_num in failed)))
+    return index
+
+
+def get_poly_runs(viewpoints, workspace, save_to, spatial_reference, log_every=100, overwrite_existing=False):
+    """
+    get_poly_rasters without the per observer rasters and in_memory polygons: each observer's runs are traced
+    straight into polygon rings and written to save_to as they are made. Observers are read through the
+    workspace's observer index, which is brought up to date first.
+
+    :type viewpoints: str
+    :type workspace: str
+    :type save_to: str
+    :type spatial_reference: arcpy.SpatialReference
+    :type log_every: int
+    :param overwrite_existing: Index every viewshed again
+    :type overwrite_existing: bool
+    """
+    index = update_observer_index(viewpoints, workspace, overwrite_existing)
+    first_viewpoint = None
+    if arcpy.Exists(save_to):
+        last = last_completed_viewpoint(save_to)
+        first_viewpoint = None if last is None else last + 1
+    else:
+        create_viewshed_polygon_table(save_to, spatial_reference)
+
+    arcpy.AddMessage('Starting')
+    insert_table_cols = [T.SHAPE, T.ISLAND_ID, T.SPLIT_ISLAND_ID, T.ISLAND_GRID_ID, T.VIEWPOINT_ID]
+    try:
+        with get_insert_cursor(save_to, insert_table_cols) as ic, profiling.timer('polygonize') as timer:
+            records = index_polygon_records(index, first_viewpoint)
+            for i, (rings, island_id, split_island_id, grid_id, point_id) in enumerate(records):
+                if log_every and i % log_every == 0:
+                    arcpy.AddMessage("Viewpoint: {}".format(point_id))
+                polygon = arcpy.AsShape({'rings': [ring.tolist() for ring in rings]}, True)
+                ic.insertRow((polygon, island_id, split_island_id, grid_id, point_id))
+                timer.rows += 1
+    finally:
+        index.close()
+    arcpy.AddMessage('Done!')
@@ -0,0 +1,227 @@
+"""
+Timers and counters for the pipeline's hot paths.
+
+Stages, observer groups, extraction, polygonizing and cursor flushes are wrapped in named timers that add up their
+calls, seconds, rows and bytes written. Nothing is recorded until enable() is called: until then timer() hands back
+one shared do-nothing context and count() returns straight away, so instrumented code costs a function call.
+
+    profiling.enable()
+    with profiling.timer('extract') as t:
+        t.rows = ...
+    print(profiling.summary())
+"""
+import csv
+import json
+from collections import OrderedDict
+from functools import wraps
+from os.path import join
+from timeit import default_timer
+
+FIELDS = ['name', 'calls', 'seconds', 'rows', 'bytes_written', 'rows_per_second', 'mb_per_second']
+
+_profiler = None
+
+
+class Profiler(object):
+    def __init__(self):
+        self.started = default_timer()
+        self.stats = OrderedDict()
+
+    def add(self, name, seconds=0.0, rows=0, bytes_written=0):
+        """
+        :type name: str
+        :type seconds: float
+        :type rows: int
+        :type bytes_written: int
+        """
+        stat = self.stats.get(name)
+        if stat is None:
+            stat = self.stats[name] = {'calls': 0, 'seconds': 0.0, 'rows': 0, 'bytes_written': 0}
+        stat['calls'] += 1
+        stat['seconds'] += seconds
+        stat['rows'] += rows
+        stat['bytes_written'] += bytes_written
+
+    def wall_seconds(self):
+        return default_timer() - self.started
+
+    def records(self):
+        """
+        :return: One dict per name, with FIELDS, in the order the names were first seen
+        :rtype: list[dict]
+        """
+        records = []
+        for name, stat in self.stats.items():
+            seconds = stat['seconds']
+            records.append(dict(
+                stat, name=name,
+                rows_per_second=stat['rows'] / seconds if seconds else 0.0,
+                mb_per_second=stat['bytes_written'] / 1e6 / seconds if seconds else 0.0,
+            ))
+        return records
+
+    def summary(self):
+        """
+        :rtype: str
+        """
+        lines = ['{:.1f}s wall time'.format(self.wall_seconds())]
+        for r in self.records():
+            line = '{name}: {calls} calls, {seconds:.2f}s'.format(**r)
+            if r['rows']:
+                line += ', {rows} rows ({rows_per_second:.0f}/s)'.format(**r)
+            if r['bytes_written']:
+                line += ', {:.1f} MB written ({:.1f} MB/s)'.format(r['bytes_written'] / 1e6, r['mb_per_second'])
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def save_json(self, path):
+        with open(path, 'w') as f:
+            json.dump({'wall_seconds': self.wall_seconds(), 'stats': self.records()}, f, indent=1)
+        return path
+
+    def save_csv(self, path):
+        with open(path, 'w') as f:
+            writer = csv.DictWriter(f, FIELDS, lineterminator='\n')
+            writer.writeheader()
+            for record in self.records():
+                writer.writerow(record)
+        return path
+
+
+class _Timer(object):
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.rows = 0
+        self.bytes_written = 0
+        self.start = None
+
+    def __enter__(self):
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.add(self.name, default_timer() - self.start, self.rows, self.bytes_written)
+
+
+class _NullTimer(object):
+    # Takes the rows and bytes a timed block sets and forgets them
+    rows = 0
+    bytes_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def enable():
+    """
+    Start recording, keeping anything recorded already
+
+    :rtype: Profiler
+    """
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+    return _profiler
+
+
+def disable():
+    """
+    Stop recording
+
+    :return: What was recorded, None if it wasn't enabled
+    :rtype: Profiler
+    """
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+
+def reset():
+    """
+    Drop what's been recorded and start again, if recording
+
+    :return: What was recorded, None if it wasn't enabled
+    :rtype: Profiler
+    """
+    global _profiler
+    profiler = _profiler
+    if profiler is not None:
+        _profiler = Profiler()
+    return profiler
+
+
+def active():
+    """
+    :rtype: Profiler
+    """
+    return _profiler
+
+
+def timer(name):
+    """
+    Time a block. Set `rows` and `bytes_written` on what it gives back to count them too.
+
+    :type name: str
+    """
+    if _profiler is None:
+        return _NULL_TIMER
+    return _Timer(_profiler, name)
+
+
+def count(name, seconds=0.0, rows=0, bytes_written=0):
+    """
+    Record work timed elsewhere, such as in a worker process
+
+    :type name: str
+    :type seconds: float
+    :type rows: int
+    :type bytes_written: int
+    """
+    if _profiler is not None:
+        _profiler.add(name, seconds, rows, bytes_written)
+
+
+def timed(name):
+    """
+    Decorator form of timer
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return func(*args, **kwargs)
+            with _Timer(_profiler, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def summary():
+    """
+    :rtype: str
+    """
+    return '' if _profiler is None else _profiler.summary()
+
+
+def save(folder, name='profile'):
+    """
+    Save what's been recorded as <name>.json and <name>.csv in folder
+
+    :type folder: str
+    :type name: str
+    :return: The JSON and CSV paths, None if profiling isn't enabled
+    :rtype: (str, str)
+    """
+    if _profiler is None:
+        return None
+    return _profiler.save_json(join(folder, name + '.json')), _profiler.save_csv(join(folder, name + '.csv'))
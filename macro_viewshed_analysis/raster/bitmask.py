@@ -0,0 +1,192 @@
+"""
+Unpacking observer bitmask rasters.
+
+A viewshed raster packs one bit per observer into each cell, either as a 32 bit raster or as a wider bitset (see
+raster.bitset). Rather than one Con(BitwiseAnd(r, 1 << i)) raster per observer, every observer is unpacked from a
+band of rows in the same pass and stored as runs of visible cells: (row, first column, column after the last) per
+run.
+"""
+import json
+from os.path import exists, join
+
+import numpy as np
+
+from macro_viewshed_analysis.config import OBSERVER_GROUP_SIZE, SaveLocations as S
+from macro_viewshed_analysis.raster.bitset import BITS_PER_PLANE, as_bitset, bitset_mask
+
+# Default cap on cells read per band, 64 MB of int32s
+MAX_BAND_CELLS = 16 * 1024 * 1024
+
+# The whole-surface header in a workspace's viewsheds folder
+SURFACE_HEADER = 'surface.json'
+
+
+def band_rows_for(cols, max_cells=MAX_BAND_CELLS):
+    """
+    :type cols: int
+    :type max_cells: int
+    :rtype: int
+    """
+    return max(max_cells // max(cols, 1), 1)
+
+
+def grid_bands(data, band_rows):
+    """
+    Bands of rows from an array, which can be memory mapped so only one band is ever read in
+
+    :param data: (rows, cols), or (planes, rows, cols) for a bitset
+    :type data: numpy.ndarray
+    :type band_rows: int
+    :rtype: collections.Iterable[(int, numpy.ndarray)]
+    """
+    for start in range(0, data.shape[-2], band_rows):
+        yield start, np.asarray(data[..., start:start + band_rows, :])
+
+
+def observer_mask(bits, observer):
+    """
+    Equivalent to Con(BitwiseAnd(r, 1 << observer), 1, None)
+
+    :param bits: A 32 bit raster (rows, cols) or a bitset (planes, rows, cols)
+    :type bits: numpy.ndarray
+    :type observer: int
+    :rtype: numpy.ndarray
+    """
+    if bits.ndim == 3:
+        return bitset_mask(bits, observer)
+    return (bits.view(np.uint32) >> np.uint32(observer)) & np.uint32(1) > 0
+
+
+def mask_runs(mask, row_offset=0):
+    """
+    :type mask: numpy.ndarray
+    :type row_offset: int
+    :return: (row, start column, stop column) per run of True cells
+    :rtype: numpy.ndarray
+    """
+    padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, stops = np.nonzero(edges == -1)
+    return np.column_stack([rows + row_offset, starts, stops]).astype(np.int32)
+
+
+def runs_to_mask(runs, shape):
+    """
+    :type runs: numpy.ndarray
+    :type shape: (int, int)
+    :rtype: numpy.ndarray
+    """
+    mask = np.zeros(shape, dtype=bool)
+    for row, start, stop in runs:
+        mask[row, start:stop] = True
+    return mask
+
+
+def extract_observer_runs(bands, observers=None):
+    """
+    Unpack every observer from each band of a bitmask raster, in one pass over the raster
+
+    :param bands: (row offset, band) pairs of a 32 bit raster or a bitset, e.g. from grid_bands
+    :type bands: collections.Iterable[(int, numpy.ndarray)]
+    :param observers: Bits to unpack, defaults to the whole observer group
+    :type observers: collections.Iterable[int]
+    :return: Runs per observer, leaving out observers that see nothing
+    :rtype: dict[int, numpy.ndarray]
+    """
+    runs = {}
+    for row_offset, band in bands:
+        band = as_bitset(band)
+        if observers is None:
+            observers = range(min(OBSERVER_GROUP_SIZE, band.shape[0] * BITS_PER_PLANE))
+        observers = list(observers)
+        if not band.any():
+            continue
+        for observer in observers:
+            mask = observer_mask(band, observer)
+            if mask.any():
+                runs.setdefault(observer, []).append(mask_runs(mask, row_offset))
+    return dict((observer, np.concatenate(r)) for observer, r in runs.items())
+
+
+def runs_path(viewshed_path):
+    """
+    :type viewshed_path: str
+    :rtype: str
+    """
+    return '{}_runs.npz'.format(viewshed_path)
+
+
+def grid_header(grid):
+    """
+    :type grid: macro_viewshed_analysis.raster.grid.Grid
+    :rtype: dict
+    """
+    return dict(grid.metadata(), shape=list(grid.shape))
+
+
+def save_observer_runs(path, runs, header):
+    """
+    :type path: str
+    :type runs: dict[int, numpy.ndarray]
+    :param header: Georeferencing and shape of the raster the runs came from, see grid_header
+    :type header: dict
+    """
+    arrays = dict(('observer_{:02d}'.format(observer), r) for observer, r in runs.items())
+    np.savez_compressed(path, header=np.array(json.dumps(header)), **arrays)
+
+
+def load_observer_runs(path):
+    """
+    :type path: str
+    :return: Runs per observer and the header saved with them
+    :rtype: (dict[int, numpy.ndarray], dict)
+    """
+    with np.load(path) as f:
+        header = json.loads(str(f['header']))
+        runs = dict((int(k.split('_')[1]), f[k]) for k in f.files if k.startswith('observer_'))
+    return runs, header
+
+
+def rebase_runs(runs, header, reference):
+    """
+    Move runs read from a window of a raster into the rows and columns of the whole raster
+
+    :type runs: dict[int, numpy.ndarray]
+    :param header: Georeferencing of the window the runs came from
+    :type header: dict
+    :param reference: Georeferencing of the whole raster, on the same cell grid
+    :type reference: dict
+    :rtype: dict[int, numpy.ndarray]
+    """
+    row_offset = int(round((reference['y_max'] - header['y_max']) / reference['cell_height']))
+    col_offset = int(round((header['x_min'] - reference['x_min']) / reference['cell_width']))
+    if row_offset == 0 and col_offset == 0:
+        return runs
+    shift = np.array([row_offset, col_offset, col_offset], dtype=np.int32)
+    return dict((observer, r + shift) for observer, r in runs.items())
+
+
+def save_surface_header(viewshed_folder, header):
+    """
+    Record the georeferencing of the whole surface, which viewshed rasters clipped to a window are unpacked into
+
+    :type viewshed_folder: str
+    :type header: dict
+    """
+    with open(join(viewshed_folder, SURFACE_HEADER), 'w') as f:
+        json.dump(header, f)
+
+
+def load_surface_header(workspace):
+    """
+    :type workspace: str
+    :return: The header saved by save_surface_header, or None for workspaces from before there was one
+    :rtype: dict
+    """
+    path = join(workspace, S.FOLDER_VIEWSHEDS, SURFACE_HEADER)
+    if not exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,141 @@
+"""
+Wide observer bitsets.
+
+A 32 bit viewshed raster holds at most 32 observers, with the last one in the sign bit. A bitset holds any number:
+observer i is bit i % 8 of byte plane i // 8, stored as a (planes, rows, cols) uint8 array, i.e. a multiband
+raster with one band per 8 observers. A 32 bit raster is the same thing as four planes, so both unpack the same way.
+"""
+import numpy as np
+
+BITS_PER_PLANE = 8
+INT32_OBSERVERS = 32
+
+
+def plane_count(observers):
+    """
+    :param observers: Number of observers the bitset has to hold
+    :type observers: int
+    :rtype: int
+    """
+    return max((observers + BITS_PER_PLANE - 1) // BITS_PER_PLANE, 1)
+
+
+def observer_plane(observer):
+    """
+    :type observer: int
+    :return: The plane (0 indexed band) and bit an observer is stored in
+    :rtype: (int, int)
+    """
+    return divmod(observer, BITS_PER_PLANE)
+
+
+def empty_bitset(shape, observers):
+    """
+    :param shape: (rows, cols)
+    :type shape: (int, int)
+    :type observers: int
+    :rtype: numpy.ndarray
+    """
+    return np.zeros((plane_count(observers),) + tuple(shape), dtype=np.uint8)
+
+
+def set_observer(bits, observer, mask, row_start=0, col_start=0):
+    """
+    OR an observer's visibility into a bitset
+
+    :type bits: numpy.ndarray
+    :type observer: int
+    :param mask: Visible cells, which can cover just a window of the bitset
+    :type mask: numpy.ndarray
+    :type row_start: int
+    :type col_start: int
+    """
+    plane, bit = observer_plane(observer)
+    if plane >= bits.shape[0]:
+        raise ValueError('Observer {} does not fit in a {} plane bitset'.format(observer, bits.shape[0]))
+    rows, cols = mask.shape
+    bits[plane, row_start:row_start + rows, col_start:col_start + cols] |= \
+        mask.astype(np.uint8) << np.uint8(bit)
+
+
+def bitset_mask(bits, observer):
+    """
+    :type bits: numpy.ndarray
+    :type observer: int
+    :rtype: numpy.ndarray
+    """
+    plane, bit = observer_plane(observer)
+    return (bits[plane] >> np.uint8(bit)) & np.uint8(1) > 0
+
+
+def pack_bitset(masks):
+    """
+    :param masks: One boolean array per observer, in observer order
+    :type masks: list[numpy.ndarray]
+    :rtype: numpy.ndarray
+    """
+    bits = empty_bitset(masks[0].shape, len(masks))
+    for observer, mask in enumerate(masks):
+        set_observer(bits, observer, mask)
+    return bits
+
+
+def unpack_bitset(bits, observers=None):
+    """
+    :type bits: numpy.ndarray
+    :param observers: Number of observers to unpack, defaults to every bit
+    :type observers: int
+    :return: (observers, rows, cols) boolean array
+    :rtype: numpy.ndarray
+    """
+    if observers is None:
+        observers = bits.shape[0] * BITS_PER_PLANE
+    return np.array([bitset_mask(bits, observer) for observer in range(observers)])
+
+
+def int32_to_bitset(bits):
+    """
+    Split a 32 bit viewshed raster's cells into four byte planes, least significant first
+
+    :type bits: numpy.ndarray
+    :rtype: numpy.ndarray
+    """
+    little_endian = np.ascontiguousarray(bits, dtype=np.int32).astype('<i4')
+    return np.rollaxis(little_endian.view(np.uint8).reshape(bits.shape + (4,)), -1)
+
+
+def bitset_to_int32(bits):
+    """
+    The 32 bit raster Viewshed2_3d would have written, for bitsets of up to 32 observers
+
+    :type bits: numpy.ndarray
+    :rtype: numpy.ndarray
+    """
+    if bits.shape[0] > INT32_OBSERVERS // BITS_PER_PLANE:
+        raise ValueError('A {} plane bitset does not fit in a 32 bit raster'.format(bits.shape[0]))
+    packed = np.zeros(bits.shape[1:], dtype=np.uint32)
+    for plane in range(bits.shape[0]):
+        packed |= bits[plane].astype(np.uint32) << np.uint32(plane * BITS_PER_PLANE)
+    return packed.view(np.int32)
+
+
+def as_bitset(band):
+    """
+    :param band: A band of a 32 bit viewshed raster (rows, cols) or of a bitset (planes, rows, cols)
+    :type band: numpy.ndarray
+    :rtype: numpy.ndarray
+    """
+    band = np.asarray(band)
+    if band.ndim == 2:
+        return int32_to_bitset(band)
+    return band.astype(np.uint8, copy=False)
+
+
+def int32_bit(observer):
+    """
+    The value of an observer's bit in a 32 bit raster, for BitwiseAnd. Bit 31 is the sign bit, hence -2 ** 31.
+
+    :type observer: int
+    :rtype: int
+    """
+    return int(np.array(1 << observer, dtype=np.uint32).view(np.int32))
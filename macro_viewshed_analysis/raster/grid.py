@@ -0,0 +1,150 @@
+"""
+A minimal georeferenced array so the numeric parts of the pipeline don't need arcpy rasters
+"""
+import json
+from math import cos, radians
+
+import numpy as np
+
+METERS_PER_DEGREE = 111320.0
+
+
+class Grid(object):
+    """
+    A 2D array with the top-left corner at (x_min, y_max). Row 0 is the northern edge, like every
+    raster arcpy hands back from RasterToNumPyArray.
+    """
+
+    def __init__(self, data, x_min, y_max, cell_width, cell_height=None, nodata=None, geographic=False):
+        """
+        :type data: numpy.ndarray
+        :type x_min: float
+        :type y_max: float
+        :type cell_width: float
+        :type cell_height: float
+        :type nodata: float
+        :param geographic: True if the coordinates are degrees (e.g. the output of utils.reproject)
+        :type geographic: bool
+        """
+        self.data = data
+        self.x_min = float(x_min)
+        self.y_max = float(y_max)
+        self.cell_width = float(cell_width)
+        self.cell_height = float(cell_width if cell_height is None else cell_height)
+        self.nodata = nodata
+        self.geographic = bool(geographic)
+
+    @property
+    def shape(self):
+        return self.data.shape[-2:]
+
+    @property
+    def x_max(self):
+        return self.x_min + self.shape[1] * self.cell_width
+
+    @property
+    def y_min(self):
+        return self.y_max - self.shape[0] * self.cell_height
+
+    def cell_index(self, x, y):
+        """
+        :type x: float | numpy.ndarray
+        :type y: float | numpy.ndarray
+        :rtype: (int | numpy.ndarray, int | numpy.ndarray)
+        """
+        row = np.floor((self.y_max - np.asarray(y, dtype=float)) / self.cell_height).astype(np.int64)
+        col = np.floor((np.asarray(x, dtype=float) - self.x_min) / self.cell_width).astype(np.int64)
+        return row, col
+
+    def cell_centre(self, row, col):
+        """
+        :type row: int | numpy.ndarray
+        :type col: int | numpy.ndarray
+        :rtype: (float | numpy.ndarray, float | numpy.ndarray)
+        """
+        x = self.x_min + (np.asarray(col) + 0.5) * self.cell_width
+        y = self.y_max - (np.asarray(row) + 0.5) * self.cell_height
+        return x, y
+
+    def cell_size_meters(self, row=None):
+        """
+        Ground size of a cell. Geographic grids use a local equirectangular approximation at the
+        latitude of `row` (the centre row if not given), which is good to well under a cell over 300 km.
+
+        :type row: int
+        :rtype: (float, float)
+        """
+        if not self.geographic:
+            return self.cell_width, self.cell_height
+        if row is None:
+            row = self.shape[0] // 2
+        _, lat = self.cell_centre(row, 0)
+        return (self.cell_width * METERS_PER_DEGREE * cos(radians(float(lat))),
+                self.cell_height * METERS_PER_DEGREE)
+
+    def window(self, row_start, row_stop, col_start, col_stop):
+        """
+        A view onto part of the grid. No data is copied.
+
+        :rtype: Grid
+        """
+        return Grid(
+            self.data[..., row_start:row_stop, col_start:col_stop],
+            self.x_min + col_start * self.cell_width,
+            self.y_max - row_start * self.cell_height,
+            self.cell_width, self.cell_height, self.nodata, self.geographic
+        )
+
+    def like(self, data, nodata=None):
+        """
+        A new grid with the same georeferencing as this one
+
+        :type data: numpy.ndarray
+        :rtype: Grid
+        """
+        return Grid(data, self.x_min, self.y_max, self.cell_width, self.cell_height, nodata, self.geographic)
+
+    def metadata(self):
+        return {
+            'x_min': self.x_min,
+            'y_max': self.y_max,
+            'cell_width': self.cell_width,
+            'cell_height': self.cell_height,
+            'nodata': None if self.nodata is None else float(self.nodata),
+            'geographic': self.geographic,
+        }
+
+
+def grid_paths(path):
+    """
+    Grids are stored as a raw .npy array (so they can be memory mapped) next to a .json header
+
+    :type path: str
+    :rtype: (str, str)
+    """
+    return '{}.npy'.format(path), '{}.json'.format(path)
+
+
+def save_grid(grid, path):
+    """
+    :type grid: Grid
+    :type path: str
+    """
+    array_path, header_path = grid_paths(path)
+    np.save(array_path, grid.data)
+    with open(header_path, 'w') as f:
+        json.dump(grid.metadata(), f)
+
+
+def load_grid(path, mmap=False):
+    """
+    :type path: str
+    :param mmap: Memory map the array instead of reading it in
+    :type mmap: bool
+    :rtype: Grid
+    """
+    array_path, header_path = grid_paths(path)
+    with open(header_path) as f:
+        header = json.load(f)
+    data = np.load(array_path, mmap_mode='r' if mmap else None)
+    return Grid(data, **header)
@@ -0,0 +1,220 @@
+"""
+A max elevation pyramid over the sea level surface, so sightlines can stop as soon as nothing further along them
+could be seen.
+
+Level i of the pyramid holds the highest cell in each 2^(i+1) x 2^(i+1) block of the surface. For an observer, the
+blocks over its search window give an upper bound on the height of every cell at least a distance D away, and so
+on the elevation angle any of them could have once the earth's curvature is taken off. A sightline whose horizon is
+already above that bound can't see anything past D, which over open sea is anywhere beyond the geometric horizon.
+The bound never cuts a sightline short of a cell it would have seen, so viewsheds come out the same with or without
+it.
+
+The pyramid depends only on the surface, so it is built once per sea level, saved beside the viewsheds and memory
+mapped by every observer group and worker process.
+"""
+import json
+from os import makedirs, remove
+from os.path import exists, join
+
+import numpy as np
+
+# Blocks an observer's bound is made from. The finest level with no more than this many over the window is used.
+MAX_HORIZON_BLOCKS = 4096
+
+
+def build_max_pyramid(surface):
+    """
+    :param surface: Elevations, already clamped to sea level
+    :type surface: numpy.ndarray
+    :return: The highest cell of every 2x2 block, then every 4x4 block and so on up to a single block
+    :rtype: list[numpy.ndarray]
+    """
+    level = np.asarray(surface)
+    dtype = level.dtype if level.dtype.kind == 'f' else np.float64
+    levels = []
+    while not levels or level.shape != (1, 1):
+        rows, cols = level.shape
+        padded = np.full((rows + rows % 2, cols + cols % 2), -np.inf, dtype=dtype)
+        padded[:rows, :cols] = level
+        level = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2).max(axis=(1, 3))
+        levels.append(level)
+    return levels
+
+
+class MaxPyramid(object):
+    def __init__(self, levels, shape, row_offset=0, col_offset=0):
+        """
+        :param levels: From build_max_pyramid, for the whole surface
+        :type levels: list[numpy.ndarray]
+        :param shape: (rows, cols) of the part of the surface this covers
+        :type shape: (int, int)
+        :param row_offset: Where that part starts in the whole surface
+        :type row_offset: int
+        :type col_offset: int
+        """
+        self.levels = levels
+        self.shape = tuple(shape)
+        self.row_offset = row_offset
+        self.col_offset = col_offset
+
+    def window(self, row_start, row_stop, col_start, col_stop):
+        """
+        The pyramid for a window of this one, as Grid.window. Nothing is copied.
+
+        :rtype: MaxPyramid
+        """
+        return MaxPyramid(self.levels, (row_stop - row_start, col_stop - col_start),
+                          self.row_offset + row_start, self.col_offset + col_start)
+
+    def blocks(self, max_blocks=MAX_HORIZON_BLOCKS):
+        """
+        The blocks over this window at the finest level with at most max_blocks of them
+
+        :type max_blocks: int
+        :return: First and last row and column of each block, clipped to the window and in its cells, and the
+            highest cell in each (which may be outside the window)
+        :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray)
+        """
+        rows, cols = self.shape
+        for level, maxima in enumerate(self.levels):
+            size = 2 ** (level + 1)
+            first_row, last_row = self.row_offset // size, (self.row_offset + rows - 1) // size
+            first_col, last_col = self.col_offset // size, (self.col_offset + cols - 1) // size
+            if (last_row - first_row + 1) * (last_col - first_col + 1) <= max_blocks:
+                break
+        block_rows, block_cols = np.mgrid[first_row:last_row + 1, first_col:last_col + 1]
+        return (
+            np.maximum(block_rows * size - self.row_offset, 0).ravel(),
+            np.minimum((block_rows + 1) * size - 1 - self.row_offset, rows - 1).ravel(),
+            np.maximum(block_cols * size - self.col_offset, 0).ravel(),
+            np.minimum((block_cols + 1) * size - 1 - self.col_offset, cols - 1).ravel(),
+            np.asarray(maxima[first_row:last_row + 1, first_col:last_col + 1], dtype=np.float64).ravel(),
+        )
+
+
+class SightlineCeiling(object):
+    """
+    The highest elevation angle anything at least a given distance from an observer could be seen at
+    """
+
+    def __init__(self, pyramid, row, col, observer_z, cell_dx, cell_dy, curvature, max_radius):
+        """
+        :param pyramid: Over the observer's search window
+        :type pyramid: MaxPyramid
+        :param row: The observer's cell, in the window
+        :type row: int
+        :type col: int
+        :param observer_z: Height of the observer's eye
+        :type observer_z: float
+        :type cell_dx: float
+        :type cell_dy: float
+        :param curvature: Drop per metre squared, (1 - refractivity) / earth diameter
+        :type curvature: float
+        :type max_radius: float
+        """
+        first_rows, last_rows, first_cols, last_cols, maxima = pyramid.blocks()
+        far = np.hypot(np.maximum(np.abs(first_rows - row), np.abs(last_rows - row)) * cell_dy,
+                       np.maximum(np.abs(first_cols - col), np.abs(last_cols - col)) * cell_dx)
+        order = np.argsort(far)
+        self.far = far[order]
+        # The highest block whose furthest cell is at least as far as each block's
+        self.highest = np.append(np.maximum.accumulate(maxima[order][::-1])[::-1], -np.inf)
+        self.observer_z = observer_z
+        self.curvature = curvature
+        self.max_radius = max_radius
+
+    def highest_beyond(self, distance):
+        """
+        :param distance: Metres from the observer
+        :type distance: numpy.ndarray
+        :return: An upper bound on the height of every cell at least distance away
+        :rtype: numpy.ndarray
+        """
+        return self.highest[np.searchsorted(self.far, distance)]
+
+    def angle(self, distance):
+        """
+        :param distance: Metres from the observer, more than 0
+        :type distance: numpy.ndarray
+        :return: An upper bound on the elevation angle of every cell from distance out to max_radius
+        :rtype: numpy.ndarray
+        """
+        rise = self.highest_beyond(distance) - self.observer_z
+        k, radius = self.curvature, self.max_radius
+        # rise / d - k * d peaks at an end of [distance, max_radius], or where it turns if the rise is negative
+        ceiling = np.maximum(rise / distance - k * distance, rise / radius - k * radius)
+        if k > 0:
+            drop = np.maximum(-rise, 0.0)
+            turn = np.sqrt(drop / k)
+            turns_inside = (rise < 0) & (turn > distance) & (turn < radius)
+            ceiling = np.where(turns_inside, np.maximum(ceiling, -2.0 * np.sqrt(drop * k)), ceiling)
+        return ceiling
+
+
+def horizon_path(folder, sea_level):
+    """
+    :type folder: str
+    :type sea_level: float
+    :rtype: str
+    """
+    return join(folder, 'horizon_{}'.format(sea_level))
+
+
+def save_max_pyramid(path, levels, key):
+    """
+    :param path: A folder, one .npy per level goes in it
+    :type path: str
+    :type levels: list[numpy.ndarray]
+    :param key: What the pyramid was built from, checked when it's loaded
+    :type key: dict
+    """
+    info_path = join(path, 'horizon.json')
+    if exists(info_path):
+        remove(info_path)
+    elif not exists(path):
+        makedirs(path)
+    for i, level in enumerate(levels):
+        np.save(join(path, 'level_{:02d}.npy'.format(i)), level)
+    # Written last, so a pyramid that was cut short doesn't load
+    with open(info_path, 'w') as f:
+        json.dump(dict(key=key, levels=len(levels)), f, sort_keys=True)
+
+
+def load_max_pyramid(path, key):
+    """
+    :type path: str
+    :type key: dict
+    :return: The saved levels, memory mapped, or None if there aren't any or they were built from something else
+    :rtype: list[numpy.ndarray]
+    """
+    info_path = join(path, 'horizon.json')
+    if not exists(info_path):
+        return None
+    with open(info_path) as f:
+        info = json.load(f)
+    if info['key'] != json.loads(json.dumps(key, sort_keys=True)):
+        return None
+    return [np.load(join(path, 'level_{:02d}.npy'.format(i)), mmap_mode='r') for i in range(info['levels'])]
+
+
+def cached_max_pyramid(folder, sea_level, surface_grid, source=None, rebuild=False):
+    """
+    Load the pyramid for this sea level from folder, building and saving it first if it isn't there
+
+    :type folder: str
+    :type sea_level: float
+    :param surface_grid: The sea level surface
+    :type surface_grid: macro_viewshed_analysis.raster.grid.Grid
+    :param source: Fingerprint of the DEM the surface came from, so a changed DEM isn't read through an old pyramid
+    :type source: str
+    :param rebuild: Build it even if there's one saved already
+    :type rebuild: bool
+    :rtype: MaxPyramid
+    """
+    path = horizon_path(folder, sea_level)
+    key = dict(surface_grid.metadata(), shape=list(surface_grid.shape), sea_level=sea_level, source=source)
+    levels = None if rebuild else load_max_pyramid(path, key)
+    if levels is None:
+        levels = build_max_pyramid(surface_grid.data)
+        save_max_pyramid(path, levels, key)
+    return MaxPyramid(levels, surface_grid.shape)
@@ -0,0 +1,215 @@
+"""
+Island labels for every sea level from one pass over the DEM.
+
+Land at sea level L is every cell above L. Lowering L only ever adds cells and joins islands, so one union-find
+built over the cells from the highest down labels every level in turn: the islands at L are the components once
+every cell and edge above L has been added. Each island is labelled with the index of its highest cell (ties to
+the lower index), so an island keeps its label from level to level and when two islands join the one with the
+higher peak keeps its label. Cells are 4-connected, as RasterToPolygon_conversion treats them.
+
+The DEM is labelled a band of rows at a time. Islands crossing a band edge are joined afterwards from the rows on
+either side of each edge, so the labels come out the same however the DEM is banded.
+"""
+import json
+from os.path import join
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from macro_viewshed_analysis.raster.grid import grid_paths
+
+NO_ISLAND = -1
+
+# Default cap on cells labelled per band. The union-find needs about 60 bytes per cell.
+MAX_LABEL_CELLS = 4 * 1024 * 1024
+
+
+def _edge_ranks(rank, z):
+    """
+    :param rank: Rank of each cell from the highest down
+    :type rank: numpy.ndarray
+    :param z: Elevation of each cell, NaN for nodata
+    :type z: numpy.ndarray
+    :return: The ranks at either end of every edge between neighbouring cells, and the lower elevation of the
+             two (NaN if either is nodata), ordered from the highest edge down
+    :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+    """
+    a = np.concatenate([rank[:, :-1].ravel(), rank[:-1, :].ravel()])
+    b = np.concatenate([rank[:, 1:].ravel(), rank[1:, :].ravel()])
+    level = np.minimum(np.concatenate([z[:, :-1].ravel(), z[:-1, :].ravel()]),
+                       np.concatenate([z[:, 1:].ravel(), z[1:, :].ravel()]))
+    order = np.argsort(-level, kind='mergesort')  # NaNs sort last
+    return a[order], b[order], level[order]
+
+
+def _compress(parent):
+    while True:
+        grandparent = parent[parent]
+        if np.array_equal(grandparent, parent):
+            return
+        parent[:] = grandparent
+
+
+def _union(parent, a, b):
+    """
+    Join the components at either end of each edge. Roots are the lowest rank, i.e. the highest cell.
+
+    :param parent: Fully compressed union-find over ranks, updated in place
+    :type parent: numpy.ndarray
+    """
+    while len(a):
+        root_a, root_b = parent[a], parent[b]
+        differ = root_a != root_b
+        if not differ.any():
+            return
+        a, b, root_a, root_b = a[differ], b[differ], root_a[differ], root_b[differ]
+        np.minimum.at(parent, np.maximum(root_a, root_b), np.minimum(root_a, root_b))
+        _compress(parent)
+
+
+def label_band(dem, sea_levels, index_offset=0):
+    """
+    Islands within one band of rows, a sea level at a time
+
+    :param dem: Elevations, NaN for nodata
+    :type dem: numpy.ndarray
+    :param sea_levels: Levels from the highest down
+    :type sea_levels: list[float]
+    :param index_offset: Flat index of the band's first cell in the whole DEM
+    :type index_offset: int
+    :return: Per level, the label of each cell (NO_ISLAND for sea) and the elevation of that label's peak
+    :rtype: collections.Iterable[(numpy.ndarray, numpy.ndarray)]
+    """
+    z = np.asarray(dem, dtype=float)
+    flat = z.ravel()
+    order = np.argsort(-flat, kind='mergesort')  # NaNs sort last
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    a, b, edge_level = _edge_ranks(rank.reshape(z.shape), z)
+    sorted_z = flat[order]
+
+    parent = np.arange(len(order), dtype=np.int64)
+    added = 0
+    for level in sea_levels:
+        with np.errstate(invalid='ignore'):
+            count = int(np.searchsorted(-edge_level, -level, side='left'))
+            land = rank < int((sorted_z > level).sum())
+        _union(parent, a[added:count], b[added:count])
+        added = max(added, count)
+        roots = parent[rank[land]]
+        labels = np.full(len(flat), NO_ISLAND, dtype=np.int64)
+        peaks = np.full(len(flat), np.nan)
+        labels[land] = order[roots] + index_offset
+        peaks[land] = sorted_z[roots]
+        yield labels.reshape(z.shape), peaks.reshape(z.shape)
+
+
+class _ElderUnion(object):
+    """
+    Union-find over labels where the island with the higher peak, then the lower label, survives a join
+    """
+
+    def __init__(self):
+        self.parent = {}
+        self.peak = {}
+
+    def find(self, label):
+        root = label
+        while self.parent.get(root, root) != root:
+            root = self.parent[root]
+        while label != root:
+            self.parent[label], label = root, self.parent[label]
+        return root
+
+    def union(self, a, peak_a, b, peak_b):
+        self.peak.setdefault(a, peak_a)
+        self.peak.setdefault(b, peak_b)
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if (-self.peak[a], a) > (-self.peak[b], b):
+            a, b = b, a
+        self.parent[b] = a
+
+    def mapping(self):
+        """
+        :return: Labels that changed and what they changed to, sorted by the old label
+        :rtype: (numpy.ndarray, numpy.ndarray)
+        """
+        old = np.array(sorted(self.parent), dtype=np.int64)
+        new = np.array([self.find(label) for label in old.tolist()], dtype=np.int64)
+        changed = old != new
+        return old[changed], new[changed]
+
+
+def remap(labels, old, new):
+    """
+    :type labels: numpy.ndarray
+    :param old: Sorted labels to replace
+    :type old: numpy.ndarray
+    :type new: numpy.ndarray
+    :rtype: numpy.ndarray
+    """
+    if len(old) == 0:
+        return labels
+    position = np.clip(np.searchsorted(old, labels), 0, len(old) - 1)
+    return np.where(old[position] == labels, new[position], labels)
+
+
+def level_path(folder, sea_level):
+    """
+    :type folder: str
+    :type sea_level: float
+    :rtype: str
+    """
+    return join(folder, 'islands_{}'.format(sea_level))
+
+
+def label_sea_levels(bands, header, sea_levels, folder):
+    """
+    Label the islands at every sea level, saving each level as a grid (see raster.grid.load_grid)
+
+    :param bands: (row offset, elevation band) pairs covering the DEM top to bottom, NaN for nodata
+    :type bands: collections.Iterable[(int, numpy.ndarray)]
+    :param header: Georeferencing and shape of the DEM, see raster.bitmask.grid_header
+    :type header: dict
+    :type sea_levels: collections.Iterable[float]
+    :param folder: Where to save the label grids
+    :type folder: str
+    :return: Sea level -> saved label grid path
+    :rtype: dict[float, str]
+    """
+    sea_levels = sorted(set(sea_levels), reverse=True)
+    rows, cols = header['shape']
+    paths = dict((level, level_path(folder, level)) for level in sea_levels)
+    outputs = []
+    for level in sea_levels:
+        array_path, header_path = grid_paths(paths[level])
+        with open(header_path, 'w') as f:
+            json.dump(dict(dict((k, v) for k, v in header.items() if k != 'shape'), nodata=NO_ISLAND), f)
+        outputs.append(open_memmap(array_path, mode='w+', dtype=np.int64, shape=(rows, cols)))
+
+    joins = [_ElderUnion() for _ in sea_levels]
+    above = [None] * len(sea_levels)
+    band_starts = []
+    for start, band in bands:
+        levels = label_band(band, sea_levels, start * cols)
+        for i, (labels, peaks) in enumerate(levels):
+            outputs[i][start:start + len(band)] = labels
+            if above[i] is not None:
+                above_labels, above_peaks = above[i]
+                both = (above_labels != NO_ISLAND) & (labels[0] != NO_ISLAND)
+                pairs = set(zip(above_labels[both].tolist(), above_peaks[both].tolist(),
+                                labels[0][both].tolist(), peaks[0][both].tolist()))
+                for label_a, peak_a, label_b, peak_b in pairs:
+                    joins[i].union(label_a, peak_a, label_b, peak_b)
+            above[i] = labels[-1].copy(), peaks[-1].copy()
+        band_starts.append((start, len(band)))
+
+    for joined, output in zip(joins, outputs):
+        old, new = joined.mapping()
+        if len(old):
+            for start, length in band_starts:
+                output[start:start + length] = remap(output[start:start + length], old, new)
+        output.flush()
+    return paths
@@ -0,0 +1,205 @@
+"""
+Line of sight viewsheds in NumPy. A stand in for Viewshed2_3d that runs without an ArcGIS licence.
+
+Sightlines are swept R2 style: one ray from the observer to every cell on the perimeter of its search
+window, with each cell on the ray visible if its elevation angle is at least the highest angle seen
+closer to the observer. All of the rays for an observer are walked at once. Given a max elevation pyramid, rays
+are walked in segments and dropped once their horizon is above any angle the cells left on them could reach.
+"""
+from math import ceil
+
+import numpy as np
+
+from macro_viewshed_analysis.config import ViewshedParameters as V
+from macro_viewshed_analysis.raster.bitset import BITS_PER_PLANE, INT32_OBSERVERS, bitset_to_int32, empty_bitset, \
+    set_observer
+from macro_viewshed_analysis.raster.horizon import SightlineCeiling
+
+# Viewshed2 corrects for curvature using the diameter of the earth in metres
+EARTH_DIAMETER = 12740000.0
+
+# Keeps the (rays x steps) working arrays to roughly 64 MB of float64s
+MAX_RAY_SAMPLES = 8 * 1024 * 1024
+
+# Steps walked between checks against a sightline ceiling, and the slack the check leaves for rounding
+SEGMENT_STEPS = 64
+CEILING_MARGIN = 1e-12
+
+
+def sea_level_surface(dem, sea_level):
+    """
+    Equivalent to Con(r > sea_level, r, sea_level)
+
+    :type dem: numpy.ndarray
+    :type sea_level: float
+    :rtype: numpy.ndarray
+    """
+    return np.maximum(dem, sea_level)
+
+
+def perimeter_cells(rows, cols):
+    """
+    :type rows: int
+    :type cols: int
+    :rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    r = np.arange(rows)
+    c = np.arange(1, cols - 1)
+    perimeter_rows = np.concatenate([r, r, np.zeros_like(c), np.full_like(c, rows - 1)])
+    perimeter_cols = np.concatenate([np.zeros_like(r), np.full_like(r, cols - 1), c, c])
+    return perimeter_rows, perimeter_cols
+
+
+def _sweep_rays(surface, row, col, observer_z, target_rows, target_cols, cell_dx, cell_dy, max_radius,
+                refractivity, visible, ceiling=None):
+    d_rows = target_rows - row
+    d_cols = target_cols - col
+    steps = np.maximum(np.abs(d_rows), np.abs(d_cols))
+    longest = int(steps.max())
+    if longest == 0:
+        return
+
+    # Without a ceiling every ray is walked to its end in one go. With one, rays are walked a segment at a time
+    # and dropped once nothing further along them can be seen.
+    segment = longest if ceiling is None else SEGMENT_STEPS
+    rays = np.arange(len(steps))
+    horizon = np.full(len(steps), -np.inf)
+    for first in range(1, longest + 1, segment):
+        t = np.arange(first, min(first + segment, longest + 1))
+        fraction = t[np.newaxis, :] / np.maximum(steps[rays], 1)[:, np.newaxis].astype(float)
+        on_ray = fraction <= 1.0
+        sample_rows = row + np.rint(d_rows[rays, np.newaxis] * fraction).astype(np.int64)
+        sample_cols = col + np.rint(d_cols[rays, np.newaxis] * fraction).astype(np.int64)
+        sample_rows[~on_ray] = row
+        sample_cols[~on_ray] = col
+
+        distance = np.hypot((sample_rows - row) * cell_dy, (sample_cols - col) * cell_dx)
+        reached = distance[:, -1].copy()
+        in_range = on_ray & (distance <= max_radius) & (distance > 0)
+        distance[~in_range] = 1.0
+
+        z = surface[sample_rows, sample_cols] - distance ** 2 * (1.0 - refractivity) / EARTH_DIAMETER
+        angle = (z - observer_z) / distance
+        angle[~in_range] = -np.inf
+
+        running = np.maximum.accumulate(np.concatenate([horizon[rays, np.newaxis], angle], axis=1), axis=1)
+        seen = in_range & (angle >= running[:, :-1])
+        visible[sample_rows[seen], sample_cols[seen]] = True
+        horizon[rays] = running[:, -1]
+
+        if ceiling is not None:
+            # Everything left on a ray is at least as far as the last cell it reached
+            going = (steps[rays] > t[-1]) & (reached < max_radius)
+            going[going] = ~(horizon[rays[going]] > ceiling.angle(reached[going]) + CEILING_MARGIN)
+            rays = rays[going]
+            if len(rays) == 0:
+                break
+
+
+def observer_visibility(surface, row, col, observer_z, cell_dx, cell_dy, max_radius=None, refractivity=None,
+                        horizon=None):
+    """
+    Cells of `surface` visible from the observer at (row, col), limited to the observer's search window.
+
+    :param surface: Elevations in metres, already clamped to sea level
+    :type surface: numpy.ndarray
+    :type row: int
+    :type col: int
+    :param observer_z: Height of the observer's eye in metres (surface plus observer offset)
+    :type observer_z: float
+    :type cell_dx: float
+    :type cell_dy: float
+    :type max_radius: float
+    :type refractivity: float
+    :param horizon: Max elevation pyramid over `surface`, to stop sightlines early
+    :type horizon: macro_viewshed_analysis.raster.horizon.MaxPyramid
+    :return: The visibility mask and the (row, col) of its top-left corner within `surface`
+    :rtype: (numpy.ndarray, (int, int))
+    """
+    if max_radius is None:
+        max_radius = float(V.OUTER_RADIUS_METERS)
+    if refractivity is None:
+        refractivity = float(V.REFRACTIVITY_COEFFICIENT)
+    rows, cols = surface.shape
+    reach_rows = int(ceil(max_radius / cell_dy))
+    reach_cols = int(ceil(max_radius / cell_dx))
+    row_start, row_stop = max(row - reach_rows, 0), min(row + reach_rows + 1, rows)
+    col_start, col_stop = max(col - reach_cols, 0), min(col + reach_cols + 1, cols)
+
+    window = surface[row_start:row_stop, col_start:col_stop]
+    local_row, local_col = row - row_start, col - col_start
+    visible = np.zeros(window.shape, dtype=bool)
+    visible[local_row, local_col] = True
+    ceiling = None
+    if horizon is not None:
+        ceiling = SightlineCeiling(horizon.window(row_start, row_stop, col_start, col_stop), local_row, local_col,
+                                   observer_z, cell_dx, cell_dy, (1.0 - refractivity) / EARTH_DIAMETER, max_radius)
+
+    target_rows, target_cols = perimeter_cells(*window.shape)
+    longest = max(window.shape)
+    chunk = max(MAX_RAY_SAMPLES // longest, 1)
+    for start in range(0, len(target_rows), chunk):
+        _sweep_rays(window, local_row, local_col, observer_z,
+                    target_rows[start:start + chunk], target_cols[start:start + chunk],
+                    cell_dx, cell_dy, max_radius, refractivity, visible, ceiling)
+    return visible, (row_start, col_start)
+
+
+def viewshed_bitset(surface_grid, observers, observer_offset=None, max_radius=None, refractivity=None, horizon=None):
+    """
+    Run every observer in a group into a bitset (see raster.bitset), which holds any number of observers
+
+    :type surface_grid: macro_viewshed_analysis.raster.grid.Grid
+    :param observers: (x, y, z, observer) per observer. z is the ground height, None to read it off the surface
+    :type observers: collections.Iterable[(float, float, float | None, int)]
+    :type observer_offset: float
+    :type max_radius: float
+    :type refractivity: float
+    :param horizon: Max elevation pyramid over surface_grid (see raster.horizon), None to walk every sightline out
+        to the edge of its window
+    :type horizon: macro_viewshed_analysis.raster.horizon.MaxPyramid
+    :return: (planes, rows, cols) uint8
+    :rtype: numpy.ndarray
+    """
+    if observer_offset is None:
+        observer_offset = float(V.OBSERVER_OFFSET_METERS)
+    observers = list(observers)
+    surface = np.asarray(surface_grid.data, dtype=np.float64)
+    bits = empty_bitset(surface.shape, max([o[3] for o in observers] or [0]) + 1)
+    for x, y, z, observer in observers:
+        row, col = surface_grid.cell_index(x, y)
+        row, col = int(row), int(col)
+        if not (0 <= row < surface.shape[0] and 0 <= col < surface.shape[1]):
+            continue
+        if z is None:
+            z = surface[row, col]
+        cell_dx, cell_dy = surface_grid.cell_size_meters(row)
+        visible, (row_start, col_start) = observer_visibility(
+            surface, row, col, float(z) + observer_offset, cell_dx, cell_dy, max_radius, refractivity, horizon
+        )
+        set_observer(bits, observer, visible, row_start, col_start)
+    return bits
+
+
+def viewshed_bitmask(surface_grid, observers, observer_offset=None, max_radius=None, refractivity=None,
+                     horizon=None):
+    """
+    Run every observer in a group and pack the results the way Viewshed2_3d's OBSERVERS analysis does:
+    bit `observer` of each cell is set when that observer can see it. Bit 31 is the sign bit, which is
+    why callers test it with BitwiseAnd(r, -1 << 31).
+
+    :type surface_grid: macro_viewshed_analysis.raster.grid.Grid
+    :param observers: (x, y, z, observer) per observer. z is the ground height, None to read it off the surface
+    :type observers: collections.Iterable[(float, float, float | None, int)]
+    :type observer_offset: float
+    :type max_radius: float
+    :type refractivity: float
+    :type horizon: macro_viewshed_analysis.raster.horizon.MaxPyramid
+    :rtype: numpy.ndarray
+    """
+    observers = list(observers)
+    for (_, _, _, observer) in observers:
+        if not 0 <= observer < INT32_OBSERVERS:
+            raise ValueError('Observer {} does not fit in a 32 bit viewshed raster'.format(observer))
+    bits = viewshed_bitset(surface_grid, observers, observer_offset, max_radius, refractivity, horizon)
+    return bitset_to_int32(bits[:INT32_OBSERVERS // BITS_PER_PLANE])
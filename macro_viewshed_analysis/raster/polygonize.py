@@ -0,0 +1,176 @@
+"""
+Boolean rasters to polygon rings, without RasterToPolygon_conversion.
+
+Rings follow cell edges like RasterToPolygon with simplification off. Every edge between a visible cell and an
+invisible one is traced with the visible cell on its right, so outer rings come out clockwise and holes
+anticlockwise, the orientation Esri geometries expect. Where two visible cells only touch at a corner the trace
+turns right, keeping them in separate rings. That joins the invisible cells at the corner instead, so a ring that
+comes back to a vertex it has already passed through is split there: holes touching each other at a corner, or
+touching the outside, come out as rings of their own rather than as one ring that touches itself.
+"""
+import numpy as np
+
+from macro_viewshed_analysis.raster.bitmask import runs_to_mask
+
+EAST, SOUTH, WEST, NORTH = range(4)
+
+
+def _boundary_edges(mask):
+    """
+    :return: start vertex row, start vertex col and direction of every boundary edge
+    :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+    """
+    padded = np.pad(mask, 1, mode='constant')
+    inside = padded[1:-1, 1:-1]
+    starts_r, starts_c, dirs = [], [], []
+    for direction, neighbour, (dr, dc) in [
+        (EAST, padded[:-2, 1:-1], (0, 0)),  # top edge, heading east from the top-left corner
+        (SOUTH, padded[1:-1, 2:], (0, 1)),  # right edge, heading south from the top-right corner
+        (WEST, padded[2:, 1:-1], (1, 1)),  # bottom edge, heading west from the bottom-right corner
+        (NORTH, padded[1:-1, :-2], (1, 0)),  # left edge, heading north from the bottom-left corner
+    ]:
+        r, c = np.nonzero(inside & ~neighbour)
+        starts_r.append(r + dr)
+        starts_c.append(c + dc)
+        dirs.append(np.full(len(r), direction, dtype=np.int8))
+    return np.concatenate(starts_r), np.concatenate(starts_c), np.concatenate(dirs)
+
+
+def mask_rings(mask):
+    """
+    :type mask: numpy.ndarray
+    :return: Rings as closed (n, 2) arrays of (row, col) cell corners
+    :rtype: list[numpy.ndarray]
+    """
+    mask = np.asarray(mask, dtype=bool)
+    start_r, start_c, dirs = _boundary_edges(mask)
+    if len(dirs) == 0:
+        return []
+    width = mask.shape[1] + 1
+    step_r = np.array([0, 1, 0, -1])[dirs]
+    step_c = np.array([1, 0, -1, 0])[dirs]
+    start = start_r.astype(np.int64) * width + start_c
+    end = (start_r + step_r).astype(np.int64) * width + (start_c + step_c)
+
+    # A vertex has one outgoing edge, or two where cells touch diagonally. Take the right turn in that case.
+    order = np.lexsort((dirs, start))
+    sorted_start = start[order]
+    first = np.searchsorted(sorted_start, end, side='left')
+    count = np.searchsorted(sorted_start, end, side='right') - first
+    candidate = order[first]
+    second = order[np.minimum(first + 1, len(order) - 1)]
+    right_turn = (dirs + 1) % 4
+    successor = np.where((count == 2) & (dirs[second] == right_turn), second, candidate)
+
+    successor = successor.tolist()
+    corner = (dirs != dirs[successor]).tolist()
+    visited = bytearray(len(successor))
+    rings = []
+    for e in range(len(successor)):
+        if visited[e]:
+            continue
+        ring = []
+        current = e
+        while not visited[current]:
+            visited[current] = 1
+            if corner[current]:
+                ring.append(successor[current])
+            current = successor[current]
+        ring = np.array(ring)
+        if len(np.unique(start[ring])) < len(ring):
+            parts = _split_at_repeats(ring, start[ring].tolist())
+        else:
+            parts = [ring]
+        for part in parts:
+            vertices = np.column_stack([start_r[part], start_c[part]])
+            rings.append(np.vstack([vertices, vertices[:1]]))
+    return rings
+
+
+def _split_at_repeats(ring, vertex_ids):
+    """
+    :param ring: Edges starting at each corner of a ring
+    :type ring: numpy.ndarray
+    :param vertex_ids: The vertex each of them starts at
+    :type vertex_ids: list[int]
+    :return: The ring cut into loops that each pass through a vertex once
+    :rtype: list[numpy.ndarray]
+    """
+    parts = []
+    path, position = [], {}
+    for edge, vertex in zip(ring.tolist(), vertex_ids):
+        i = position.get(vertex)
+        if i is None:
+            position[vertex] = len(path)
+            path.append((edge, vertex))
+            continue
+        # Everything since the vertex was last passed is a loop of its own. The path carries on out of the vertex
+        # along this edge.
+        parts.append(np.array([e for e, _ in path[i:]]))
+        for _, v in path[i + 1:]:
+            del position[v]
+        path[i:] = [(edge, vertex)]
+    parts.append(np.array([e for e, _ in path]))
+    return parts
+
+
+def rings_to_map(rings, header, row_offset=0, col_offset=0):
+    """
+    Convert (row, col) corner rings to map coordinates
+
+    :param header: x_min, y_max, cell_width and cell_height of the raster
+    :type header: dict
+    :rtype: list[numpy.ndarray]
+    """
+    converted = []
+    for ring in rings:
+        x = header['x_min'] + (ring[:, 1] + col_offset) * header['cell_width']
+        y = header['y_max'] - (ring[:, 0] + row_offset) * header['cell_height']
+        converted.append(np.column_stack([x, y]))
+    return converted
+
+
+def runs_rings(runs, header):
+    """
+    Polygonize one observer's runs, working only over the bounding box of what it can see
+
+    :type runs: numpy.ndarray
+    :type header: dict
+    :return: Rings in map coordinates
+    :rtype: list[numpy.ndarray]
+    """
+    if len(runs) == 0:
+        return []
+    row_offset, col_offset = int(runs[:, 0].min()), int(runs[:, 1].min())
+    shape = (int(runs[:, 0].max()) - row_offset + 1, int(runs[:, 2].max()) - col_offset)
+    local = runs - np.array([row_offset, col_offset, col_offset], dtype=runs.dtype)
+    return rings_to_map(mask_rings(runs_to_mask(local, shape)), header, row_offset, col_offset)
+
+
+def ring_area(ring):
+    """
+    Signed shoelace area, negative for clockwise rings
+
+    :type ring: numpy.ndarray
+    :rtype: float
+    """
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * float(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1]))
+
+
+def index_polygon_records(index, first_viewpoint=None):
+    """
+    Stream a polygon per viewpoint from a storage.observer_index.ObserverIndex
+
+    :type index: macro_viewshed_analysis.storage.observer_index.ObserverIndex
+    :param first_viewpoint: Start from this viewpoint, for resuming
+    :type first_viewpoint: int
+    :return: (rings, island_id, split_island_id, grid_id, point_id) per viewpoint that can see anything
+    :rtype: collections.Iterable[(list[numpy.ndarray], int, int, int, int)]
+    """
+    header = index.header
+    for location in index.locations(first_viewpoint):
+        if location.count == 0:
+            continue
+        rings = runs_rings(index.runs(location), header)
+        yield rings, location.island, location.split, location.grid, location.viewpoint_id
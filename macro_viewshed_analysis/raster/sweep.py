@@ -0,0 +1,101 @@
+"""
+What carries over from one sea level to the next.
+
+A split island whose zone covers exactly the same cells at two sea levels has the same highest cell at both, so its
+viewpoint is carried forward instead of being searched for again. Viewsheds are not carried forward: they are run
+over max(dem, sea level), which changes wherever the DEM is below the higher level, so any observer in sight of the
+sea sees something different.
+"""
+import numpy as np
+
+from macro_viewshed_analysis.raster.zones import NO_ZONE
+
+MAXIMA_COLUMNS = ('z', 'zone', 'row', 'col')
+
+
+def unchanged_zones(previous_zones, zones, no_zone=NO_ZONE):
+    """
+    :param previous_zones: Zone raster of the previous sea level, on the same cells
+    :type previous_zones: numpy.ndarray
+    :type zones: numpy.ndarray
+    :type no_zone: int
+    :return: For each zone, the zone at the previous level covering exactly the same cells, or -1
+    :rtype: numpy.ndarray
+    """
+    inside = zones != no_zone
+    current = zones[inside].astype(np.int64)
+    count = int(current.max()) + 1 if len(current) else 0
+    carried = np.full(count, -1, dtype=np.int64)
+    if count == 0:
+        return carried
+    previous = previous_zones[inside].astype(np.int64)
+    labels, first = np.unique(current, return_index=True)
+    first_previous = np.full(count, no_zone, dtype=np.int64)
+    first_previous[labels] = previous[first]
+    mixed = np.bincount(current[previous != first_previous[current]], minlength=count) > 0
+    size = np.bincount(current, minlength=count)
+    previous_size = np.bincount(previous_zones[previous_zones != no_zone].astype(np.int64))
+
+    same = (size > 0) & ~mixed & (first_previous != no_zone)
+    same[same] = previous_size[first_previous[same]] == size[same]
+    carried[same] = first_previous[same]
+    return carried
+
+
+def without_zones(zones, carried, no_zone=NO_ZONE):
+    """
+    :param carried: From unchanged_zones
+    :type carried: numpy.ndarray
+    :return: zones with the carried zones' cells taken out of every zone
+    :rtype: numpy.ndarray
+    """
+    remaining = zones.copy()
+    inside = zones != no_zone
+    remaining[inside] = np.where(carried[zones[inside]] >= 0, no_zone, zones[inside])
+    return remaining
+
+
+def carry_maxima(maxima, previous, carried):
+    """
+    Add the previous level's highest cells of the carried zones to maxima, under their zones at this level
+
+    :type maxima: macro_viewshed_analysis.raster.zonal.ZoneMaxima
+    :param previous: MAXIMA_COLUMNS of the previous level's highest cells
+    :type previous: dict[str, numpy.ndarray]
+    :param carried: From unchanged_zones
+    :type carried: numpy.ndarray
+    :return: How many zones were carried
+    :rtype: int
+    """
+    previous_zones = previous['zone'].astype(np.int64)
+    position = np.full(int(previous_zones.max()) + 1 if len(previous_zones) else 0, -1, dtype=np.int64)
+    position[previous_zones] = np.arange(len(previous_zones))
+    zones = np.flatnonzero(carried >= 0)
+    entries = position[carried[zones]] if len(position) else np.full(len(zones), -1, dtype=np.int64)
+    # Zones with no data under them had no highest cell to carry
+    zones, entries = zones[entries >= 0], entries[entries >= 0]
+    maxima.add(previous['z'][entries], zones, row=previous['row'][entries], col=previous['col'][entries])
+    return len(zones)
+
+
+def save_sweep_zones(path, land, zones, maxima):
+    """
+    :param land: Which cells are on an island at this level
+    :type land: numpy.ndarray
+    :type zones: numpy.ndarray
+    :type maxima: macro_viewshed_analysis.raster.zonal.ZoneMaxima
+    """
+    columns = dict((k, maxima[k]) for k in MAXIMA_COLUMNS)
+    np.savez_compressed(path, land=np.packbits(land.ravel()), zones=zones, **columns)
+
+
+def load_sweep_zones(path):
+    """
+    :return: The land, zones and MAXIMA_COLUMNS saved by save_sweep_zones
+    :rtype: dict[str, numpy.ndarray]
+    """
+    with np.load(path) as f:
+        saved = dict((k, f[k]) for k in f.files)
+    shape = saved['zones'].shape
+    saved['land'] = np.unpackbits(saved['land'])[:shape[0] * shape[1]].reshape(shape).astype(bool)
+    return saved
@@ -0,0 +1,152 @@
+"""
+Grouping observers by location, and the window of the surface each group needs.
+
+Viewpoints are numbered along a space filling curve so the observer groups made from consecutive FIDs are compact,
+and each group then only needs the surface within the outer radius of its observers rather than the whole raster.
+"""
+from math import ceil, cos, radians
+
+import numpy as np
+
+from macro_viewshed_analysis.raster.grid import METERS_PER_DEGREE
+
+CURVE_BITS = 16
+
+
+def _curve_coordinates(x, y, bits):
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    top = (1 << bits) - 1
+
+    def scale(v):
+        span = v.max() - v.min() if len(v) else 0.0
+        if span == 0:
+            return np.zeros(len(v), dtype=np.int64)
+        return np.rint((v - v.min()) / span * top).astype(np.int64)
+
+    return scale(x), scale(y)
+
+
+def hilbert_keys(x, y, bits=CURVE_BITS):
+    """
+    Position of each point along a Hilbert curve over the points' bounding box
+
+    :type x: numpy.ndarray
+    :type y: numpy.ndarray
+    :param bits: Curve resolution per axis
+    :type bits: int
+    :rtype: numpy.ndarray
+    """
+    xi, yi = _curve_coordinates(x, y, bits)
+    top = (1 << bits) - 1
+    keys = np.zeros(len(xi), dtype=np.int64)
+    s = 1 << (bits - 1)
+    while s > 0:
+        rx = (xi & s) > 0
+        ry = (yi & s) > 0
+        keys += s * s * ((3 * rx) ^ ry)
+        # Rotate the quadrant so the curve joins up
+        flip = ~ry & rx
+        xi = np.where(flip, top - xi, xi)
+        yi = np.where(flip, top - yi, yi)
+        swap = ~ry
+        xi, yi = np.where(swap, yi, xi), np.where(swap, xi, yi)
+        s >>= 1
+    return keys
+
+
+def morton_keys(x, y, bits=CURVE_BITS):
+    """
+    Position of each point along a Z-order curve over the points' bounding box
+
+    :type x: numpy.ndarray
+    :type y: numpy.ndarray
+    :type bits: int
+    :rtype: numpy.ndarray
+    """
+    xi, yi = _curve_coordinates(x, y, bits)
+    keys = np.zeros(len(xi), dtype=np.int64)
+    for bit in range(bits):
+        keys |= ((xi >> bit) & 1) << (2 * bit)
+        keys |= ((yi >> bit) & 1) << (2 * bit + 1)
+    return keys
+
+
+CURVES = {
+    'hilbert': hilbert_keys,
+    'morton': morton_keys,
+}
+
+
+def spatial_order(x, y, curve='hilbert'):
+    """
+    :param curve: One of CURVES, or 'fid' to keep the order given
+    :type curve: str
+    :return: Indices that sort the points along the curve
+    :rtype: numpy.ndarray
+    """
+    if curve == 'fid':
+        return np.arange(len(x))
+    return np.argsort(CURVES[curve](x, y), kind='mergesort')
+
+
+def observer_window(header, x, y, radius_meters):
+    """
+    The rows and columns of a raster within radius_meters of any of the observers
+
+    :param header: Georeferencing and shape of the raster, see raster.bitmask.grid_header
+    :type header: dict
+    :type x: numpy.ndarray
+    :type y: numpy.ndarray
+    :type radius_meters: float
+    :return: (row start, row stop, col start, col stop)
+    :rtype: (int, int, int, int)
+    """
+    rows, cols = header['shape']
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    row = np.floor((header['y_max'] - y) / header['cell_height']).astype(np.int64)
+    col = np.floor((x - header['x_min']) / header['cell_width']).astype(np.int64)
+    if header.get('geographic'):
+        # Columns are narrowest at the latitude furthest from the equator the radius reaches
+        latitude = min(float(np.abs(y).max()) + radius_meters / METERS_PER_DEGREE, 89.0)
+        cell_dx = header['cell_width'] * METERS_PER_DEGREE * cos(radians(latitude))
+        cell_dy = header['cell_height'] * METERS_PER_DEGREE
+    else:
+        cell_dx, cell_dy = header['cell_width'], header['cell_height']
+    pad_rows, pad_cols = int(ceil(radius_meters / cell_dy)), int(ceil(radius_meters / cell_dx))
+    return (max(int(row.min()) - pad_rows, 0), min(int(row.max()) + pad_rows + 1, rows),
+            max(int(col.min()) - pad_cols, 0), min(int(col.max()) + pad_cols + 1, cols))
+
+
+def window_header(header, window):
+    """
+    :type header: dict
+    :param window: (row start, row stop, col start, col stop)
+    :type window: (int, int, int, int)
+    :rtype: dict
+    """
+    row_start, row_stop, col_start, col_stop = window
+    return dict(header,
+                x_min=header['x_min'] + col_start * header['cell_width'],
+                y_max=header['y_max'] - row_start * header['cell_height'],
+                shape=[row_stop - row_start, col_stop - col_start])
+
+
+def window_extent(header, window):
+    """
+    :type header: dict
+    :type window: (int, int, int, int)
+    :return: (x min, y min, x max, y max)
+    :rtype: (float, float, float, float)
+    """
+    h = window_header(header, window)
+    rows, cols = h['shape']
+    return h['x_min'], h['y_max'] - rows * h['cell_height'], h['x_min'] + cols * h['cell_width'], h['y_max']
+
+
+def window_cells(window):
+    """
+    :type window: (int, int, int, int)
+    :rtype: int
+    """
+    row_start, row_stop, col_start, col_stop = window
+    return (row_stop - row_start) * (col_stop - col_start)
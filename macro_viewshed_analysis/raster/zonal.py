@@ -0,0 +1,148 @@
+"""
+Highest point per zone, vectorised.
+
+Zones are the split islands: each viewpoint is the highest DEM cell inside one island/grid cell piece.
+"""
+import numpy as np
+
+
+def highest_per_zone(z, zone):
+    """
+    Index of the highest value in each zone. Ties go to the first occurrence, like a running `>` comparison.
+
+    :type z: numpy.ndarray
+    :param zone: Integer zone ids
+    :type zone: numpy.ndarray
+    :return: Indices into `z`, ordered by zone
+    :rtype: numpy.ndarray
+    """
+    z = np.asarray(z)
+    order = np.argsort(zone, kind='mergesort')
+    sorted_zones = np.asarray(zone)[order]
+    sorted_z = z[order]
+    starts = np.flatnonzero(np.r_[True, sorted_zones[1:] != sorted_zones[:-1]])
+    zone_max = np.maximum.reduceat(sorted_z, starts)
+    is_max = sorted_z == np.repeat(zone_max, np.diff(np.r_[starts, len(order)]))
+    candidates = np.flatnonzero(is_max)
+    candidate_zones = sorted_zones[candidates]
+    first = np.r_[True, candidate_zones[1:] != candidate_zones[:-1]]
+    return order[candidates[first]]
+
+
+class ZoneMaxima(object):
+    """
+    Accumulates the highest value per zone, and whatever columns go with it, over chunks of input. Only one
+    entry per zone is ever kept between chunks.
+    """
+
+    def __init__(self, columns=()):
+        """
+        :param columns: Names of the extra columns passed to add
+        :type columns: collections.Iterable[str]
+        """
+        self.columns = ('z', 'zone') + tuple(columns)
+        self.best = dict((k, np.empty(0)) for k in self.columns)
+
+    def add(self, z, zone, **columns):
+        """
+        :type z: numpy.ndarray
+        :type zone: numpy.ndarray
+        :param columns: One array per extra column, the same length as z
+        """
+        if len(z) == 0:
+            return
+        columns.update(z=z, zone=zone)
+        pick = highest_per_zone(z, zone)
+        chunk = dict((k, np.asarray(columns[k])[pick]) for k in self.columns)
+        if len(self) == 0:
+            self.best = chunk
+            return
+        # Previous winners go first so they keep ties
+        merged = dict((k, np.concatenate([self.best[k], chunk[k]])) for k in self.columns)
+        keep = highest_per_zone(merged['z'], merged['zone'])
+        self.best = dict((k, v[keep]) for k, v in merged.items())
+
+    def __len__(self):
+        return len(self.best['z'])
+
+    def __getitem__(self, column):
+        return self.best[column]
+
+
+class HighestPoints(ZoneMaxima):
+    """
+    The highest vertex per split island
+    """
+
+    def __init__(self):
+        super(HighestPoints, self).__init__(('x', 'y', 'island', 'grid'))
+
+    def add(self, x, y, z, island, split, grid):
+        """
+        :type x: numpy.ndarray
+        :type y: numpy.ndarray
+        :type z: numpy.ndarray
+        :type island: numpy.ndarray
+        :param split: The zone each point falls in
+        :type split: numpy.ndarray
+        :type grid: numpy.ndarray
+        """
+        super(HighestPoints, self).add(z, split, x=x, y=y, island=island, grid=grid)
+
+    def rows(self, order=None):
+        """
+        :param order: Indices to write the zones in, e.g. from raster.tiling.spatial_order
+        :type order: numpy.ndarray
+        :return: ((x, y, z), z, island, split, grid) per zone, ready for an insert cursor
+        :rtype: collections.Iterable[((float, float, float), float, int, int, int)]
+        """
+        columns = [(self[k] if order is None else self[k][order]).tolist()
+                   for k in ('x', 'y', 'z', 'island', 'zone', 'grid')]
+        for x, y, z, island, split, grid in zip(*columns):
+            yield (x, y, z), z, int(island), int(split), int(grid)
+
+
+def highest_points(x, y, z, island, split, grid, chunk_size=None):
+    """
+    :param chunk_size: Points handled at a time, None for all at once
+    :type chunk_size: int
+    :rtype: HighestPoints
+    """
+    highest = HighestPoints()
+    step = len(z) if not chunk_size else chunk_size
+    for start in range(0, len(z), max(step, 1)):
+        end = start + step
+        highest.add(x[start:end], y[start:end], z[start:end], island[start:end], split[start:end], grid[start:end])
+    return highest
+
+
+def grid_windows(dem, zones, window_rows=1024):
+    """
+    Bands of rows from a DEM and its zone raster. Both can be memory mapped.
+
+    :type dem: numpy.ndarray
+    :type zones: numpy.ndarray
+    :type window_rows: int
+    :rtype: collections.Iterable[(int, int, numpy.ndarray, numpy.ndarray)]
+    """
+    for start in range(0, dem.shape[0], window_rows):
+        yield start, 0, np.asarray(dem[start:start + window_rows]), np.asarray(zones[start:start + window_rows])
+
+
+def zonal_highest_cells(windows, nodata_zone=-1):
+    """
+    The highest cell in each zone of a zone raster, read one window at a time
+
+    :param windows: (row offset, column offset, dem block, zone block) tuples
+    :type windows: collections.Iterable[(int, int, numpy.ndarray, numpy.ndarray)]
+    :param nodata_zone: Zone value for cells outside every zone
+    :type nodata_zone: int
+    :return: z, zone, row and col columns, one entry per zone
+    :rtype: ZoneMaxima
+    """
+    maxima = ZoneMaxima(('row', 'col'))
+    for row_offset, col_offset, dem, zones in windows:
+        inside = (zones != nodata_zone) & np.isfinite(dem)
+        rows, cols = np.nonzero(inside)
+        maxima.add(dem[rows, cols], zones[rows, cols], row=rows + row_offset, col=cols + col_offset)
+    return maxima
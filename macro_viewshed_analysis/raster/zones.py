@@ -0,0 +1,201 @@
+"""
+Split island zones in the raster domain.
+
+The vector way is a negative geodesic Buffer of every island polygon (the band within distance_to_shore of the
+sea), an Intersect with the region of interest, a GridIndexFeatures grid and another Intersect to cut the band into
+grid cells. Here the band is the land cells whose distance to the nearest sea cell is under distance_to_shore, found
+with a distance transform truncated at that distance, and the grid cell of each cell is its row and column divided
+by the grid's size in cells. Each (island, grid cell) pair is one zone.
+"""
+import re
+from math import ceil
+
+import numpy as np
+
+from macro_viewshed_analysis.raster.bitmask import band_rows_for
+from macro_viewshed_analysis.raster.grid import METERS_PER_DEGREE
+
+NO_ZONE = -1
+
+# Cells labelled at a time, plus the rows either side each band needs
+MAX_ZONE_CELLS = 4 * 1024 * 1024
+
+UNIT_METERS = {
+    'meters': 1.0,
+    'kilometers': 1000.0,
+    'feet': 0.3048,
+    'miles': 1609.344,
+    'nauticalmiles': 1852.0,
+    'decimaldegrees': METERS_PER_DEGREE,
+}
+
+
+def linear_unit_meters(value):
+    """
+    :param value: A number of meters, or a linear unit as the geoprocessing tools take them, e.g. '2 Kilometers'
+    :type value: str | float
+    :rtype: float
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.match(r'^\s*(-?[\d.]+(?:[eE]-?\d+)?)\s*([A-Za-z]*)\s*$', value)
+    if match is None:
+        raise ValueError('Not a linear unit: {}'.format(value))
+    number, unit = match.groups()
+    return float(number) * UNIT_METERS[unit.lower() or 'meters']
+
+
+def grid_labels(grid, no_label=NO_ZONE):
+    """
+    :param grid: A raster of ids, such as rasterized islands
+    :type grid: macro_viewshed_analysis.raster.grid.Grid
+    :return: The ids as int64, with nodata cells set to no_label
+    :rtype: numpy.ndarray
+    """
+    data = np.asarray(grid.data)
+    labels = data.astype(np.int64)
+    if grid.nodata is not None:
+        labels[data == grid.nodata] = no_label
+    return labels
+
+
+def column_sea_distance(sea, outside_is_sea=False):
+    """
+    Rows to the nearest sea cell in the same column
+
+    :type sea: numpy.ndarray
+    :param outside_is_sea: Count the rows beyond the top and bottom edges as sea
+    :type outside_is_sea: bool
+    :return: float64, inf wherever a column has no sea (and outside_is_sea is False)
+    :rtype: numpy.ndarray
+    """
+    rows = sea.shape[0]
+    index = np.arange(rows, dtype=np.int64)[:, None]
+    far = 2 * rows + 1
+    above = np.maximum.accumulate(np.where(sea, index, -far), axis=0)
+    below = np.minimum.accumulate(np.where(sea, index, far)[::-1], axis=0)[::-1]
+    if outside_is_sea:
+        above, below = np.maximum(above, -1), np.minimum(below, rows)
+    distance = np.minimum(index - above, below - index)
+    return np.where(distance > rows, np.inf, distance)
+
+
+def sea_distance_squared(sea, cell_dx, cell_dy, max_distance, outside_is_sea=False):
+    """
+    Squared distance in meters from each cell's centre to the nearest sea cell's centre, exact up to max_distance.
+    Columns within max_distance are searched one offset at a time, so the work grows with the distance in cells
+    rather than with the size of the islands.
+
+    :type sea: numpy.ndarray
+    :type cell_dx: float
+    :type cell_dy: float
+    :type max_distance: float
+    :type outside_is_sea: bool
+    :return: float64, inf where there's no sea within max_distance
+    :rtype: numpy.ndarray
+    """
+    cols = sea.shape[1]
+    vertical = (column_sea_distance(sea, outside_is_sea) * cell_dy) ** 2
+    reach = int(ceil(max_distance / cell_dx))
+    d2 = np.full(sea.shape, np.inf)
+    for offset in range(-reach, reach + 1):
+        lo, hi = max(offset, 0), min(cols + offset, cols)
+        if lo >= hi:
+            continue
+        # Each cell takes the column `offset` to its right (left when negative)
+        target = d2[:, lo - offset:hi - offset]
+        np.minimum(target, vertical[:, lo:hi] + (offset * cell_dx) ** 2, out=target)
+    if outside_is_sea:
+        col = np.arange(cols)
+        edge = np.minimum(col + 1, cols - col) * cell_dx
+        np.minimum(d2, (edge ** 2)[None, :], out=d2)
+    d2[d2 > max_distance ** 2] = np.inf
+    return d2
+
+
+def coastal_band(land, cell_dx, cell_dy, distance, outside_is_sea=False):
+    """
+    Land within distance of the sea, the raster equivalent of a negative OUTSIDE_ONLY buffer
+
+    :type land: numpy.ndarray
+    :type cell_dx: float
+    :type cell_dy: float
+    :type distance: float
+    :type outside_is_sea: bool
+    :rtype: numpy.ndarray
+    """
+    return land & (sea_distance_squared(~land, cell_dx, cell_dy, distance, outside_is_sea) < distance ** 2)
+
+
+def grid_cell_ids(rows, cols, shape, cell_rows, cell_cols):
+    """
+    GridIndexFeatures page numbers, from 0 and row by row from the top left
+
+    :type rows: numpy.ndarray
+    :type cols: numpy.ndarray
+    :param shape: (rows, cols) of the raster
+    :type shape: (int, int)
+    :param cell_rows: Raster rows per grid cell, which needn't be whole
+    :type cell_rows: float
+    :type cell_cols: float
+    :rtype: numpy.ndarray
+    """
+    per_row = int(ceil(shape[1] / float(cell_cols)))
+    return (np.floor(rows / cell_rows).astype(np.int64) * per_row +
+            np.floor(cols / cell_cols).astype(np.int64))
+
+
+def grid_cell_count(shape, cell_rows, cell_cols):
+    """
+    :rtype: int
+    """
+    return int(ceil(shape[0] / float(cell_rows))) * int(ceil(shape[1] / float(cell_cols)))
+
+
+def split_zones(islands, grid, distance, grid_width, grid_height, region=None, no_island=NO_ZONE,
+                max_band_cells=MAX_ZONE_CELLS):
+    """
+    Label the coastal band of every island with one zone per island and grid cell, a band of rows at a time
+
+    :param islands: Island id per cell, no_island in the sea
+    :type islands: numpy.ndarray
+    :param grid: The georeferencing of islands, for the cell size
+    :type grid: macro_viewshed_analysis.raster.grid.Grid
+    :param distance: Width of the coastal band in meters
+    :type distance: float
+    :param grid_width: Grid cell width in meters
+    :type grid_width: float
+    :type grid_height: float
+    :param region: True inside the region of interest, None for everywhere
+    :type region: numpy.ndarray
+    :type no_island: int
+    :type max_band_cells: int
+    :return: Zone per cell (NO_ZONE outside the band), and the island and grid cell of each zone
+    :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+    """
+    rows, cols = islands.shape
+    cell_dx, cell_dy = grid.cell_size_meters()
+    halo = int(ceil(distance / cell_dy))
+    cell_rows, cell_cols = grid_height / cell_dy, grid_width / cell_dx
+    grids = grid_cell_count((rows, cols), cell_rows, cell_cols)
+
+    keys = np.full((rows, cols), -1, dtype=np.int64)
+    step = band_rows_for(cols, max_band_cells)
+    for start in range(0, rows, step):
+        stop = min(start + step, rows)
+        lo, hi = max(start - halo, 0), min(stop + halo, rows)
+        if grid.geographic:
+            cell_dx, cell_dy = grid.cell_size_meters((start + stop) // 2)
+        land = np.asarray(islands[lo:hi]) != no_island
+        band = coastal_band(land, cell_dx, cell_dy, distance)[start - lo:stop - lo]
+        if region is not None:
+            band &= np.asarray(region[start:stop], dtype=bool)
+        r, c = np.nonzero(band)
+        island = np.asarray(islands[start:stop])[r, c].astype(np.int64)
+        keys[r + start, c] = island * grids + grid_cell_ids(r + start, c, (rows, cols), cell_rows, cell_cols)
+
+    inside = keys >= 0
+    unique, zone = np.unique(keys[inside], return_inverse=True)
+    zones = np.full((rows, cols), NO_ZONE, dtype=np.int32)
+    zones[inside] = zone
+    return zones, unique // grids, unique % grids
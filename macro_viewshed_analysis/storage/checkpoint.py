@@ -0,0 +1,166 @@
+"""
+An append-only checkpoint store: numbered .npz chunks plus a JSON manifest.
+
+Each flush writes only the rows added since the last one, and the manifest keeps the high-water mark of the key
+column (e.g. FID_point) so resuming is a manifest read rather than a scan of everything saved so far.
+Variable length columns (WKB geometry) are stored as one byte buffer plus offsets so nothing is pickled.
+"""
+import json
+from os import listdir, makedirs, remove, rename
+from os.path import exists, getsize, join
+
+import numpy as np
+
+from macro_viewshed_analysis import profiling
+
+BYTES = 'bytes'
+
+
+def _replace(src, dst):
+    # os.replace isn't available on Python 2, and rename won't overwrite on Windows
+    if exists(dst):
+        remove(dst)
+    rename(src, dst)
+
+
+def _encode_column(name, values, dtype):
+    if dtype == BYTES:
+        values = [bytes(v) for v in values]
+        offsets = np.cumsum([0] + [len(v) for v in values]).astype(np.int64)
+        data = np.frombuffer(b''.join(values), dtype=np.uint8)
+        return {'{}.data'.format(name): data, '{}.offsets'.format(name): offsets}
+    return {name: np.asarray(values, dtype=dtype)}
+
+
+def _decode_column(chunk, name, dtype):
+    if dtype == BYTES:
+        data = chunk['{}.data'.format(name)].tobytes()
+        offsets = chunk['{}.offsets'.format(name)].tolist()
+        return [data[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+    return chunk[name].tolist()
+
+
+class CheckpointStore(object):
+    MANIFEST = 'manifest.json'
+    CHUNK = 'chunk_{:06d}.npz'
+
+    def __init__(self, folder, columns, key):
+        """
+        :param folder: Created if it doesn't exist, reopened if it does
+        :type folder: str
+        :param columns: (name, dtype) per column, with BYTES for variable length binary values
+        :type columns: list[(str, str)]
+        :param key: Column whose maximum is kept as the high-water mark
+        :type key: str
+        """
+        self.folder = folder
+        self.columns = [tuple(c) for c in columns]
+        self.key = key
+        if exists(join(folder, self.MANIFEST)):
+            with open(join(folder, self.MANIFEST)) as f:
+                self.manifest = json.load(f)
+            if [tuple(c) for c in self.manifest['columns']] != self.columns:
+                raise ValueError('{} holds columns {}, not {}'.format(folder, self.manifest['columns'], columns))
+            self._remove_orphans()
+        else:
+            if not exists(folder):
+                makedirs(folder)
+            self.manifest = {'columns': self.columns, 'key': key, 'chunks': [], 'high_water': None,
+                             'materialized': 0}
+            self._save_manifest()
+
+    def _save_manifest(self):
+        tmp = join(self.folder, self.MANIFEST + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.manifest, f, indent=1)
+        _replace(tmp, join(self.folder, self.MANIFEST))
+
+    def _remove_orphans(self):
+        # Chunks written by a flush that died before its manifest update
+        known = set(chunk['file'] for chunk in self.manifest['chunks'])
+        for name in listdir(self.folder):
+            if name.startswith('chunk_') and name not in known:
+                remove(join(self.folder, name))
+
+    @property
+    def high_water(self):
+        """
+        :return: The largest key saved so far, None if nothing has been saved
+        :rtype: int
+        """
+        return self.manifest['high_water']
+
+    def __len__(self):
+        return sum(chunk['rows'] for chunk in self.manifest['chunks'])
+
+    def append(self, rows):
+        """
+        Write `rows` as a new chunk
+
+        :type rows: list[tuple]
+        """
+        if not rows:
+            return
+        with profiling.timer('checkpoint flush') as t:
+            arrays = {}
+            for (name, dtype), values in zip(self.columns, zip(*rows)):
+                arrays.update(_encode_column(name, values, dtype))
+            name = self.CHUNK.format(len(self.manifest['chunks']))
+            np.savez(join(self.folder, name), **arrays)
+
+            key_index = [c[0] for c in self.columns].index(self.key)
+            top = max(row[key_index] for row in rows)
+            if self.high_water is not None:
+                top = max(top, self.high_water)
+            self.manifest['chunks'].append({'file': name, 'rows': len(rows)})
+            self.manifest['high_water'] = top
+            self._save_manifest()
+            t.rows, t.bytes_written = len(rows), getsize(join(self.folder, name))
+
+    def rows(self, first_chunk=0):
+        """
+        :param first_chunk: Skip the chunks before this one
+        :type first_chunk: int
+        :rtype: collections.Iterable[tuple]
+        """
+        for chunk in self.manifest['chunks'][first_chunk:]:
+            with np.load(join(self.folder, chunk['file'])) as f:
+                columns = [_decode_column(f, name, dtype) for name, dtype in self.columns]
+            for row in zip(*columns):
+                yield row
+
+    def unmaterialized_rows(self):
+        """
+        Rows that haven't been copied into the final table yet. Call mark_materialized once they have.
+
+        :rtype: collections.Iterable[tuple]
+        """
+        return self.rows(self.manifest['materialized'])
+
+    def mark_materialized(self):
+        self.manifest['materialized'] = len(self.manifest['chunks'])
+        self._save_manifest()
+
+
+class CheckpointWriter(object):
+    """
+    Buffers rows until the caller flushes them to the store. Flush between keys so a key's rows are never split
+    across the high-water mark.
+    """
+
+    def __init__(self, store):
+        """
+        :type store: CheckpointStore
+        """
+        self.store = store
+        self.buffer = []
+
+    def add(self, row):
+        self.buffer.append(tuple(row))
+
+    def flush(self):
+        self.store.append(self.buffer)
+        self.buffer = []
+
+    def __len__(self):
+        return len(self.buffer)
@@ -0,0 +1,210 @@
+"""
+Observer groups as jobs with a persistent state.
+
+Every group is pending, running, done or failed, and the states are saved to a JSON file in the viewsheds folder
+after every change. A group that raises is retried with exponential backoff up to a number of attempts, then left
+failed with its error, and the run goes on with the other groups. The failed groups can then be re-run on their own.
+"""
+import json
+from collections import deque, namedtuple
+from os import remove, rename
+from os.path import exists, join
+from time import sleep, time
+from timeit import default_timer
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# How often run_jobs checks on jobs running in a pool
+POLL_SECONDS = 0.1
+
+JobFailure = namedtuple('JobFailure', ['number', 'error'])
+
+
+class JobStore(object):
+    FILE = 'viewshed_jobs.json'
+
+    def __init__(self, folder):
+        """
+        :param folder: The viewsheds folder
+        :type folder: str
+        """
+        self.path = join(folder, self.FILE)
+        if exists(self.path):
+            with open(self.path) as f:
+                self.jobs = dict((int(k), v) for k, v in json.load(f).items())
+        else:
+            self.jobs = {}
+
+    def state(self, number):
+        """
+        :type number: int
+        :rtype: str
+        """
+        return self.jobs.get(number, {}).get('state', PENDING)
+
+    def numbers(self, state):
+        """
+        :rtype: list[int]
+        """
+        return sorted(n for n, job in self.jobs.items() if job['state'] == state)
+
+    def failed(self):
+        """
+        :return: The failure queue, the groups that ran out of attempts
+        :rtype: list[int]
+        """
+        return self.numbers(FAILED)
+
+    def _job(self, number):
+        return self.jobs.setdefault(number, {'state': PENDING, 'attempts': 0, 'error': None, 'seconds': 0.0})
+
+    def queue(self, numbers):
+        """
+        Mark groups pending with a full set of attempts, including ones that failed or were left running by a run
+        that was killed
+
+        :type numbers: collections.Iterable[int]
+        """
+        for number in numbers:
+            self._job(number).update(state=PENDING, attempts=0)
+        self._save()
+
+    def start(self, number):
+        self._job(number)['state'] = RUNNING
+        self._save()
+
+    def done(self, number, seconds=0.0):
+        job = self._job(number)
+        job.update(state=DONE, error=None, seconds=seconds)
+        self._save()
+
+    def fail(self, number, error, retry):
+        """
+        :type number: int
+        :type error: str
+        :param retry: Put the group back to pending rather than in the failure queue
+        :type retry: bool
+        :return: Attempts made so far
+        :rtype: int
+        """
+        job = self._job(number)
+        job['attempts'] += 1
+        job.update(state=PENDING if retry else FAILED, error=error)
+        self._save()
+        return job['attempts']
+
+    def _save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(dict((str(k), v) for k, v in self.jobs.items()), f, indent=1, sort_keys=True)
+        if exists(self.path):
+            remove(self.path)
+        rename(tmp, self.path)
+
+    def report(self):
+        """
+        :rtype: str
+        """
+        counts = ', '.join('{} {}'.format(len(self.numbers(s)), s) for s in (DONE, FAILED, PENDING, RUNNING))
+        lines = [counts]
+        for number in self.failed():
+            lines.append('viewshed {} failed after {} attempts: {}'.format(
+                number, self.jobs[number]['attempts'], self.jobs[number]['error']))
+        return '\n'.join(lines)
+
+
+def call_job(run, job):
+    """
+    Run a job, turning anything it raises into a JobFailure so it can be retried
+
+    :param run: Called with the job. Results with an `error` other than None are failures too.
+    :type run: callable
+    :param job: Anything with a `number`
+    """
+    try:
+        return run(job)
+    except Exception as e:
+        return JobFailure(job.number, '{}: {}'.format(e.__class__.__name__, e))
+
+
+class _Finished(object):
+    # Stands in for a pool's AsyncResult when a job runs in this process
+    def __init__(self, result):
+        self.result = result
+
+    def ready(self):
+        return True
+
+    def get(self):
+        return self.result
+
+
+def backoff_delay(attempts, backoff_seconds):
+    """
+    :param attempts: Attempts made so far
+    :type attempts: int
+    :type backoff_seconds: float
+    :return: Seconds to wait before the next attempt
+    :rtype: float
+    """
+    return backoff_seconds * 2 ** (attempts - 1)
+
+
+def run_jobs(jobs, run, store, pool=None, workers=1, max_attempts=3, backoff_seconds=10.0, on_result=None):
+    """
+    Run jobs with at most `workers` at a time, retrying failures with exponential backoff
+
+    :param jobs: Anything with a `number`, which names the job in the store
+    :type jobs: list
+    :param run: Called with each job, a module level function if there's a pool
+    :type run: callable
+    :type store: JobStore
+    :param pool: A multiprocessing.Pool to run the jobs on, None to run them in this process
+    :type workers: int
+    :param max_attempts: Attempts per job before it goes in the failure queue
+    :type max_attempts: int
+    :param backoff_seconds: Wait before the first retry, doubled for each one after
+    :type backoff_seconds: float
+    :param on_result: Called with each result, and the job's state after it
+    :type on_result: callable
+    :return: The last result of every job, by number
+    :rtype: dict[int, object]
+    """
+    queue = deque((0.0, job) for job in jobs)
+    store.queue(job.number for _, job in queue)
+    running = {}
+    results = {}
+    while queue or running:
+        for _ in range(len(queue)):
+            if len(running) >= max(workers, 1):
+                break
+            ready_at, job = queue.popleft()
+            if ready_at > time():
+                queue.append((ready_at, job))
+                continue
+            store.start(job.number)
+            started = default_timer()
+            if pool is None:
+                running[job.number] = (job, started, _Finished(call_job(run, job)))
+            else:
+                running[job.number] = (job, started, pool.apply_async(call_job, (run, job)))
+
+        finished = [number for number, (_, _, result) in running.items() if result.ready()]
+        for number in finished:
+            job, started, result = running.pop(number)
+            result = results[number] = result.get()
+            error = getattr(result, 'error', None)
+            if error is None:
+                store.done(number, default_timer() - started)
+            else:
+                attempts = store.fail(number, error, retry=store.jobs[number]['attempts'] + 1 < max_attempts)
+                if store.state(number) == PENDING:
+                    queue.append((time() + backoff_delay(attempts, backoff_seconds), job))
+            if on_result is not None:
+                on_result(result, store.state(number))
+        if not finished:
+            sleep(POLL_SECONDS if running else max(min(t for t, _ in queue) - time(), 0))
+    return results
@@ -0,0 +1,166 @@
+"""
+A persistent index from viewpoints to their viewshed data.
+
+Every observer's runs (see raster.bitmask) are appended to one flat file of int32 (row, start, stop) triples, and a
+SQLite table records where each viewpoint's runs start and how many there are, along with the viewshed and bit it
+came from and the island it sits on. Looking an observer up is then one indexed query and one seek, and islands can
+be joined to their observers without going through the viewpoint table.
+"""
+import json
+import sqlite3
+from collections import namedtuple
+from os import makedirs
+from os.path import exists, getsize, join
+
+import numpy as np
+
+ObserverLocation = namedtuple('ObserverLocation', [
+    'viewpoint_id', 'viewshed', 'bit', 'offset', 'count', 'island', 'split', 'grid',
+    'row_min', 'row_max', 'col_min', 'col_max',
+])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS observers (
+    viewpoint_id INTEGER PRIMARY KEY,
+    viewshed INTEGER NOT NULL,
+    bit INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    island INTEGER,
+    split INTEGER,
+    grid INTEGER,
+    row_min INTEGER, row_max INTEGER, col_min INTEGER, col_max INTEGER
+);
+CREATE INDEX IF NOT EXISTS observers_island ON observers (island);
+CREATE INDEX IF NOT EXISTS observers_viewshed ON observers (viewshed);
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+RUN_WIDTH = 3
+RUN_BYTES = RUN_WIDTH * np.dtype(np.int32).itemsize
+
+
+class ObserverIndex(object):
+    DATABASE = 'observer_index.sqlite'
+    RUNS = 'observer_runs.bin'
+
+    def __init__(self, folder):
+        """
+        :param folder: Created if it doesn't exist, reopened if it does
+        :type folder: str
+        """
+        if not exists(folder):
+            makedirs(folder)
+        self.runs_file = join(folder, self.RUNS)
+        self.db = sqlite3.connect(join(folder, self.DATABASE))
+        self.db.executescript(_SCHEMA)
+        self._truncate_runs()
+
+    def _truncate_runs(self):
+        # Runs appended by an add_viewshed that died before its rows were committed
+        (end,) = self.db.execute('SELECT COALESCE(MAX(offset + count), 0) FROM observers').fetchone()
+        if not exists(self.runs_file):
+            open(self.runs_file, 'wb').close()
+        elif getsize(self.runs_file) > end * RUN_BYTES:
+            with open(self.runs_file, 'r+b') as f:
+                f.truncate(end * RUN_BYTES)
+
+    def close(self):
+        self.db.close()
+
+    @property
+    def header(self):
+        """
+        Georeferencing and shape of the viewshed rasters, see raster.bitmask.grid_header
+
+        :rtype: dict
+        """
+        row = self.db.execute("SELECT value FROM meta WHERE name = 'header'").fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def viewsheds(self):
+        """
+        :return: Viewshed numbers already indexed
+        :rtype: set[int]
+        """
+        return set(v for (v,) in self.db.execute('SELECT DISTINCT viewshed FROM observers'))
+
+    def add_viewshed(self, viewshed, observers, runs, header):
+        """
+        Index one viewshed's observers, replacing it if it was indexed before
+
+        :param viewshed: 1 indexed viewshed number
+        :type viewshed: int
+        :param observers: (viewpoint_id, bit, island_id, split_island_id, grid_id) per observer in the viewshed
+        :type observers: collections.Iterable[(int, int, int, int, int)]
+        :param runs: Runs per bit, as from raster.bitmask.load_observer_runs
+        :type runs: dict[int, numpy.ndarray]
+        :type header: dict
+        """
+        with open(self.runs_file, 'ab') as f:
+            f.seek(0, 2)
+            offset = f.tell() // RUN_BYTES
+            rows = []
+            for viewpoint_id, bit, island, split, grid in observers:
+                observer_runs = np.ascontiguousarray(runs.get(bit, np.empty((0, RUN_WIDTH))), dtype=np.int32)
+                f.write(observer_runs.tobytes())
+                if len(observer_runs):
+                    bbox = (int(observer_runs[:, 0].min()), int(observer_runs[:, 0].max()),
+                            int(observer_runs[:, 1].min()), int(observer_runs[:, 2].max()))
+                else:
+                    bbox = (None, None, None, None)
+                rows.append((viewpoint_id, viewshed, bit, offset, len(observer_runs), island, split, grid) + bbox)
+                offset += len(observer_runs)
+        with self.db:
+            self.db.execute('DELETE FROM observers WHERE viewshed = ?', (viewshed,))
+            self.db.executemany('INSERT OR REPLACE INTO observers VALUES (?,?,?,?,?,?,?,?,?,?,?,?)', rows)
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('header', ?)", (json.dumps(header),))
+
+    def locate(self, viewpoint_id):
+        """
+        :type viewpoint_id: int
+        :rtype: ObserverLocation
+        """
+        row = self.db.execute('SELECT * FROM observers WHERE viewpoint_id = ?', (viewpoint_id,)).fetchone()
+        if row is None:
+            raise KeyError(viewpoint_id)
+        return ObserverLocation(*row)
+
+    def locations(self, first_viewpoint=None):
+        """
+        :param first_viewpoint: Start from this viewpoint, for resuming
+        :type first_viewpoint: int
+        :return: Every indexed observer, by viewpoint id
+        :rtype: collections.Iterable[ObserverLocation]
+        """
+        query = 'SELECT * FROM observers WHERE viewpoint_id >= ? ORDER BY viewpoint_id'
+        for row in self.db.execute(query, (-1 if first_viewpoint is None else first_viewpoint,)):
+            yield ObserverLocation(*row)
+
+    def runs(self, location):
+        """
+        :type location: ObserverLocation | int
+        :rtype: numpy.ndarray
+        """
+        if not isinstance(location, ObserverLocation):
+            location = self.locate(location)
+        with open(self.runs_file, 'rb') as f:
+            f.seek(location.offset * RUN_BYTES)
+            data = np.fromfile(f, dtype=np.int32, count=location.count * RUN_WIDTH)
+        return data.reshape(-1, RUN_WIDTH)
+
+    def island_observers(self, island):
+        """
+        :type island: int
+        :return: Viewpoint ids on the island
+        :rtype: list[int]
+        """
+        query = 'SELECT viewpoint_id FROM observers WHERE island = ? ORDER BY viewpoint_id'
+        return [v for (v,) in self.db.execute(query, (island,))]
+
+    def observer_islands(self):
+        """
+        :return: Island id per viewpoint id
+        :rtype: dict[int, int]
+        """
+        return dict(self.db.execute('SELECT viewpoint_id, island FROM observers'))
@@ -0,0 +1,159 @@
+"""
+Writing straight line polylines from coordinate arrays, without arcpy.
+
+Every edge of the network is one two point line, so each shapefile record has the same size and a whole batch of
+them can be laid out as one numpy structured array and written with a single call. The same goes for the dBase
+attribute records and for the WKB that arcpy's cursors accept in place of a geometry object.
+"""
+import struct
+from datetime import date
+from os.path import splitext
+
+import numpy as np
+
+SHAPE_POLYLINE = 3
+FILE_CODE = 9994
+VERSION = 1000
+HEADER_BYTES = 100
+
+# Field type: (dBase type, width, decimals, format), with no format for integers
+FIELD_TYPES = {
+    'LONG': (b'N', 10, 0, None),
+    'DOUBLE': (b'N', 19, 11, '%19.11e'),
+}
+
+_RECORD = np.dtype([
+    ('number', '>i4'), ('length', '>i4'),
+    ('shape_type', '<i4'), ('box', '<f8', (4,)), ('parts', '<i4'), ('points', '<i4'), ('part', '<i4'),
+    ('xy', '<f8', (4,)),
+])
+_INDEX = np.dtype([('offset', '>i4'), ('length', '>i4')])
+_CONTENT_WORDS = (_RECORD.itemsize - 8) // 2
+
+_WKB_LINE = np.dtype([('order', 'u1'), ('type', '<u4'), ('points', '<u4'), ('xy', '<f8', (4,))])
+WKB_LINESTRING = 2
+
+
+def line_wkb(ends):
+    """
+    :param ends: (x0, y0, x1, y1) per line
+    :type ends: numpy.ndarray
+    :return: The WKB of each line as a LineString
+    :rtype: list[bytes]
+    """
+    ends = np.asarray(ends, dtype=np.float64).reshape(-1, 4)
+    wkb = np.zeros(len(ends), dtype=_WKB_LINE)
+    wkb['order'] = 1  # Little endian
+    wkb['type'] = WKB_LINESTRING
+    wkb['points'] = 2
+    wkb['xy'] = ends
+    raw = wkb.tobytes()
+    size = _WKB_LINE.itemsize
+    return [raw[i:i + size] for i in range(0, len(raw), size)]
+
+
+def _dbf_column(values, width, fmt):
+    dtype = 'S{}'.format(width)
+    if fmt is None:
+        # Much faster than formatting, and right aligned as dBase numbers are
+        return np.char.rjust(np.asarray(values, dtype=np.int64).astype(dtype), width)
+    return np.char.mod(fmt, np.asarray(values)).astype(dtype)
+
+
+def _shape_header(file_words, box):
+    return (struct.pack('>7i', FILE_CODE, 0, 0, 0, 0, 0, file_words) +
+            struct.pack('<2i', VERSION, SHAPE_POLYLINE) + struct.pack('<8d', *(tuple(box) + (0, 0, 0, 0))))
+
+
+class ShapefilePolylineWriter(object):
+    """
+    Appends batches of two point polylines to a new shapefile. The headers are filled in by close.
+    """
+
+    def __init__(self, path, fields, prj=None):
+        """
+        :param path: The .shp to write, the .shx, .dbf and .prj go beside it
+        :type path: str
+        :param fields: (name, type) per attribute, type being a key of FIELD_TYPES. Names are cut to 10 characters.
+        :type fields: list[(str, str)]
+        :param prj: WKT of the coordinate system
+        :type prj: str
+        """
+        stem = splitext(path)[0]
+        self.fields = [(name[:10], FIELD_TYPES[field_type]) for name, field_type in fields]
+        self.count = 0
+        self.box = [np.inf, np.inf, -np.inf, -np.inf]
+        self.shp = open(stem + '.shp', 'wb')
+        self.shx = open(stem + '.shx', 'wb')
+        self.dbf = open(stem + '.dbf', 'wb')
+        self.shp.write(b'\0' * HEADER_BYTES)
+        self.shx.write(b'\0' * HEADER_BYTES)
+        self.dbf.write(self._dbf_header())
+        if prj is not None:
+            with open(stem + '.prj', 'w') as f:
+                f.write(prj)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _dbf_header(self):
+        record_bytes = 1 + sum(width for _, (_, width, _, _) in self.fields)
+        today = date.today()
+        header = struct.pack('<4BIHH20x', 3, today.year - 1900, today.month, today.day, self.count,
+                             32 + 32 * len(self.fields) + 1, record_bytes)
+        for name, (dbf_type, width, decimals, _) in self.fields:
+            header += struct.pack('<11sc4xBB14x', name.encode('ascii'), dbf_type, width, decimals)
+        return header + b'\r'
+
+    def write(self, ends, attributes):
+        """
+        :param ends: (x0, y0, x1, y1) per line
+        :type ends: numpy.ndarray
+        :param attributes: One array per field, in the order given to the constructor
+        :type attributes: list[numpy.ndarray]
+        """
+        ends = np.asarray(ends, dtype=np.float64).reshape(-1, 4)
+        n = len(ends)
+        if not n:
+            return
+        x, y = ends[:, [0, 2]], ends[:, [1, 3]]
+        box = np.column_stack([x.min(axis=1), y.min(axis=1), x.max(axis=1), y.max(axis=1)])
+
+        records = np.zeros(n, dtype=_RECORD)
+        records['number'] = np.arange(self.count + 1, self.count + n + 1)
+        records['length'] = _CONTENT_WORDS
+        records['shape_type'] = SHAPE_POLYLINE
+        records['box'] = box
+        records['parts'] = 1
+        records['points'] = 2
+        records['xy'] = ends
+        self.shp.write(records.tobytes())
+
+        index = np.zeros(n, dtype=_INDEX)
+        index['offset'] = HEADER_BYTES // 2 + (self.count + np.arange(n)) * (_RECORD.itemsize // 2)
+        index['length'] = _CONTENT_WORDS
+        self.shx.write(index.tobytes())
+
+        columns = [np.full(n, b' ', dtype='S1')]
+        for (_, (_, width, _, fmt)), values in zip(self.fields, attributes):
+            columns.append(_dbf_column(values, width, fmt))
+        self.dbf.write(np.rec.fromarrays(columns).tobytes())
+
+        self.box = [min(self.box[0], box[:, 0].min()), min(self.box[1], box[:, 1].min()),
+                    max(self.box[2], box[:, 2].max()), max(self.box[3], box[:, 3].max())]
+        self.count += n
+
+    def close(self):
+        box = self.box if self.count else [0, 0, 0, 0]
+        self.shp.seek(0)
+        self.shp.write(_shape_header((HEADER_BYTES + self.count * _RECORD.itemsize) // 2, box))
+        self.shx.seek(0)
+        self.shx.write(_shape_header((HEADER_BYTES + self.count * _INDEX.itemsize) // 2, box))
+        self.dbf.write(b'\x1a')
+        self.dbf.seek(0)
+        self.dbf.write(self._dbf_header())
+        for f in (self.shp, self.shx, self.dbf):
+            f.close()
@@ -0,0 +1,161 @@
+"""
+A content-addressed cache of pipeline stages.
+
+A stage's key hashes its parameters with the fingerprints of its inputs. Inputs made by an earlier stage are
+fingerprinted by that stage's key, so changing a parameter re-runs the stage that uses it and everything
+downstream of it, and nothing upstream. Other inputs are fingerprinted from the names, sizes and modification
+times of their files.
+"""
+import hashlib
+import json
+from glob import glob
+from os import remove, rename, stat, walk
+from os.path import dirname, exists, isdir, join, splitext
+
+
+def _files(path):
+    if isdir(path):
+        for root, _, names in walk(path):
+            for name in names:
+                yield join(root, name)
+    else:
+        # Shapefiles and the like are spread over files that share a stem
+        for name in glob('{}.*'.format(splitext(path)[0])) or [path]:
+            yield name
+
+
+def fingerprint_path(path):
+    """
+    :param path: A file, a folder, or a dataset inside one (e.g. a feature class in a file geodatabase)
+    :type path: str
+    :rtype: str
+    """
+    target = path
+    while not exists(target):
+        parent = dirname(target)
+        if not parent or parent == target:
+            return 'value:{}'.format(path)
+        target = parent
+    digest = hashlib.sha1()
+    for name in sorted(_files(target)):
+        info = stat(name)
+        digest.update('{}|{}|{}\n'.format(name[len(target):], info.st_size, int(info.st_mtime)).encode('utf-8'))
+    return 'files:{}'.format(digest.hexdigest())
+
+
+def newest_mtime(path):
+    """
+    :param path: A file or a folder, as for fingerprint_path
+    :type path: str
+    :return: When any of path's files was last modified, 0 if it has none
+    :rtype: float
+    """
+    return max([stat(name).st_mtime for name in _files(path) if exists(name)] or [0])
+
+
+class StageCache(object):
+    FILE = 'stage_cache.json'
+
+    def __init__(self, folder):
+        """
+        :param folder: Where the stage outputs are saved. The cache manifest is kept alongside them.
+        :type folder: str
+        """
+        self.path = join(folder, self.FILE)
+        if exists(self.path):
+            with open(self.path) as f:
+                self.stages = json.load(f)
+        else:
+            self.stages = {}
+        self.outputs = {}
+        self.report_rows = []
+
+    def fingerprint(self, value):
+        """
+        :rtype: str
+        """
+        value = str(value)
+        if value in self.outputs:
+            return 'stage:{}'.format(self.outputs[value])
+        return fingerprint_path(value)
+
+    def key(self, stage, inputs, params):
+        """
+        :type stage: str
+        :param inputs: Datasets the stage reads
+        :type inputs: list
+        :param params: Everything else the result depends on
+        :type params: dict
+        :rtype: str
+        """
+        description = {
+            'stage': stage,
+            'inputs': [self.fingerprint(i) for i in inputs],
+            'params': dict((k, str(v)) for k, v in params.items()),
+        }
+        return hashlib.sha1(json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def hit(self, stage, key, output):
+        """
+        Whether `output` is the saved result of running `stage` with `key`. Records the outcome for the report.
+
+        :type stage: str
+        :type key: str
+        :type output: str
+        :rtype: bool
+        """
+        entry = self.stages.get(stage)
+        if entry is not None and entry['key'] == key and entry['output'] == output:
+            self.outputs[output] = key
+            self.report_rows.append((stage, True, entry['seconds']))
+            return True
+        return False
+
+    def stale(self, stage, key):
+        """
+        Whether `stage` was last run with a different key, so anything it left behind is out of date
+
+        :type stage: str
+        :type key: str
+        :rtype: bool
+        """
+        entry = self.stages.get(stage)
+        return entry is not None and entry['key'] != key
+
+    def record(self, stage, key, output, seconds):
+        """
+        :type stage: str
+        :type key: str
+        :type output: str
+        :type seconds: float
+        """
+        self.stages[stage] = {'key': key, 'output': output, 'seconds': seconds}
+        self.outputs[output] = key
+        self.report_rows.append((stage, False, seconds))
+        self._save()
+
+    def _save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.stages, f, indent=1, sort_keys=True)
+        if exists(self.path):
+            remove(self.path)
+        rename(tmp, self.path)
+
+    def report(self):
+        """
+        :rtype: str
+        """
+        lines = []
+        hits = misses = 0
+        saved = spent = 0.0
+        for stage, hit, seconds in self.report_rows:
+            if hit:
+                hits += 1
+                saved += seconds
+            else:
+                misses += 1
+                spent += seconds
+            lines.append('{:<20} {:<4} {:>10.1f}s'.format(stage, 'hit' if hit else 'miss', seconds))
+        lines.append('{} hits, {} misses, {:.1f}s run, {:.1f}s saved'.format(hits, misses, spent, saved))
+        return '\n'.join(lines)
@@ -1,17 +1,19 @@
 from arcgisscripting import Raster
 from contextlib import contextmanager
 from genericpath import exists
-from os import mkdir, makedirs, getenv
-from os.path import join, split, dirname
+from os import mkdir, makedirs
+from os.path import join, split, dirname, basename, splitext
+from time import time
 from uuid import uuid4
 
 import arcpy
+import numpy as np
 from arcpy import AddMessage, Exists, CopyFeatures_management
 from arcpy.sa import ExtractByMask
 
-from macro_viewshed_analysis.config import TableNames as T
-
-OBSERVER_GROUP_SIZE = int(getenv('OBSERVER_GROUP_SIZE', '32'))
+from macro_viewshed_analysis import profiling
+from macro_viewshed_analysis.config import OBSERVER_GROUP_SIZE, TableNames as T
+from macro_viewshed_analysis.raster.grid import Grid
 
 
 @contextmanager
@@ -76,6 +78,43 @@ def in_mem(var):
     return join(T.IN_MEMORY, var)
 
 
+class ScratchTablePool(object):
+    """
+    in_memory tables made once and emptied for reuse, rather than deleted and made again with all their fields
+    every time one is needed
+    """
+
+    def __init__(self, create):
+        """
+        :param create: Makes a new empty table
+        :type create: () -> str
+        """
+        self.create = create
+        self.tables = []
+        self.free = []
+
+    @contextmanager
+    def table(self):
+        """
+        An empty table, handed back to the pool and emptied when done with
+        """
+        if self.free:
+            table = self.free.pop()
+        else:
+            table = self.create()
+            self.tables.append(table)
+        try:
+            yield table
+        finally:
+            arcpy.DeleteRows_management(table)
+            self.free.append(table)
+
+    def close(self):
+        for table in self.tables:
+            arcpy.Delete_management(table)
+        self.tables, self.free = [], []
+
+
 def get_output_loc(given, default):
     """
 
@@ -134,17 +173,114 @@ def extract_region_of_interest(dem, region_of_interest):
     return raster
 
 
-def run_func(overwrite_existing, out_workspace, save_loc, save_intermediate, creation_message, func, args, kwargs):
+def raster_to_grid(raster):
+    """
+    :type raster: str | arcpy.Raster
+    :rtype: macro_viewshed_analysis.raster.grid.Grid
+    """
+    r = raster if isinstance(raster, Raster) else Raster(raster)
+    return Grid(
+        arcpy.RasterToNumPyArray(r),
+        r.extent.XMin, r.extent.YMax, r.meanCellWidth, r.meanCellHeight,
+        nodata=r.noDataValue,
+        geographic=r.spatialReference.type == 'Geographic'
+    )
+
+
+def grid_to_raster(grid, save_to=None):
+    """
+    :type grid: macro_viewshed_analysis.raster.grid.Grid
+    :type save_to: str
+    :rtype: arcpy.Raster
+    """
+    r = arcpy.NumPyArrayToRaster(
+        np.ascontiguousarray(grid.data), arcpy.Point(grid.x_min, grid.y_min), grid.cell_width, grid.cell_height,
+        grid.nodata
+    )
+    if save_to is not None:
+        r.save(save_to)
+    return r
+
+
+def raster_header(raster):
+    """
+    The georeferencing of a raster in the form raster.bitmask.grid_header gives
+
+    :type raster: str | arcpy.Raster
+    :rtype: dict
+    """
+    r = raster if isinstance(raster, Raster) else Raster(raster)
+    grid = Grid(None, r.extent.XMin, r.extent.YMax, r.meanCellWidth, r.meanCellHeight, r.noDataValue,
+                r.spatialReference.type == 'Geographic')
+    return dict(grid.metadata(), shape=[r.height, r.width])
+
+
+def raster_bands(raster, band_rows, nodata_to_value=None, band_starts=None):
+    """
+    Bands of rows read from a raster, so only one is in memory at a time
+
+    :type raster: str | arcpy.Raster
+    :type band_rows: int
+    :param band_starts: First rows of the bands to read, defaults to all of them
+    :type band_starts: collections.Iterable[int]
+    :rtype: collections.Iterable[(int, numpy.ndarray)]
+    """
+    r = raster if isinstance(raster, Raster) else Raster(raster)
+    for start in range(0, r.height, band_rows) if band_starts is None else band_starts:
+        rows = min(band_rows, r.height - start)
+        lower_left = arcpy.Point(r.extent.XMin, r.extent.YMax - (start + rows) * r.meanCellHeight)
+        if nodata_to_value is None:
+            yield start, arcpy.RasterToNumPyArray(r, lower_left, r.width, rows)
+        else:
+            yield start, arcpy.RasterToNumPyArray(r, lower_left, r.width, rows, nodata_to_value=nodata_to_value)
+
+
+def run_func(overwrite_existing, out_workspace, save_loc, save_intermediate, creation_message, func, args, kwargs,
+             cache=None, inputs=(), params=None):
+    """
+    :param cache: When given, the output is reused only if it was saved with the same inputs and params
+    :type cache: macro_viewshed_analysis.storage.stage_cache.StageCache
+    :param inputs: Datasets func reads, fingerprinted for the cache key
+    :type inputs: collections.Iterable
+    :param params: Everything else the output depends on
+    :type params: dict
+    """
     save_to = join(out_workspace, save_loc)
     save_dir = dirname(save_to)
     if not exists(save_dir):
         makedirs(save_dir)
+    if cache is not None:
+        return run_cached_func(cache, overwrite_existing, save_to, creation_message, func, args, kwargs, inputs,
+                               params or {})
     if (Exists(save_to) or exists(save_to)) and not overwrite_existing:
         arcpy.AddMessage("Using existing file at {}".format(save_to))
         return save_to
     arcpy.AddMessage(creation_message)
-    out_var = func(*args, **kwargs)
-    if save_intermediate:
-        arcpy.AddMessage("Saving {} to {}".format(save_loc, save_to))
-        CopyFeatures_management(out_var, save_to)
+    with profiling.timer(splitext(basename(save_loc))[0]):
+        out_var = func(*args, **kwargs)
+        if save_intermediate:
+            arcpy.AddMessage("Saving {} to {}".format(save_loc, save_to))
+            CopyFeatures_management(out_var, save_to)
     return out_var
+
+
+def run_cached_func(cache, overwrite_existing, save_to, creation_message, func, args, kwargs, inputs, params):
+    """
+    :type cache: macro_viewshed_analysis.storage.stage_cache.StageCache
+    :rtype: str
+    """
+    stage = splitext(basename(save_to))[0]
+    key = cache.key(stage, inputs, params)
+    if not overwrite_existing and Exists(save_to) and cache.hit(stage, key, save_to):
+        arcpy.AddMessage("Using cached {}".format(save_to))
+        return save_to
+    arcpy.AddMessage(creation_message)
+    start = time()
+    with profiling.timer(stage):
+        out_var = func(*args, **kwargs)
+        if Exists(save_to):
+            arcpy.Delete_management(save_to)
+        arcpy.AddMessage("Saving {}".format(save_to))
+        CopyFeatures_management(out_var, save_to)
+    cache.record(stage, key, save_to, time() - start)
+    return save_to
@@ -1,72 +1,201 @@
-from arcpy import Describe
+from os.path import exists, join
+from time import time
 
+from arcpy import AddMessage, Describe
+
+from macro_viewshed_analysis import profiling
+from macro_viewshed_analysis.config import AnalysisSettings as A, OBSERVER_GROUP_SIZE, SaveLocations as S, \
+    ViewshedParameters as VP
 from macro_viewshed_analysis.procedures import create_island_inner_buffers, create_grid, split_islands_into_grid, \
     group_points_onto_islands, \
-    get_highest_points_from_multipoint_features
+    get_highest_points_from_multipoint_arrays, get_highest_points_from_raster_zones, \
+    get_highest_points_from_split_zones
+from macro_viewshed_analysis.procedures.scheduler import run_all_viewsheds_parallel
 from macro_viewshed_analysis.procedures.viewshed import run_all_viewsheds
+from macro_viewshed_analysis.storage.jobs import JobFailure, JobStore
+from macro_viewshed_analysis.storage.stage_cache import StageCache
 from macro_viewshed_analysis.utils import run_func
 
 
+def save_profile(out_workspace):
+    """
+    Log the profiling summary and save it to out_workspace as profile.json and profile.csv, if profiling is on.
+    Recording then starts again, so the next sea level's profile doesn't include this one's.
+    """
+    if profiling.active() is None:
+        return
+    AddMessage(profiling.summary())
+    if out_workspace:
+        profiling.save(out_workspace)
+    profiling.reset()
+
+
 def run_full_analysis(sea_level, all_points, islands_poly, region_of_interest, distance_to_shore_meters, grid_width,
                       grid_height, dem, spatial_reference=None, save_intermediate=False, out_workspace=None,
-                      overwrite_existing=False):
+                      overwrite_existing=False, workers=1, viewpoint_mode=None, use_cache=True,
+                      sweep=False, previous_workspace=None):
+    """
+    Calls arcpy directly rather than through a backend. backends.pipeline runs the zones mode headless.
+
+    :param all_points: Multipoints from generate_points_from_raster, only used when viewpoint_mode is 'points'
+    :param viewpoint_mode: 'points', 'raster' or 'zones', defaults to the VIEWPOINT_MODE setting
+    :type viewpoint_mode: str
+    :param use_cache: Re-run only the stages whose inputs or parameters changed. Needs save_intermediate.
+    :type use_cache: bool
+    :param sweep: Save the split island zones so the next sea level can carry viewpoints forward. Needs
+        save_intermediate and the zones viewpoint mode.
+    :type sweep: bool
+    :param previous_workspace: out_workspace of the previous sea level in a sweep
+    :type previous_workspace: str
+    """
+    if viewpoint_mode is None:
+        viewpoint_mode = A.VIEWPOINT_MODE
+    if A.PROFILE.lower() == 'true':
+        profiling.enable()
     if spatial_reference is None:
         spatial_reference = Describe(dem).spatialReference
+    cache = StageCache(out_workspace) if use_cache and save_intermediate and out_workspace else None
     shared = dict(
         overwrite_existing=overwrite_existing,
         save_intermediate=save_intermediate,
-        out_workspace=out_workspace
-    )
-    borders = run_func(
-        save_loc='borders.shp',
-        creation_message="Creating inner buffer zone of {}".format(distance_to_shore_meters),
-        func=create_island_inner_buffers,
-        args=(region_of_interest, islands_poly, distance_to_shore_meters),
-        kwargs={},
-        **shared
+        out_workspace=out_workspace,
+        cache=cache
     )
+    if viewpoint_mode == 'zones':
+        sweep_kwargs = {}
+        if sweep and out_workspace:
+            sweep_kwargs['sweep_zones'] = join(out_workspace, S.SWEEP_ZONES)
+            if previous_workspace is not None:
+                sweep_kwargs['previous_sweep_zones'] = join(previous_workspace, S.SWEEP_ZONES)
+        viewpoints = run_func(
+            save_loc='gridded_viewpoints.shp',
+            creation_message="Getting highest cell for each island section of a {} coastal band".format(
+                distance_to_shore_meters),
+            func=get_highest_points_from_split_zones,
+            args=(dem, islands_poly, distance_to_shore_meters, grid_width, grid_height, spatial_reference),
+            kwargs=dict(region_of_interest=region_of_interest, **sweep_kwargs),
+            inputs=(dem, region_of_interest, islands_poly),
+            params=dict(sea_level=sea_level, distance_to_shore=distance_to_shore_meters, grid_width=grid_width,
+                        grid_height=grid_height, viewpoint_mode=viewpoint_mode, window_rows=A.ZONE_WINDOW_ROWS,
+                        order=A.VIEWPOINT_ORDER),
+            **shared
+        )
+    else:
+        borders = run_func(
+            save_loc='borders.shp',
+            creation_message="Creating inner buffer zone of {}".format(distance_to_shore_meters),
+            func=create_island_inner_buffers,
+            args=(region_of_interest, islands_poly, distance_to_shore_meters),
+            kwargs={},
+            inputs=(region_of_interest, islands_poly),
+            # islands_poly can be in memory, so the sea level stands in for its contents
+            params=dict(sea_level=sea_level, distance_to_shore=distance_to_shore_meters),
+            **shared
+        )
 
-    grid = run_func(
-        save_loc='grid.shp',
-        creation_message="Creating {} x {} grid over buffered area".format(grid_width, grid_height),
-        func=create_grid,
-        args=(borders,),
-        kwargs=dict(grid_width=grid_width, grid_height=grid_height),
-        **shared
-    )
+        grid = run_func(
+            save_loc='grid.shp',
+            creation_message="Creating {} x {} grid over buffered area".format(grid_width, grid_height),
+            func=create_grid,
+            args=(borders,),
+            kwargs=dict(grid_width=grid_width, grid_height=grid_height),
+            inputs=(borders,),
+            params=dict(grid_width=grid_width, grid_height=grid_height),
+            **shared
+        )
 
-    split_islands = run_func(
-        save_loc='split_islands.shp',
-        creation_message="Splitting islands into grid",
-        func=split_islands_into_grid,
-        args=(borders, grid),
-        kwargs={},
-        **shared
-    )
+        split_islands = run_func(
+            save_loc='split_islands.shp',
+            creation_message="Splitting islands into grid",
+            func=split_islands_into_grid,
+            args=(borders, grid),
+            kwargs={},
+            inputs=(borders, grid),
+            **shared
+        )
 
-    island_points = run_func(
-        save_loc='grouped_island_points.shp',
-        creation_message="Grouping points for each island section",
-        func=group_points_onto_islands,
-        args=(all_points, split_islands),
-        kwargs=dict(),
-        **shared
-    )
+        if viewpoint_mode == 'raster':
+            viewpoints = run_func(
+                save_loc='gridded_viewpoints.shp',
+                creation_message="Getting highest cell for each island section",
+                func=get_highest_points_from_raster_zones,
+                args=(dem, split_islands, spatial_reference),
+                kwargs=dict(),
+                inputs=(dem, split_islands),
+                params=dict(viewpoint_mode=viewpoint_mode, window_rows=A.ZONE_WINDOW_ROWS, order=A.VIEWPOINT_ORDER),
+                **shared
+            )
+        else:
+            island_points = run_func(
+                save_loc='grouped_island_points.shp',
+                creation_message="Grouping points for each island section",
+                func=group_points_onto_islands,
+                args=(all_points, split_islands),
+                kwargs=dict(),
+                inputs=(all_points, split_islands),
+                **shared
+            )
 
-    viewpoints = run_func(
-        save_loc='gridded_viewpoints.shp',
-        creation_message="Getting highest point for each island section",
-        func=get_highest_points_from_multipoint_features,
-        args=(island_points, spatial_reference),
-        kwargs=dict(),
-        **shared
-    )
+            viewpoints = run_func(
+                save_loc='gridded_viewpoints.shp',
+                creation_message="Getting highest point for each island section",
+                func=get_highest_points_from_multipoint_arrays,
+                args=(island_points, spatial_reference),
+                kwargs=dict(),
+                inputs=(island_points,),
+                params=dict(viewpoint_mode=viewpoint_mode, order=A.VIEWPOINT_ORDER),
+                **shared
+            )
 
-    run_all_viewsheds(
-        sea_level=sea_level,
-        ws=out_workspace,
-        viewpoints=viewpoints,
-        dem=dem,
-        overwrite_existing=overwrite_existing
-    )
+    viewshed_key = None
+    if cache is not None:
+        viewsheds = join(out_workspace, S.FOLDER_VIEWSHEDS)
+        viewshed_key = cache.key('viewsheds', (viewpoints, dem), dict(
+            sea_level=sea_level,
+            observer_group_size=OBSERVER_GROUP_SIZE,
+            engine=VP.VIEWSHED_ENGINE,
+            refractivity=VP.REFRACTIVITY_COEFFICIENT,
+            observer_offset=VP.OBSERVER_OFFSET_METERS,
+            outer_radius=VP.OUTER_RADIUS_METERS,
+            clip_to_radius=VP.CLIP_TO_RADIUS,
+        ))
+        if not overwrite_existing and exists(viewsheds) and cache.hit('viewsheds', viewshed_key, viewsheds):
+            AddMessage("Using cached viewsheds in {}".format(viewsheds))
+            AddMessage(cache.report())
+            save_profile(out_workspace)
+            return viewpoints
+        # Groups left over from different inputs can't be resumed from
+        overwrite_existing = overwrite_existing or cache.stale('viewsheds', viewshed_key)
+
+    start = time()
+    with profiling.timer('viewsheds'):
+        if workers == 1:
+            store = run_all_viewsheds(
+                sea_level=sea_level,
+                ws=out_workspace,
+                viewpoints=viewpoints,
+                dem=dem,
+                overwrite_existing=overwrite_existing
+            )
+            failed = store.failed()
+        else:
+            results = run_all_viewsheds_parallel(
+                sea_level=sea_level,
+                ws=out_workspace,
+                viewpoints=viewpoints,
+                dem=dem,
+                overwrite_existing=overwrite_existing,
+                workers=workers
+            )
+            store = JobStore(join(out_workspace, S.FOLDER_VIEWSHEDS))
+            failed = store.failed() or [result.number for result in results if isinstance(result, JobFailure)]
+    if failed:
+        # Caching the stage would skip the failed groups on the next run, and later stages would miss them
+        save_profile(out_workspace)
+        raise ValueError('{} viewshed groups failed, re-run them with run_viewsheds --failed-only:\n{}'.format(
+            len(failed), store.report()))
+    if cache is not None:
+        cache.record('viewsheds', viewshed_key, viewsheds, time() - start)
+        AddMessage(cache.report())
+    save_profile(out_workspace)
     return viewpoints
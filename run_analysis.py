@@ -6,7 +6,8 @@ from os.path import join
 
 from arcpy import env, CheckOutExtension, GetParameterAsText, CopyFeatures_management, AddMessage
 
-from macro_viewshed_analysis.procedures import create_sea_level_island_polygons
+from macro_viewshed_analysis.config import AnalysisSettings
+from macro_viewshed_analysis.procedures import create_sea_level_island_labels, create_sea_level_island_polygons
 from macro_viewshed_analysis.procedures import generate_points_from_raster
 from macro_viewshed_analysis.utils import create_dirs
 from macro_viewshed_analysis.workflows import run_full_analysis
@@ -36,10 +37,23 @@ CheckOutExtension("3D")
 AddMessage("Setting up workspace")
 create_dirs(out_workspace)
 
-AddMessage("Generating points from raster (can take a long time!)")
-all_points = generate_points_from_raster(dem, overwrite_existing=overwrite_existing)
+if AnalysisSettings.VIEWPOINT_MODE == 'points':
+    AddMessage("Generating points from raster (can take a long time!)")
+    all_points = generate_points_from_raster(dem, overwrite_existing=overwrite_existing)
+else:
+    all_points = None
 
-for sea_level in range(low_sea_level, high_sea_level + 1, sea_level_steps):
+sea_levels = range(low_sea_level, high_sea_level + 1, sea_level_steps)
+if AnalysisSettings.ISLAND_LABELLING == 'merge_tree':
+    label_folder = join(out_workspace, 'island_labels')
+    create_dirs(label_folder)
+    island_labels = create_sea_level_island_labels(dem, sea_levels, label_folder)
+else:
+    island_labels = {}
+
+sweep = AnalysisSettings.SEA_LEVEL_SWEEP == 'incremental' and save_intermediate
+previous_wd = None
+for sea_level in sea_levels:
     AddMessage("Sea Level {}".format(sea_level))
 
     wd = join(out_workspace, 'sl_{}'.format(sea_level))
@@ -49,7 +63,8 @@ for sea_level in range(low_sea_level, high_sea_level + 1, sea_level_steps):
     kwargs = dict(save_intermediate=save_intermediate, out_workspace=wd, overwrite_existing=overwrite_existing)
 
     AddMessage("Generating Vector of islands at {}m".format(sea_level))
-    islands_poly, existed = create_sea_level_island_polygons(dem, sea_level, overwrite_existing=overwrite_existing)
+    islands_poly, existed = create_sea_level_island_polygons(dem, sea_level, overwrite_existing=overwrite_existing,
+                                                             labels=island_labels.get(sea_level))
 
     if save_intermediate and not existed:
         save_to = join(wd, 'islands.shp')
@@ -62,4 +77,5 @@ for sea_level in range(low_sea_level, high_sea_level + 1, sea_level_steps):
 
     fp = run_full_analysis(sea_level, all_points, islands_poly, region_of_interest, distance_to_shore, grid_width,
                            grid_height,
-                           dem, **kwargs)
+                           dem, sweep=sweep, previous_workspace=previous_wd, **kwargs)
+    previous_wd = wd
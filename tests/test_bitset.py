@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from macro_viewshed_analysis.raster.bitset import bitset_mask, bitset_to_int32, empty_bitset, int32_bit, \
+    int32_to_bitset, pack_bitset, plane_count, set_observer, unpack_bitset
+
+
+def test_plane_count():
+    assert plane_count(0) == 1
+    assert plane_count(8) == 1
+    assert plane_count(9) == 2
+
+
+def test_pack_and_unpack():
+    rng = np.random.RandomState(0)
+    masks = list(rng.rand(19, 5, 6) > 0.5)
+    bits = pack_bitset(masks)
+    assert bits.shape == (3, 5, 6)
+    assert np.array_equal(unpack_bitset(bits, 19), np.array(masks))
+
+
+def test_set_observer_in_a_window():
+    bits = empty_bitset((4, 4), 8)
+    set_observer(bits, 3, np.ones((2, 2), dtype=bool), 1, 2)
+    expected = np.zeros((4, 4), dtype=bool)
+    expected[1:3, 2:4] = True
+    assert np.array_equal(bitset_mask(bits, 3), expected)
+    with pytest.raises(ValueError):
+        set_observer(bits, 8, expected)
+
+
+def test_int32_round_trip_includes_the_sign_bit():
+    masks = [np.zeros((2, 2), dtype=bool) for _ in range(32)]
+    masks[31][0, 0] = True
+    masks[0][1, 1] = True
+    packed = bitset_to_int32(pack_bitset(masks))
+    assert packed[0, 0] == int32_bit(31) == -2 ** 31
+    assert packed[1, 1] == 1
+    assert np.array_equal(unpack_bitset(int32_to_bitset(packed), 32), np.array(masks))
@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from macro_viewshed_analysis.storage.checkpoint import BYTES, CheckpointStore, CheckpointWriter
+
+COLUMNS = [('FID_point', 'int64'), ('area', 'float64'), ('shape', BYTES)]
+
+
+def test_high_water_survives_reopening(tmp_path):
+    folder = str(tmp_path / 'checkpoint')
+    store = CheckpointStore(folder, COLUMNS, 'FID_point')
+    assert store.high_water is None
+    writer = CheckpointWriter(store)
+    for fid in (3, 1, 7):
+        writer.add((fid, fid * 1.5, b'\x00' * fid))
+    writer.flush()
+    writer.add((5, 7.5, b''))
+    writer.flush()
+
+    resumed = CheckpointStore(folder, COLUMNS, 'FID_point')
+    assert resumed.high_water == 7
+    assert len(resumed) == 4
+    assert list(resumed.rows()) == [(3, 4.5, b'\x00' * 3), (1, 1.5, b'\x00'), (7, 10.5, b'\x00' * 7), (5, 7.5, b'')]
+
+
+def test_chunks_the_manifest_never_recorded_are_dropped(tmp_path):
+    folder = str(tmp_path / 'checkpoint')
+    store = CheckpointStore(folder, COLUMNS, 'FID_point')
+    store.append([(1, 1.0, b'a')])
+    orphan = os.path.join(folder, CheckpointStore.CHUNK.format(1))
+    with open(orphan, 'wb') as f:
+        f.write(b'partial')
+
+    resumed = CheckpointStore(folder, COLUMNS, 'FID_point')
+    assert not os.path.exists(orphan)
+    assert resumed.high_water == 1
+    assert list(resumed.rows()) == [(1, 1.0, b'a')]
+
+
+def test_only_new_rows_are_unmaterialized(tmp_path):
+    store = CheckpointStore(str(tmp_path), COLUMNS, 'FID_point')
+    store.append([(1, 1.0, b'a')])
+    store.mark_materialized()
+    store.append([(2, 2.0, b'b')])
+    assert list(CheckpointStore(str(tmp_path), COLUMNS, 'FID_point').unmaterialized_rows()) == [(2, 2.0, b'b')]
+
+
+def test_reopening_with_other_columns_fails(tmp_path):
+    CheckpointStore(str(tmp_path), COLUMNS, 'FID_point')
+    with pytest.raises(ValueError):
+        CheckpointStore(str(tmp_path), COLUMNS[:2], 'FID_point')
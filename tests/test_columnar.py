@@ -0,0 +1,54 @@
+import os
+import pickle
+
+import networkx as nx
+import numpy as np
+
+from macro_viewshed_analysis.graph.columnar import GraphColumns, load_graph, open_graph_columns, read_graph, \
+    write_graph
+
+
+def island_graph():
+    graph = nx.Graph()
+    graph.add_node(1, area=10.0)
+    graph.add_node(2, area=2.5)
+    graph.add_node(3)
+    graph.add_edge(1, 2, area=4.0, a=(0.0, 1.0), b=(2.0, 3.0), north={'traversals': 7})
+    graph.add_edge(2, 3, area=1.0, a=(2.0, 3.0), b=(4.0, 5.0))
+    return graph
+
+
+def test_round_trip(tmp_path):
+    graph = island_graph()
+    folder = write_graph(graph, str(tmp_path / 'islands.graph'))
+    loaded = load_graph(folder)
+    assert sorted(loaded.nodes(data=True)) == sorted(graph.nodes(data=True))
+    assert sorted(map(sorted, loaded.edges())) == sorted(map(sorted, graph.edges()))
+    assert loaded.edges[1, 2] == graph.edges[1, 2]
+    assert loaded.edges[2, 3] == graph.edges[2, 3]
+
+
+def test_columns(tmp_path):
+    columns = GraphColumns(write_graph(island_graph(), str(tmp_path / 'islands.graph')))
+    assert len(columns) == 2
+    assert columns.edges.column('area').tolist() == [4.0, 1.0]
+    assert columns.edges.present('north', 'traversals').tolist() == [True, False]
+    assert columns.edges.children('north') == ['traversals']
+    assert isinstance(columns.a, np.ndarray)
+
+
+def test_gpickle_is_converted_again_when_it_changes(tmp_path):
+    path = str(tmp_path / 'traversal_path.gpickle')
+    graph = island_graph()
+    with open(path, 'wb') as f:
+        pickle.dump(graph, f)
+    assert len(open_graph_columns(path)) == 2
+    assert os.path.isdir(str(tmp_path / 'traversal_path.graph'))
+
+    graph.add_edge(3, 4, area=0.5)
+    with open(path, 'wb') as f:
+        pickle.dump(graph, f)
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+    assert read_graph(path).number_of_edges() == 3
+    assert len(open_graph_columns(path)) == 3
@@ -0,0 +1,25 @@
+import numpy as np
+
+from macro_viewshed_analysis.raster.grid import Grid
+from macro_viewshed_analysis.raster.horizon import build_max_pyramid, cached_max_pyramid
+
+
+def test_pyramid_levels():
+    surface = np.arange(15, dtype=float).reshape(3, 5)
+    levels = build_max_pyramid(surface)
+    assert [level.shape for level in levels] == [(2, 3), (1, 2), (1, 1)]
+    assert levels[0].tolist() == [[6.0, 8.0, 9.0], [11.0, 13.0, 14.0]]
+    assert levels[-1].tolist() == [[14.0]]
+
+
+def test_cached_pyramid_is_rebuilt_for_another_source(tmp_path):
+    surface = Grid(np.arange(16, dtype=float).reshape(4, 4), 0.0, 4.0, 1.0)
+    first = cached_max_pyramid(str(tmp_path), 0.0, surface, source='a')
+    assert np.asarray(first.levels[-1]).tolist() == [[15.0]]
+    surface.data[0, 0] = 100.0
+    # The saved pyramid is read back for the same source, memory mapped
+    same_source = cached_max_pyramid(str(tmp_path), 0.0, surface, source='a')
+    assert isinstance(same_source.levels[0], np.memmap)
+    assert np.asarray(same_source.levels[-1]).tolist() == [[15.0]]
+    new_source = cached_max_pyramid(str(tmp_path), 0.0, surface, source='b')
+    assert np.asarray(new_source.levels[-1]).tolist() == [[100.0]]
@@ -0,0 +1,84 @@
+from collections import namedtuple
+
+from macro_viewshed_analysis.storage import jobs
+from macro_viewshed_analysis.storage.jobs import DONE, FAILED, JobFailure, JobStore, backoff_delay, call_job, \
+    run_jobs
+
+Job = namedtuple('Job', ['number'])
+Result = namedtuple('Result', ['number', 'error'])
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def flaky(failures):
+    calls = {}
+
+    def run(job):
+        calls[job.number] = calls.get(job.number, 0) + 1
+        if calls[job.number] <= failures.get(job.number, 0):
+            raise ValueError('attempt {}'.format(calls[job.number]))
+        return Result(job.number, None)
+
+    return run, calls
+
+
+def test_backoff_doubles():
+    assert [backoff_delay(attempts, 10.0) for attempts in (1, 2, 3)] == [10.0, 20.0, 40.0]
+
+
+def test_call_job_turns_errors_into_failures():
+    run, _ = flaky({1: 1})
+    assert call_job(run, Job(1)) == JobFailure(1, 'ValueError: attempt 1')
+    assert call_job(run, Job(1)) == Result(1, None)
+
+
+def test_retries_with_backoff(tmp_path, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(jobs, 'time', clock.time)
+    monkeypatch.setattr(jobs, 'sleep', clock.sleep)
+    run, calls = flaky({2: 2})
+    store = JobStore(str(tmp_path))
+    results = run_jobs([Job(1), Job(2)], run, store, max_attempts=3, backoff_seconds=5.0)
+
+    assert calls == {1: 1, 2: 3}
+    assert results[2] == Result(2, None)
+    assert store.state(1) == store.state(2) == DONE
+    assert store.jobs[2]['attempts'] == 2  # Failed attempts
+    # Waits of 5 then 10 seconds before the second and third attempts
+    assert clock.sleeps == [5.0, 10.0]
+
+
+def test_failure_queue_after_the_last_attempt(tmp_path, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(jobs, 'time', clock.time)
+    monkeypatch.setattr(jobs, 'sleep', clock.sleep)
+    run, calls = flaky({1: 10})
+    seen = []
+    store = JobStore(str(tmp_path))
+    results = run_jobs([Job(1), Job(2)], run, store, max_attempts=2, backoff_seconds=1.0,
+                       on_result=lambda result, state: seen.append((result.number, state)))
+
+    assert calls[1] == 2
+    assert isinstance(results[1], JobFailure)
+    assert store.failed() == [1]
+    assert JobStore(str(tmp_path)).state(1) == FAILED
+    assert (1, FAILED) in seen and (2, DONE) in seen
+    assert 'viewshed 1 failed after 2 attempts' in store.report()
+
+
+def test_results_with_an_error_are_failures(tmp_path):
+    store = JobStore(str(tmp_path))
+    run_jobs([Job(4)], lambda job: Result(job.number, 'no licence'), store, max_attempts=1)
+    assert store.failed() == [4]
+    assert store.jobs[4]['error'] == 'no licence'
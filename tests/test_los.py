@@ -0,0 +1,74 @@
+import numpy as np
+
+from macro_viewshed_analysis.raster.grid import Grid
+from macro_viewshed_analysis.raster.horizon import MaxPyramid, build_max_pyramid
+from macro_viewshed_analysis.raster.los import observer_visibility, sea_level_surface, viewshed_bitmask, \
+    viewshed_bitset
+from macro_viewshed_analysis.raster.bitset import bitset_mask, int32_to_bitset
+
+
+def rough_surface(rows, cols, seed=0):
+    rng = np.random.RandomState(seed)
+    raw = rng.rand(rows + 8, cols + 8) * 200.0
+    table = np.cumsum(np.cumsum(np.pad(raw, ((1, 0), (1, 0)), mode='constant'), axis=0), axis=1)
+    smooth = (table[8:, 8:] - table[:-8, 8:] - table[8:, :-8] + table[:-8, :-8]) / 64.0
+    return sea_level_surface(smooth[:rows, :cols] - 100.0, 0.0)
+
+
+def test_flat_surface_is_all_visible():
+    surface = np.zeros((21, 21))
+    visible, corner = observer_visibility(surface, 10, 10, 2.0, 100.0, 100.0, max_radius=5000.0, refractivity=1.0)
+    assert corner == (0, 0)
+    assert visible.all()
+
+
+def test_wall_hides_what_is_behind_it():
+    surface = np.zeros((1, 20))
+    surface[0, 5] = 100.0
+    visible, _ = observer_visibility(surface, 0, 0, 2.0, 100.0, 100.0, max_radius=5000.0, refractivity=1.0)
+    assert visible[0, :6].all()
+    assert not visible[0, 6:].any()
+
+
+def test_window_is_clipped_to_the_radius():
+    surface = np.zeros((41, 41))
+    visible, corner = observer_visibility(surface, 20, 20, 2.0, 100.0, 100.0, max_radius=500.0, refractivity=1.0)
+    assert corner == (15, 15)
+    assert visible.shape == (11, 11)
+
+
+def test_sea_level_surface_clamps_below_sea_level():
+    surface = sea_level_surface(np.array([[-5.0, 0.0, 5.0]]), 1.0)
+    assert surface.tolist() == [[1.0, 1.0, 5.0]]
+
+
+def test_pyramid_gives_the_same_viewsheds():
+    surface = Grid(rough_surface(90, 70), 0.0, 9000.0, 100.0)
+    rng = np.random.RandomState(1)
+    observers = [(x, y, None, i) for i, (x, y) in enumerate(zip(rng.uniform(0, 7000, 24), rng.uniform(0, 9000, 24)))]
+    pyramid = MaxPyramid(build_max_pyramid(surface.data), surface.shape)
+    plain = viewshed_bitmask(surface, observers, observer_offset=2.0, max_radius=6000.0)
+    with_horizon = viewshed_bitmask(surface, observers, observer_offset=2.0, max_radius=6000.0, horizon=pyramid)
+    assert plain.any()
+    assert np.array_equal(plain, with_horizon)
+
+
+def test_pyramid_window_gives_the_same_viewsheds():
+    surface = Grid(rough_surface(60, 60, seed=2), 0.0, 6000.0, 100.0)
+    pyramid = MaxPyramid(build_max_pyramid(surface.data), surface.shape)
+    window = (10, 50, 5, 45)
+    part = surface.window(*window)
+    observers = [(2000.0, 3000.0, None, 0), (3500.0, 1500.0, None, 9)]
+    plain = viewshed_bitset(part, observers, observer_offset=2.0, max_radius=3000.0)
+    with_horizon = viewshed_bitset(part, observers, observer_offset=2.0, max_radius=3000.0,
+                                   horizon=pyramid.window(*window))
+    assert np.array_equal(plain, with_horizon)
+
+
+def test_bitmask_and_bitset_agree():
+    surface = Grid(rough_surface(40, 40, seed=3), 0.0, 4000.0, 100.0)
+    observers = [(500.0 + 100.0 * i, 2000.0, None, i) for i in range(32)]
+    bits = viewshed_bitset(surface, observers, observer_offset=2.0, max_radius=2000.0)
+    packed = int32_to_bitset(viewshed_bitmask(surface, observers, observer_offset=2.0, max_radius=2000.0))
+    for observer in (0, 7, 31):
+        assert np.array_equal(bitset_mask(bits, observer), bitset_mask(packed, observer))
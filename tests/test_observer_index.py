@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from macro_viewshed_analysis.storage.observer_index import RUN_BYTES, ObserverIndex
+
+HEADER = dict(x_min=0.0, y_max=10.0, cell_width=1.0, cell_height=1.0, shape=[10, 10])
+
+
+def runs(*rows):
+    return np.array(rows, dtype=np.int32).reshape(-1, 3)
+
+
+def test_add_and_look_up(tmp_path):
+    index = ObserverIndex(str(tmp_path))
+    index.add_viewshed(1, [(0, 0, 5, 50, 500), (1, 1, 5, 51, 500), (2, 2, 6, 60, 600)],
+                       {0: runs((0, 1, 3), (2, 0, 4)), 2: runs((9, 9, 10))}, HEADER)
+    assert index.header == HEADER
+    assert index.viewsheds() == {1}
+
+    location = index.locate(0)
+    assert (location.viewshed, location.bit, location.island, location.split, location.grid) == (1, 0, 5, 50, 500)
+    assert (location.row_min, location.row_max, location.col_min, location.col_max) == (0, 2, 0, 4)
+    assert index.runs(location).tolist() == [[0, 1, 3], [2, 0, 4]]
+    assert index.locate(1).count == 0
+    assert index.runs(2).tolist() == [[9, 9, 10]]
+    assert index.island_observers(5) == [0, 1]
+    assert [location.viewpoint_id for location in index.locations(1)] == [1, 2]
+    with pytest.raises(KeyError):
+        index.locate(3)
+    index.close()
+
+
+def test_indexing_a_viewshed_again_replaces_it(tmp_path):
+    index = ObserverIndex(str(tmp_path))
+    index.add_viewshed(1, [(0, 0, 5, 50, 500), (1, 1, 5, 51, 500)], {0: runs((0, 0, 1)), 1: runs((1, 0, 1))}, HEADER)
+    index.add_viewshed(1, [(0, 0, 7, 70, 700)], {0: runs((4, 4, 6))}, HEADER)
+    assert [location.viewpoint_id for location in index.locations()] == [0]
+    assert index.runs(0).tolist() == [[4, 4, 6]]
+    assert index.locate(0).island == 7
+    index.close()
+
+
+def test_runs_without_rows_are_truncated_on_reopening(tmp_path):
+    index = ObserverIndex(str(tmp_path))
+    index.add_viewshed(1, [(0, 0, 5, 50, 500)], {0: runs((0, 0, 1))}, HEADER)
+    index.close()
+    with open(index.runs_file, 'ab') as f:
+        f.write(b'\0' * RUN_BYTES * 3)
+
+    reopened = ObserverIndex(str(tmp_path))
+    with open(reopened.runs_file, 'rb') as f:
+        assert len(f.read()) == RUN_BYTES
+    assert reopened.runs(0).tolist() == [[0, 0, 1]]
+    reopened.close()
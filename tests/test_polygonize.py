@@ -0,0 +1,54 @@
+import numpy as np
+
+from macro_viewshed_analysis.raster.bitmask import mask_runs
+from macro_viewshed_analysis.raster.polygonize import mask_rings, ring_area, rings_to_map, runs_rings
+
+
+def corners(ring):
+    return [tuple(v) for v in ring[:-1].tolist()]
+
+
+def test_single_cell():
+    (ring,) = mask_rings([[True]])
+    assert ring[0].tolist() == ring[-1].tolist()
+    assert sorted(corners(ring)) == [(0, 0), (0, 1), (1, 0), (1, 1)]
+
+
+def test_outer_ring_and_hole():
+    mask = np.ones((3, 3), dtype=bool)
+    mask[1, 1] = False
+    rings = mask_rings(mask)
+    assert len(rings) == 2
+    areas = sorted(ring_area(ring) for ring in rings_to_map(rings, dict(x_min=0, y_max=3, cell_width=1,
+                                                                          cell_height=1)))
+    # Clockwise outer ring, anticlockwise hole
+    assert areas == [-9.0, 1.0]
+
+
+def test_cells_touching_at_a_corner_are_separate_rings():
+    rings = mask_rings([[True, False], [False, True]])
+    assert len(rings) == 2
+    for ring in rings:
+        assert len(set(corners(ring))) == 4
+
+
+def test_area_matches_the_mask():
+    rng = np.random.RandomState(0)
+    header = dict(x_min=0.0, y_max=0.0, cell_width=1.0, cell_height=1.0)
+    for _ in range(200):
+        mask = rng.rand(rng.randint(1, 10), rng.randint(1, 10)) < 0.5
+        rings = mask_rings(mask)
+        for ring in rings:
+            assert len(set(corners(ring))) == len(ring) - 1
+        assert abs(-sum(ring_area(ring) for ring in rings_to_map(rings, header)) - mask.sum()) < 1e-9
+
+
+def test_runs_rings_are_placed_on_the_map():
+    mask = np.zeros((5, 5), dtype=bool)
+    mask[2, 3] = True
+    header = dict(x_min=100.0, y_max=50.0, cell_width=10.0, cell_height=5.0)
+    (ring,) = runs_rings(mask_runs(mask), header)
+    xs, ys = sorted(set(ring[:, 0].tolist())), sorted(set(ring[:, 1].tolist()))
+    assert xs == [130.0, 140.0]
+    assert ys == [35.0, 40.0]
+    assert runs_rings(np.empty((0, 3), dtype=np.int32), header) == []
@@ -0,0 +1,83 @@
+import struct
+
+import numpy as np
+
+from macro_viewshed_analysis.storage.shapefile import FILE_CODE, HEADER_BYTES, SHAPE_POLYLINE, VERSION, \
+    WKB_LINESTRING, ShapefilePolylineWriter, line_wkb
+
+ENDS = np.array([[0.0, 0.0, 1.0, 2.0], [-3.0, 5.0, 4.0, -1.0], [10.0, 10.0, 11.0, 12.0]])
+RECORD_BYTES = 8 + 4 + 32 + 4 + 4 + 4 + 32
+
+
+def write(path):
+    with ShapefilePolylineWriter(path, [('island_a', 'LONG'), ('distance_meters', 'DOUBLE')], prj='PROJCS[]') as w:
+        w.write(ENDS[:2], [np.array([1, 22]), np.array([0.5, 1234.5])])
+        w.write(ENDS[2:], [np.array([-3]), np.array([2.0])])
+
+
+def test_shp_and_shx_layout(tmp_path):
+    path = str(tmp_path / 'edges.shp')
+    write(path)
+    with open(path, 'rb') as f:
+        shp = f.read()
+    with open(str(tmp_path / 'edges.shx'), 'rb') as f:
+        shx = f.read()
+
+    assert len(shp) == HEADER_BYTES + 3 * RECORD_BYTES
+    code, file_words = struct.unpack('>i20xi', shp[:28])
+    version, shape_type = struct.unpack('<2i', shp[28:36])
+    box = struct.unpack('<4d', shp[36:68])
+    assert (code, file_words * 2, version, shape_type) == (FILE_CODE, len(shp), VERSION, SHAPE_POLYLINE)
+    assert box == (-3.0, -1.0, 11.0, 12.0)
+
+    for i, ends in enumerate(ENDS):
+        start = HEADER_BYTES + i * RECORD_BYTES
+        number, content_words = struct.unpack('>2i', shp[start:start + 8])
+        shape_type = struct.unpack('<i', shp[start + 8:start + 12])[0]
+        record_box = struct.unpack('<4d', shp[start + 12:start + 44])
+        parts, points, part = struct.unpack('<3i', shp[start + 44:start + 56])
+        xy = struct.unpack('<4d', shp[start + 56:start + 88])
+        assert (number, content_words * 2, shape_type) == (i + 1, RECORD_BYTES - 8, SHAPE_POLYLINE)
+        assert record_box == (min(ends[0], ends[2]), min(ends[1], ends[3]), max(ends[0], ends[2]),
+                              max(ends[1], ends[3]))
+        assert (parts, points, part) == (1, 2, 0)
+        assert xy == tuple(ends)
+
+        offset, length = struct.unpack('>2i', shx[HEADER_BYTES + 8 * i:HEADER_BYTES + 8 * i + 8])
+        assert (offset * 2, length * 2) == (start, RECORD_BYTES - 8)
+    assert struct.unpack('>i', shx[24:28])[0] * 2 == len(shx) == HEADER_BYTES + 3 * 8
+
+
+def test_dbf_layout(tmp_path):
+    path = str(tmp_path / 'edges.shp')
+    write(path)
+    with open(str(tmp_path / 'edges.dbf'), 'rb') as f:
+        dbf = f.read()
+
+    count, header_bytes, record_bytes = struct.unpack('<IHH', dbf[4:12])
+    assert struct.unpack('<B', dbf[:1]) == (3,)
+    assert (count, header_bytes, record_bytes) == (3, 32 + 2 * 32 + 1, 1 + 10 + 19)
+    fields = [struct.unpack('<11sc4xBB14x', dbf[32 + 32 * i:64 + 32 * i]) for i in range(2)]
+    assert fields == [(b'island_a'.ljust(11, b'\0'), b'N', 10, 0), (b'distance_m'.ljust(11, b'\0'), b'N', 19, 11)]
+    assert dbf[header_bytes - 1:header_bytes] == b'\r'
+    assert len(dbf) == header_bytes + 3 * record_bytes + 1
+    assert dbf[-1:] == b'\x1a'
+
+    records = [dbf[header_bytes + i * record_bytes:header_bytes + (i + 1) * record_bytes] for i in range(3)]
+    assert [r[:1] for r in records] == [b' '] * 3
+    assert [int(r[1:11]) for r in records] == [1, 22, -3]
+    assert [float(r[11:]) for r in records] == [0.5, 1234.5, 2.0]
+    assert records[1][1:11] == b'        22'
+
+
+def test_prj_is_written(tmp_path):
+    write(str(tmp_path / 'edges.shp'))
+    with open(str(tmp_path / 'edges.prj')) as f:
+        assert f.read() == 'PROJCS[]'
+
+
+def test_line_wkb():
+    (wkb,) = line_wkb([[1.0, 2.0, 3.0, 4.0]])
+    order, geometry_type, points = struct.unpack('<BII', wkb[:9])
+    assert (order, geometry_type, points) == (1, WKB_LINESTRING, 2)
+    assert struct.unpack('<4d', wkb[9:]) == (1.0, 2.0, 3.0, 4.0)
@@ -0,0 +1,34 @@
+import numpy as np
+
+from macro_viewshed_analysis.raster.zonal import ZoneMaxima, grid_windows, highest_per_zone, zonal_highest_cells
+
+
+def test_ties_go_to_the_first_cell():
+    z = np.array([1.0, 5.0, 5.0, 2.0, 2.0])
+    zone = np.array([0, 0, 0, 1, 1])
+    assert highest_per_zone(z, zone).tolist() == [1, 3]
+
+
+def test_chunks_give_the_same_maxima():
+    rng = np.random.RandomState(0)
+    z = rng.randint(0, 20, 500).astype(float)
+    zone = rng.randint(0, 30, 500)
+    whole = ZoneMaxima(('index',))
+    whole.add(z, zone, index=np.arange(500))
+    chunked = ZoneMaxima(('index',))
+    for start in range(0, 500, 37):
+        chunked.add(z[start:start + 37], zone[start:start + 37], index=np.arange(start, min(start + 37, 500)))
+    assert whole['zone'].tolist() == chunked['zone'].tolist()
+    assert whole['index'].tolist() == chunked['index'].tolist()
+
+
+def test_zonal_highest_cells_over_windows():
+    dem = np.arange(20, dtype=float).reshape(4, 5)
+    dem[3, 4] = np.nan
+    zones = np.full((4, 5), -1)
+    zones[:2, :2] = 0
+    zones[2:, 3:] = 1
+    maxima = zonal_highest_cells(grid_windows(dem, zones, window_rows=1))
+    assert maxima['zone'].tolist() == [0, 1]
+    assert maxima['z'].tolist() == [6.0, 18.0]
+    assert list(zip(maxima['row'].tolist(), maxima['col'].tolist())) == [(1, 1), (3, 3)]